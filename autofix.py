@@ -0,0 +1,325 @@
+"""
+╔═══════════════════════════════════════════╗
+║  autofix.py — Startup Remediation         ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Before the first launch, scans the bot's sources for imports and installs
+every missing third-party module in one batch. When a launch still
+crashes, the output is matched against RULES (registered with @rule, in
+order) and the first fix that applies triggers one retry. Every rule's
+matches, fixes and outcomes are counted in autofix_stats.
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import subprocess
+
+from config import MODULES_MAP, BOT_VENVS, logger
+from database import db
+from utils import safe_send
+import deps
+
+SKIP_DIRS = {'node_modules', '.git', '__pycache__', 'venv', '.venv', 'env', 'site-packages'}
+MAX_FILES = 300
+MAX_BYTES = 512 * 1024  # per source file
+STDLIB = set(getattr(sys, 'stdlib_module_names', ())) | set(sys.builtin_module_names) | {'__future__'}
+NODE_BUILTINS = {
+    'assert', 'async_hooks', 'buffer', 'child_process', 'cluster', 'console', 'crypto', 'dgram',
+    'dns', 'events', 'fs', 'http', 'http2', 'https', 'inspector', 'module', 'net', 'os', 'path',
+    'perf_hooks', 'process', 'punycode', 'querystring', 'readline', 'stream', 'string_decoder',
+    'timers', 'tls', 'tty', 'url', 'util', 'v8', 'vm', 'worker_threads', 'zlib',
+}
+_JS_IMPORT = re.compile(r"""(?:require\s*\(\s*|import\s*\(\s*|from\s+|^\s*import\s+)['"]([^'"]+)['"]""", re.M)
+_PY_IMPORT = re.compile(r'^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w., ]+))', re.M)
+
+
+# ═══════════════════════════════════════════
+#  IMPORT SCAN
+# ═══════════════════════════════════════════
+def _sources(wd, exts):
+    n = 0
+    for root, dirs, files in os.walk(wd):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.')]
+        for fn in files:
+            if fn.endswith(exts):
+                p = os.path.join(root, fn)
+                try:
+                    if os.path.getsize(p) > MAX_BYTES:
+                        continue
+                    with open(p, 'r', encoding='utf-8', errors='ignore') as f:
+                        yield p, f.read()
+                except OSError:
+                    continue
+                n += 1
+                if n >= MAX_FILES:
+                    return
+
+
+def _optional(tree):
+    """Import nodes inside `try: ... except ImportError` — fallbacks, not requirements"""
+    out = set()
+    for t in ast.walk(tree):
+        if not isinstance(t, ast.Try):
+            continue
+        names = set()
+        for h in t.handlers:
+            if h.type is None:
+                names.add('ImportError')
+                continue
+            for e in h.type.elts if isinstance(h.type, ast.Tuple) else [h.type]:
+                names.add(getattr(e, 'id', getattr(e, 'attr', '')))
+        if names & {'ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException'}:
+            for stmt in t.body:
+                out.update(id(x) for x in ast.walk(stmt))
+    return out
+
+
+def _py_imports(src):
+    try:
+        tree = ast.parse(src)
+    except (SyntaxError, ValueError):
+        mods = set()
+        for a, b in _PY_IMPORT.findall(src):
+            mods.update(x.split()[0] for x in (a or b).split(',') if x.strip())
+        return {m.split('.')[0] for m in mods}
+    skip = _optional(tree)
+    mods = set()
+    for t in ast.walk(tree):
+        if id(t) in skip:
+            continue
+        if isinstance(t, ast.Import):
+            mods.update(a.name.split('.')[0] for a in t.names)
+        elif isinstance(t, ast.ImportFrom) and not t.level and t.module:
+            mods.add(t.module.split('.')[0])
+    return mods
+
+
+def _js_imports(src):
+    mods = set()
+    for spec in _JS_IMPORT.findall(src):
+        if spec.startswith(('.', '/', 'node:')):
+            continue
+        parts = spec.split('/')
+        name = '/'.join(parts[:2]) if spec.startswith('@') else parts[0]
+        if name not in NODE_BUILTINS:
+            mods.add(name)
+    return mods
+
+
+def _one(p):
+    try:
+        with open(p, 'r', encoding='utf-8', errors='ignore') as f:
+            yield p, f.read(MAX_BYTES)
+    except OSError:
+        pass
+
+
+def scan_imports(wd, ft='py', entry=None):
+    """Third-party top-level modules the sources import (local modules excluded)
+
+    entry: scan just that file — single-file bots share the user folder
+    """
+    if ft == 'js':
+        mods = set()
+        for _, src in _one(entry) if entry else _sources(wd, ('.js', '.mjs', '.cjs')):
+            mods |= _js_imports(src)
+        return sorted(mods)
+    mods, local = set(), set()
+    for p, src in _one(entry) if entry else _sources(wd, ('.py',)):
+        mods |= _py_imports(src)
+        local.add(os.path.splitext(os.path.basename(p))[0])
+        local.add(os.path.basename(os.path.dirname(p)))
+    if entry:
+        local.update(os.path.splitext(f)[0] for f in os.listdir(wd))
+    return sorted(m for m in mods - local - STDLIB if m.isidentifier())
+
+
+def bot_entry(bd, wd):
+    """The file to scan for a single-file bot, None for a project folder"""
+    return None if os.path.isdir(bd['file_path']) else os.path.join(wd, bd['entry_file'])
+
+
+def package_for(mod):
+    top = mod.split('.')[0]
+    return MODULES_MAP.get(top) or MODULES_MAP.get(top.lower()) or top
+
+
+def _missing_py(py, wd, mods):
+    """Modules the target interpreter can't find, checked in one subprocess"""
+    code = ("import sys, importlib.util as u\n"
+            "for m in sys.argv[1:]:\n"
+            "    try:\n        s = u.find_spec(m)\n    except Exception:\n        s = None\n"
+            "    if s is None:\n        print(m)\n")
+    try:
+        r = subprocess.run([py, '-c', code] + list(mods), cwd=wd, capture_output=True, text=True, timeout=30)
+        return r.stdout.split()
+    except Exception:
+        return list(mods)
+
+
+def _missing_js(wd, mods):
+    try:
+        with open(os.path.join(wd, 'package.json'), encoding='utf-8') as f:
+            pj = json.load(f)
+        declared = set(pj.get('dependencies') or {}) | set(pj.get('devDependencies') or {})
+    except (OSError, ValueError):
+        declared = set()
+    return [m for m in mods if m not in declared and not os.path.isdir(os.path.join(wd, 'node_modules', m))]
+
+
+# ═══════════════════════════════════════════
+#  INSTALL (one batch per bot)
+# ═══════════════════════════════════════════
+def install_py(bd, wd, pkgs, cid=None):
+    """Into the bot's venv via its own requirements, else the panel env -> ok"""
+    if cid:
+        safe_send(cid, f"📦 Installing {', '.join(pkgs)}...")
+    if not BOT_VENVS:
+        return deps.install_packages(pkgs) or all([deps.install_packages([p]) for p in pkgs])
+    if not deps.py_manifest(bd, wd)[1]:
+        # first requirement moves the bot off the panel interpreter: its venv
+        # also needs whatever it was importing from the panel's packages
+        pkgs = sorted(set(pkgs) | {package_for(m) for m in scan_imports(wd, 'py', bot_entry(bd, wd))})
+    req = deps.own_req(bd, wd)
+    try:
+        with open(req, encoding='utf-8') as f:
+            before = f.read()
+    except OSError:
+        before = None
+    if deps.add_requirement(bd, wd, *pkgs) and deps.ensure(bd, wd, 'py') != 'failed':
+        return True
+    # One unresolvable guess must not sink the batch: keep only mapped names
+    known = [p for p in pkgs if p in MODULES_MAP.values()]
+    try:
+        if before is None:
+            os.remove(req)
+        else:
+            with open(req, 'w', encoding='utf-8') as f:
+                f.write(before)
+    except OSError:
+        pass
+    if known and known != list(pkgs) and deps.add_requirement(bd, wd, *known):
+        if deps.ensure(bd, wd, 'py') != 'failed':
+            return True
+    deps.ensure(bd, wd, 'py')  # back to the venv it had
+    return False
+
+
+def prescan(bd, wd, ft, cid=None):
+    """Install everything the sources import but the environment lacks -> [pkgs] or None"""
+    mods = scan_imports(wd, ft, bot_entry(bd, wd))
+    if not mods:
+        return None
+    if ft == 'js':
+        pkgs = _missing_js(wd, mods)
+        if not pkgs:
+            return None
+        if cid:
+            safe_send(cid, f"📦 npm install {' '.join(pkgs)}...")
+        ok = deps.npm_add(wd, pkgs)
+    else:
+        missing = _missing_py(deps.python_for(bd, wd), wd, mods)
+        pkgs = sorted({package_for(m) for m in missing})
+        if not pkgs:
+            return None
+        ok = install_py(bd, wd, pkgs, cid)
+    db.note_fix('prescan', 'matched')
+    if ok:
+        db.note_fix('prescan', 'fixed')
+    logger.info(f"🩹 Prescan #{bd['bot_id']}: {'installed' if ok else 'failed'} {pkgs}")
+    return pkgs if ok else None
+
+
+# ═══════════════════════════════════════════
+#  UPLOAD ANALYSIS
+# ═══════════════════════════════════════════
+# import name -> framework label, most specific first
+FRAMEWORKS = [
+    ('aiogram', 'aiogram'), ('telebot', 'pyTelegramBotAPI'), ('telegram', 'python-telegram-bot'),
+    ('pyrogram', 'Pyrogram'), ('telethon', 'Telethon'), ('discord', 'discord.py'),
+    ('telegraf', 'Telegraf'), ('grammy', 'grammY'), ('node-telegram-bot-api', 'node-telegram-bot-api'),
+    ('discord.js', 'discord.js'), ('fastapi', 'FastAPI'), ('flask', 'Flask'), ('django', 'Django'),
+    ('express', 'Express'),
+]
+
+
+def analyze(wd, ft, entry=None):
+    """Upload-time scan -> (packages, framework)"""
+    mods = scan_imports(wd, ft, entry)
+    fw = next((label for mod, label in FRAMEWORKS if mod in mods), '')
+    pkgs = sorted({package_for(m) for m in mods}) if ft == 'py' else mods
+    return pkgs, fw
+
+
+# ═══════════════════════════════════════════
+#  ERROR → FIX RULES
+# ═══════════════════════════════════════════
+RULES = []
+
+
+def rule(name, pattern=None, ft=None, first_only=False):
+    """Register fn(match, ctx) -> bool; ctx has bd, bid, wd, ft, ef, att, cid"""
+    def deco(fn):
+        RULES.append({'name': name, 're': re.compile(pattern, re.M) if pattern else None,
+                      'ft': ft, 'first_only': first_only, 'fn': fn})
+        return fn
+    return deco
+
+
+@rule('py_missing_module', r"ModuleNotFoundError: No module named '([^']+)'", ft='py')
+def _fix_py_module(m, ctx):
+    return install_py(ctx['bd'], ctx['wd'], [package_for(m.group(1))], ctx['cid'])
+
+
+@rule('py_dist_not_found', r"DistributionNotFound: The '([\w.\-]+)[^']*' distribution was not found", ft='py')
+def _fix_py_dist(m, ctx):
+    return install_py(ctx['bd'], ctx['wd'], [m.group(1)], ctx['cid'])
+
+
+@rule('js_missing_module', r"Cannot find module '([^'./][^']*)'", ft='js')
+def _fix_js_module(m, ctx):
+    name = _js_imports(f"require('{m.group(1)}')")
+    return bool(name) and deps.npm_add(ctx['wd'], sorted(name))
+
+
+@rule('alt_entry', first_only=True)
+def _fix_alt_entry(m, ctx):
+    """Crashed on the first try: switch to a conventional entry file if there is one"""
+    for alt in ['app.py', 'main.py', 'bot.py', 'run.py', 'index.js', 'app.js']:
+        if os.path.exists(os.path.join(ctx['wd'], alt)) and alt != ctx['ef']:
+            db.update_bot(ctx['bid'], entry_file=alt, file_type='js' if alt.endswith('.js') else 'py')
+            return True
+    return False
+
+
+def remedy(err, ctx):
+    """Apply the first rule that matches err and fixes it -> rule name or None"""
+    for r in RULES:
+        if r['ft'] and r['ft'] != ctx['ft']:
+            continue
+        if r['first_only'] and ctx['att'] != 1:
+            continue
+        m = r['re'].search(err) if r['re'] else True
+        if not m:
+            continue
+        db.note_fix(r['name'], 'matched')
+        try:
+            ok = r['fn'](m, ctx)
+        except Exception as e:
+            logger.error(f"Autofix {r['name']} failed: {e}")
+            ok = False
+        if ok:
+            db.note_fix(r['name'], 'fixed')
+            logger.info(f"🩹 #{ctx['bid']}: {r['name']} applied")
+            return r['name']
+    return None
+
+
+def outcome(name, ok):
+    """The retry after a fix came up (ok) or crashed again"""
+    if name:
+        db.note_fix(name, 'succeeded' if ok else 'failed')
@@ -0,0 +1,372 @@
+"""
+╔═══════════════════════════════════════════╗
+║  bench.py — Micro-Benchmarks              ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Usage:  python bench.py [db|rw|rwflush|indexes|limits|venv]
+Runs against a throw-away database in a temp dir, never the live one.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import random
+import threading
+import subprocess
+
+import config
+# before anything imports database: its module-level db opens (and migrates) DB_PATH
+config.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='apon_bench_'), 'apon.db')
+
+from database import DB, INDEXES, HOT_QUERIES, TTLCache, TimedLock
+from config import PLAN_LIMITS
+import limits
+import deps
+
+
+# ═══════════════════════════════════════════
+#  HELPERS
+# ═══════════════════════════════════════════
+def _rate(fn, n):
+    t = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return n / (time.perf_counter() - t)
+
+
+def _report(title, rows):
+    print(f"\n{title}")
+    print(f"  {'query':<14}{'before q/s':>14}{'after q/s':>14}{'speedup':>10}")
+    for name, before, after in rows:
+        print(f"  {name:<14}{before:>14,.0f}{after:>14,.0f}{after / before:>9.1f}x")
+
+
+def _nocache(inst):
+    """Every get_user goes to SQLite, so the pool is what's measured"""
+    inst._user_cache = TTLCache(ttl=0)
+    return inst
+
+
+class LegacyDB(DB):
+    """Connect-per-call exe() under one global lock, as before the pool"""
+    _lock = threading.Lock()
+
+    def exe(self, q, p=(), fetch=False, one=False):
+        with self._lock:
+            c = self._connect()
+            try:
+                cur = c.execute(q, p)
+                if fetch:
+                    return [dict(x) for x in cur.fetchall()]
+                if one:
+                    x = cur.fetchone()
+                    return dict(x) if x else None
+                c.commit()
+                return cur.lastrowid
+            except Exception:
+                return None
+            finally:
+                c.close()
+
+
+# ═══════════════════════════════════════════
+#  DB: CONNECTION POOL
+# ═══════════════════════════════════════════
+def bench_db(n=3000):
+    d = tempfile.mkdtemp(prefix='apon_bench_')
+    path = os.path.join(d, 'bench.db')
+    new = DB(path)
+    for uid in range(1, 101):
+        new.create_user(uid, f"u{uid}", f"User {uid}", f"RC{uid:05d}")
+        new.add_bot(uid, f"bot{uid}", d)
+    old = _nocache(LegacyDB(path))
+    _nocache(new)
+
+    cases = [
+        ('get_user', lambda db: lambda i: db.get_user(i % 100 + 1)),
+        ('get_bots', lambda db: lambda i: db.get_bots(i % 100 + 1)),
+        ('update_bot', lambda db: lambda i: db.update_bot(i % 100 + 1, pid=i)),
+    ]
+    rows = []
+    for name, mk in cases:
+        rows.append((name, _rate(mk(old), n), _rate(mk(new), n)))
+    _report(f"DB connection pool ({n} calls, sqlite {sqlite3.sqlite_version})", rows)
+    new.close_all()
+
+
+# ═══════════════════════════════════════════
+#  DB: READERS vs WRITER
+# ═══════════════════════════════════════════
+def bench_rw(readers=4, seconds=2.0, batch=0):
+    """batch=0: single-row writes; batch=N: the writer flushes N queued rows per transaction"""
+    d = tempfile.mkdtemp(prefix='apon_bench_')
+    path = os.path.join(d, 'bench.db')
+    db = _nocache(DB(path))
+    for uid in range(1, 1001):
+        db.create_user(uid, f"u{uid}", f"User {uid}", f"RC{uid:05d}")
+        db.add_bot(uid, f"bot{uid}", d)
+
+    class GlobalLockDB(DB):
+        """Pooled connections, but every query (and flush) behind one lock"""
+        _wlock = TimedLock()
+
+        def exe(self, q, p=(), fetch=False, one=False):
+            with self._wlock:
+                return self._exe(q, p, fetch, one)
+
+    def run(inst):
+        stop = time.perf_counter() + seconds
+        counts = [0] * (readers + 1)
+        waits = [[] for _ in range(readers)]
+
+        def reader(k):
+            while time.perf_counter() < stop:
+                t = time.perf_counter()
+                inst.get_user(counts[k] % 1000 + 1)
+                inst.get_bots(counts[k] % 1000 + 1)
+                waits[k].append(time.perf_counter() - t)
+                counts[k] += 2
+
+        def writer():
+            while time.perf_counter() < stop:
+                if batch:
+                    for i in range(batch):
+                        inst.update_bot_later((counts[-1] + i) % 1000 + 1, pid=counts[-1] + i)
+                    counts[-1] += inst.flush()
+                else:
+                    inst.update_bot(counts[-1] % 1000 + 1, pid=counts[-1])
+                    counts[-1] += 1
+
+        ts = [threading.Thread(target=reader, args=(k,)) for k in range(readers)]
+        ts.append(threading.Thread(target=writer))
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        lat = sorted(w for ws in waits for w in ws)
+        return sum(counts[:-1]) / seconds, counts[-1] / seconds, lat[int(len(lat) * 0.99)] * 1000
+
+    old_r, old_w, old_p = run(_nocache(GlobalLockDB(path)))
+    new_r, new_w, new_p = run(db)
+    what = f"{batch}-row flushes" if batch else "single-row writes"
+    _report(f"DB {readers} readers + 1 writer, {what} ({seconds}s)",
+            [('reads', old_r, new_r), ('writes', old_w, new_w)])
+    print(f"  read p99: {old_p:.2f}ms before, {new_p:.2f}ms after")
+    print(f"  writer lock: {db.lock_stats()}")
+
+
+def bench_rw_flush():
+    """Readers against the real write-behind flush (long write transactions)"""
+    bench_rw(batch=DB.FLUSH_ROWS)
+
+
+# ═══════════════════════════════════════════
+#  DB: INDEXES (100k users, 1M wallet_tx)
+# ═══════════════════════════════════════════
+def bench_indexes(users=100_000, txs=1_000_000, n=200):
+    d = tempfile.mkdtemp(prefix='apon_bench_')
+    db = DB(os.path.join(d, 'bench.db'))
+    c = db._conn()
+    rnd = random.Random(42)
+    t = time.perf_counter()
+    c.executemany(
+        "INSERT INTO users(user_id,full_name,plan,subscription_end,referral_code,referral_count) "
+        "VALUES(?,?,?,?,?,?)",
+        ((u, f"User {u}", rnd.choice(['free', 'free', 'basic', 'pro']),
+          f"2026-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T00:00:00",
+          f"RC{u:08d}", rnd.randint(0, 50)) for u in range(1, users + 1)))
+    c.executemany("INSERT INTO wallet_tx(user_id,amount,tx_type,created_at) VALUES(?,?,?,?)",
+                  ((rnd.randint(1, users), 10, 'credit',
+                    f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d} 00:{i % 60:02d}:00") for i in range(txs)))
+    c.executemany("INSERT INTO bots(user_id,bot_name,file_path) VALUES(?,?,?)",
+                  ((rnd.randint(1, users), f"b{i}", d) for i in range(users // 2)))
+    c.executemany("INSERT INTO notifications(user_id,message,is_read) VALUES(?,?,?)",
+                  ((rnd.randint(1, users), 'hi', rnd.randint(0, 1)) for _ in range(users)))
+    c.executemany("INSERT INTO referrals(referrer_id,referred_id) VALUES(?,?)",
+                  ((rnd.randint(1, users), i) for i in range(users // 2)))
+    c.executemany(
+        "INSERT INTO payments(user_id,amount,method,transaction_id,plan,status) VALUES(?,?,?,?,?,?)",
+        ((rnd.randint(1, users), 99, 'bkash', f"T{i}", 'basic',
+          'pending' if i % 50 == 0 else 'approved') for i in range(users // 5)))
+    c.commit()
+    print(f"\nSeeded {users:,} users / {txs:,} wallet_tx in {time.perf_counter() - t:.1f}s")
+
+    def args(name, p):
+        uid = rnd.randint(1, users)
+        if name == 'ref_code_lookup':
+            return (f"RC{uid:08d}",)
+        if name == 'expiry_scan':
+            return ('2026-01-15T00:00:00',)
+        return tuple(uid if x == 0 else x for x in p)
+
+    def run(reps):
+        out = {}
+        for name, (q, p) in HOT_QUERIES.items():
+            t = time.perf_counter()
+            for _ in range(reps):
+                c.execute(q, args(name, p)).fetchall()
+            out[name] = reps / (time.perf_counter() - t)
+        return out
+
+    for name, _, _ in INDEXES:
+        c.execute(f"DROP INDEX IF EXISTS {name}")
+    c.commit()
+    before = run(max(n // 20, 5))
+    t = time.perf_counter()
+    for name, table, cols in INDEXES:
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({cols})")
+    c.execute("ANALYZE")
+    c.commit()
+    print(f"Built {len(INDEXES)} indexes in {time.perf_counter() - t:.1f}s")
+    after = run(n)
+    _report("Hot queries before/after indexes", [(k[:14], before[k], after[k]) for k in HOT_QUERIES])
+    flagged = [nm for nm, _, bad in db.explain() if bad]
+    print(f"  /explain flags: {', '.join(flagged) or 'none'}")
+    db.close_all()
+
+
+# ═══════════════════════════════════════════
+#  LIMITS: MEMORY HOG UNDER THE FREE PLAN
+# ═══════════════════════════════════════════
+HOG = """
+import sys, time
+step, pause = int(sys.argv[1]), float(sys.argv[2])
+buf = []
+for i in range(1000):
+    buf.append(b'\\x01' * (step << 20))  # filled, so it is resident, not just reserved
+    print(f"{(i + 1) * step}MB", flush=True)
+    time.sleep(pause)
+print("NOT CAPPED", flush=True)
+"""
+WD_SWEEP = 0.25  # bench watchdog pass interval (RES_INTERVAL in production)
+WD_STEP = 4      # MB the slow hog adds per 0.1s
+
+
+def _hog(lim, lp, step, pause):
+    lf = open(lp, 'w')
+    p = subprocess.Popen([sys.executable, '-c', HOG, str(step), str(pause)], stdout=lf, stderr=subprocess.STDOUT,
+                         start_new_session=True, env=dict(os.environ, MALLOC_ARENA_MAX='1'))
+    limits.apply(p.pid, lim)
+    return p, lf
+
+
+def _peak(lp):
+    with open(lp) as f:
+        out = f.read()
+    reached = [int(ln[:-2]) for ln in out.splitlines() if ln.endswith('MB') and ln[:-2].isdigit()]
+    return (reached[-1] if reached else 0), out
+
+
+def bench_limits(plan='free'):
+    """Fails unless a memory hog dies at or near plan RAM, on the hard cap and via the watchdog"""
+    import runner
+    import utils
+    d = tempfile.mkdtemp(prefix='apon_bench_')
+    ram = PLAN_LIMITS[plan]['ram']
+    ok = True
+
+    # 1. hard cap (cgroup memory.max, or RLIMIT_DATA): a fast hog
+    lim = limits.prepare('bench_hog', PLAN_LIMITS[plan], 'py')
+    lp = os.path.join(d, 'hog.log')
+    t = time.perf_counter()
+    p, lf = _hog(lim, lp, 8, 0.01)
+    try:
+        p.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        p.kill()
+    lf.close()
+    peak, out = _peak(lp)
+    allowed = {'cgroup': ram, 'rlimit': limits.data_cap(ram)}.get(lim['mode'])
+    print(f"\nMemory hog under '{plan}' ({ram}MB)")
+    if allowed:
+        capped = limits.oom_killed(lim, out) and 'NOT CAPPED' not in out and peak <= allowed
+        ok &= capped
+        print(f"  {lim['mode']:<9} allocated {peak}MB (allowed {allowed}MB) in {time.perf_counter() - t:.1f}s, "
+              f"exit {p.returncode}  {'✅' if capped else '❌'}")
+    else:
+        p.kill()
+        print(f"  {lim['mode']:<9} no hard cap on this host, watchdog only")
+    limits.release(lim)
+
+    # 2. RSS watchdog alone (Node bots, or no cgroup/prlimit): a slow hog and
+    # the real check_limits pass; it may overshoot by what grows in
+    # LIMIT_KILL_AFTER sweeps, so allow that plus one sweep of sampling lag
+    lim = {'ram': ram, 'cpu': 100, 'mode': 'watchdog', 'cg': None, 'vm': None, 'data': None}
+    lp = os.path.join(d, 'hog_wd.log')
+    p, lf = _hog(lim, lp, WD_STEP, 0.1)
+    sk = 'bench_hog_wd'
+    with runner.bot_lock:
+        runner.bot_scripts[sk] = {'process': p, 'log_file': lf, 'limits': lim, 'file_name': 'hog'}
+    over, rss, killed, t = {}, 0, False, time.perf_counter()
+    while not killed and time.perf_counter() - t < 60 and p.poll() is None:
+        time.sleep(WD_SWEEP)
+        utils.collect_resources()
+        rss = (utils.bot_usage(sk) or {}).get('rss', rss)
+        killed = sk in runner.check_limits(over)
+    try:
+        p.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        p.kill()
+    runner.cleanup_script(sk)
+    slack = (runner.LIMIT_KILL_AFTER + 1) * WD_STEP * WD_SWEEP / 0.1
+    # kill_tree reaps through psutil, so Popen's returncode says nothing here
+    good = killed and p.poll() is not None and 'NOT CAPPED' not in _peak(lp)[1] and rss <= ram + slack
+    ok &= good
+    print(f"  watchdog  killed at {rss:.0f}MB RSS (allowed {ram + slack:.0f}MB) "
+          f"in {time.perf_counter() - t:.1f}s  {'✅' if good else '❌'}")
+    print(f"  {'✅ capped' if ok else '❌ NOT capped'}")
+    if not ok:
+        sys.exit(1)
+
+
+# ═══════════════════════════════════════════
+#  DEPS: PER-BOT VENV CREATION
+# ═══════════════════════════════════════════
+def _du(path):
+    """Bytes on disk under path, each inode counted once"""
+    seen, total = set(), 0
+    for d, _, fs in os.walk(path):
+        for fn in fs:
+            st = os.lstat(os.path.join(d, fn))
+            if st.st_ino not in seen:
+                seen.add(st.st_ino)
+                total += st.st_size
+    return total
+
+
+def bench_venv(reqs='six\nidna\n', bots=3):
+    d = tempfile.mkdtemp(prefix='apon_bench_')
+    root, wheels = os.path.join(d, 'venvs'), os.path.join(d, 'wheels')
+    os.makedirs(wheels)
+    print(f"\nPer-bot venvs for {bots} bots ({reqs.split()})")
+    for n in range(bots):
+        wd = os.path.join(d, f"bot{n}")
+        os.makedirs(wd)
+        # distinct manifests, same packages: each bot needs its own venv
+        with open(os.path.join(wd, 'requirements.txt'), 'w') as f:
+            f.write(reqs + f"# bot {n}\n" * n)
+        t = time.perf_counter()
+        _, ok, how = deps.build_venv(f"b{n}", wd, root, wheels)
+        label = 'cold cache' if n == 0 else 'warm wheelhouse'
+        print(f"  bot{n} {label:<16}{time.perf_counter() - t:>7.2f}s  {how}{'' if ok else ' FAILED'}")
+    t = time.perf_counter()
+    deps.build_venv('b0', os.path.join(d, 'bot0'), root, wheels)
+    print(f"  bot0 {'same hash':<16}{time.perf_counter() - t:>7.2f}s  skip")
+    flat = sum(os.lstat(os.path.join(dd, fn)).st_size
+               for dd, _, fs in os.walk(root) if '.store' not in dd for fn in fs)
+    print(f"  disk: {_du(root) // 1024}KB with hardlinks vs {flat // 1024}KB as copies")
+
+
+BENCHES = {'db': bench_db, 'rw': bench_rw, 'rwflush': bench_rw_flush, 'indexes': bench_indexes, 'limits': bench_limits,
+           'venv': bench_venv}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHES)
+    for nm in names:
+        if nm not in BENCHES:
+            sys.exit(f"unknown bench: {nm} (choose from {', '.join(BENCHES)})")
+        BENCHES[nm]()
@@ -0,0 +1,311 @@
+"""
+╔═══════════════════════════════════════════╗
+║  botlogs.py — Hosted Bot Logs             ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Per-bot stdout/stderr logs. Reads seek from the end, so a view costs the
+size of the page shown, not of the file. Logs are opened in append mode
+and rotated copytruncate-style (copy to .1, truncate in place), so the
+running bot keeps its file handle. Size and kept files come from the plan.
+
+Follow mode streams a log into one Telegram message: a single thread
+checks every followed log, batches what's new and edits each message at
+most every FOLLOW_EDIT_S, stopping on its own once the bot goes quiet.
+"""
+
+import os
+import time
+import shutil
+import threading
+import telebot
+from telebot import types
+
+from config import (
+    LOGS_DIR, LOG_ROTATE_CHECK, PLAN_LIMITS, bot_lock, bot_scripts, logger,
+    FOLLOW_POLL, FOLLOW_EDIT_S, FOLLOW_IDLE, FOLLOW_MAX_S, FOLLOW_MAX
+)
+from database import db
+from utils import get_bot_instance
+
+PAGE = 1500  # bytes per logs: page
+
+
+# ═══════════════════════════════════════════
+#  FILES
+# ═══════════════════════════════════════════
+def path(sk):
+    return os.path.join(LOGS_DIR, f"{sk}.log")
+
+
+def open_log(sk, header=''):
+    """Append-mode handle for a starting bot -> (file, start offset of this run)"""
+    lf = open(path(sk), 'a', encoding='utf-8', errors='ignore')
+    if header:
+        lf.write(header)
+        lf.flush()
+    return lf, lf.tell()
+
+
+def _segments(sk):
+    """Oldest first: [(path, size)] over rotated files and the live one"""
+    lp = path(sk)
+    segs = []
+    n = 1
+    while os.path.exists(f"{lp}.{n}"):
+        segs.append(f"{lp}.{n}")
+        n += 1
+    segs.reverse()
+    segs.append(lp)
+    out = []
+    for p in segs:
+        try:
+            out.append((p, os.path.getsize(p)))
+        except OSError:
+            pass
+    return out
+
+
+def _read(p, start, n):
+    try:
+        with open(p, 'rb') as f:
+            f.seek(start)
+            return f.read(n)
+    except OSError:
+        return b''
+
+
+def read_from(lp, start, n=2000):
+    """Last n bytes written at or after offset start (a run's own output)"""
+    try:
+        size = os.path.getsize(lp)
+    except OSError:
+        return ''
+    if start > size:
+        start = 0  # rotated since
+    return _read(lp, max(start, size - n), n).decode('utf-8', 'ignore')
+
+
+# ═══════════════════════════════════════════
+#  PAGING
+# ═══════════════════════════════════════════
+def page(sk, n=0, size=PAGE):
+    """Page n counting back from the newest output -> (text, has_older)
+
+    Treats the rotated files plus the live log as one stream and reads
+    only the bytes of the requested window.
+    """
+    segs = _segments(sk)
+    total = sum(s for _, s in segs)
+    end = total - n * size
+    if end <= 0:
+        return '', False
+    start = max(0, end - size)
+    chunks, off = [], 0
+    for p, s in segs:
+        lo, hi = max(start, off), min(end, off + s)
+        if lo < hi:
+            chunks.append(_read(p, lo - off, hi - lo))
+        off += s
+    return b''.join(chunks).decode('utf-8', 'ignore'), start > 0
+
+
+def size(sk):
+    return sum(s for _, s in _segments(sk))
+
+
+def clear(sk):
+    """Empty the live log in place and drop rotated files"""
+    for p, _ in _segments(sk):
+        try:
+            if p == path(sk):
+                os.truncate(p, 0)
+            else:
+                os.remove(p)
+        except OSError:
+            pass
+
+
+# ═══════════════════════════════════════════
+#  ROTATION
+# ═══════════════════════════════════════════
+def rotate(sk, max_mb, keep):
+    """copytruncate once the live log passes max_mb; keeps `keep` old files"""
+    lp = path(sk)
+    try:
+        if os.path.getsize(lp) < max_mb * 1024 * 1024:
+            return False
+        for n in range(keep, 0, -1):
+            src = f"{lp}.{n - 1}" if n > 1 else lp
+            if not os.path.exists(src):
+                continue
+            if n > 1:
+                os.replace(src, f"{lp}.{n}")
+            else:
+                shutil.copyfile(lp, f"{lp}.1")
+        n = keep + 1
+        while os.path.exists(f"{lp}.{n}"):  # plan downgraded: fewer files kept
+            os.remove(f"{lp}.{n}")
+            n += 1
+        os.truncate(lp, 0)  # the bot writes O_APPEND, so it continues at 0
+        return True
+    except OSError as e:
+        logger.warning(f"Log rotate failed for {sk}: {e}")
+        return False
+
+
+def rotate_all():
+    with bot_lock:
+        running = [(sk, i.get('user_id')) for sk, i in bot_scripts.items()]
+    n = 0
+    for sk, uid in running:
+        pl = db.get_plan(uid) if uid else PLAN_LIMITS['free']
+        n += rotate(sk, pl.get('log_mb', 1), pl.get('log_keep', 1))
+    return n
+
+
+def log_loop():
+    logger.info(f"📋 Log rotation every {LOG_ROTATE_CHECK}s")
+    while True:
+        time.sleep(LOG_ROTATE_CHECK)
+        try:
+            n = rotate_all()
+            if n:
+                logger.info(f"📋 Rotated {n} bot logs")
+        except Exception as e:
+            logger.error(f"Log rotation error: {e}")
+
+
+# ═══════════════════════════════════════════
+#  FOLLOW MODE (live view)
+# ═══════════════════════════════════════════
+WINDOW = 3000     # chars of output kept on screen
+READ_CAP = 65536  # bytes read per check; a flood only shows its end
+
+_follow = {}  # chat_id -> session (one live view per chat)
+_follow_lock = threading.Lock()
+_follow_evt = threading.Event()
+_fst = {'started': 0, 'edits': 0, 'throttled': 0, 'idle_stops': 0}
+
+
+def _esc(t):
+    return t.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def follow(chat_id, msg_id, bid, sk):
+    """Turn msg_id into a live view of sk's log; False when at FOLLOW_MAX"""
+    lp = path(sk)
+    try:
+        end = os.path.getsize(lp)
+    except OSError:
+        end = 0
+    s = {'bid': bid, 'sk': sk, 'msg': msg_id, 'pos': end, 'next': 0, 'dirty': True,
+         'text': read_from(lp, 0, WINDOW), 't0': time.time(), 'last_new': time.time()}
+    with _follow_lock:
+        if chat_id not in _follow and len(_follow) >= FOLLOW_MAX:
+            return False
+        _follow[chat_id] = s
+        _fst['started'] += 1
+    _follow_evt.set()
+    return True
+
+
+def unfollow(chat_id, msg_id=None):
+    """Stop the chat's live view (only if it's on msg_id, when given)"""
+    with _follow_lock:
+        s = _follow.get(chat_id)
+        if s and (msg_id is None or s['msg'] == msg_id):
+            del _follow[chat_id]
+
+
+def follow_stats():
+    with _follow_lock:
+        return dict(_fst, live=len(_follow))
+
+
+def _follow_kb(bid, live):
+    m = types.InlineKeyboardMarkup(row_width=2)
+    m.add(types.InlineKeyboardButton("⏹ Stop" if live else "📡 Resume",
+                                     callback_data=f"logs:{bid}" if live else f"follow:{bid}"),
+          types.InlineKeyboardButton("🔙 Back", callback_data=f"detail:{bid}"))
+    return m
+
+
+def _render(s, note):
+    raw = s['text'][-WINDOW:]
+    body = _esc(raw)
+    while len(body) > 3800:  # escaping grows the text; Telegram caps at 4096
+        raw = raw[len(raw) // 4:]
+        body = _esc(raw)
+    return f"📡 <b>Live — #{s['bid']}</b> {note}\n\n<code>{body or '📭 Waiting for output...'}</code>"
+
+
+def _edit(chat_id, s, note, live=True):
+    """-> False when the message is gone and the session should end"""
+    try:
+        get_bot_instance().edit_message_text(_render(s, note), chat_id, s['msg'], parse_mode='HTML',
+                                             reply_markup=_follow_kb(s['bid'], live))
+        _fst['edits'] += 1
+    except telebot.apihelper.ApiTelegramException as e:
+        err = str(e).lower()
+        if e.error_code == 429:
+            _fst['throttled'] += 1
+            retry = ((e.result_json or {}).get('parameters') or {}).get('retry_after', 5)
+            s['next'] = time.time() + retry
+            s['dirty'] = True
+        elif 'not modified' not in err:
+            return False  # deleted, or not ours to edit any more
+    except Exception as e:
+        logger.warning(f"Follow edit error: {e}")
+    return True
+
+
+def _follow_tick():
+    now = time.time()
+    with _follow_lock:
+        items = list(_follow.items())
+    for chat_id, s in items:
+        lp = path(s['sk'])
+        try:
+            size_ = os.path.getsize(lp)
+        except OSError:
+            size_ = 0
+        if size_ < s['pos']:
+            s['pos'] = 0  # rotated or cleared
+        if size_ > s['pos']:
+            start = max(s['pos'], size_ - READ_CAP)
+            new = _read(lp, start, size_ - start).decode('utf-8', 'ignore')
+            s['pos'] = size_
+            s['text'] = (s['text'] + new)[-WINDOW:]
+            s['last_new'] = now
+            s['dirty'] = True
+        idle = now - s['last_new'] >= FOLLOW_IDLE
+        if idle or now - s['t0'] >= FOLLOW_MAX_S:
+            with _follow_lock:
+                if _follow.get(chat_id) is not s:
+                    continue
+                del _follow[chat_id]
+            _fst['idle_stops'] += idle
+            _edit(chat_id, s, "⏸ (stopped: " + ("no new output)" if idle else "time limit)"), live=False)
+            continue
+        if s['dirty'] and now >= s['next']:
+            s['dirty'] = False
+            s['next'] = now + FOLLOW_EDIT_S
+            if not _edit(chat_id, s, f"· {time.strftime('%H:%M:%S')}"):
+                unfollow(chat_id, s['msg'])
+
+
+def follow_loop():
+    """One thread for every live view; parked while there are none"""
+    while True:
+        try:
+            with _follow_lock:
+                busy = bool(_follow)
+            if not busy:
+                _follow_evt.wait()
+                _follow_evt.clear()
+                continue
+            _follow_tick()
+        except Exception as e:
+            logger.error(f"Follow loop error: {e}")
+        time.sleep(FOLLOW_POLL)
@@ -6,9 +6,8 @@
 """
 
 import os
-import time
+import html
 import shutil
-import threading
 from datetime import datetime
 from telebot import types
 
@@ -17,20 +16,26 @@ from config import (
     BRAND, BRAND_VER, BRAND_TAG, BRAND_SHORT, BOT_USERNAME,
     YOUR_USERNAME, REF_COMMISSION, REF_BONUS_DAYS,
     bot_lock, state_lock, bot_scripts, user_states, payment_states,
-    LOGS_DIR, BACKUP_DIR, DB_PATH
+    BACKUP_DIR, DB_PATH
 )
 from database import db
 from utils import (
     safe_send, safe_edit, safe_answer, report_error,
     get_uptime, time_left, is_running, bot_res,
     cleanup_script, kill_tree, sys_stats, check_joined,
-    user_folder, det, gen_ref_code
+    user_folder, det, gen_ref_code, fmt_size, metric_history, sparkline,
+    bot_usage, res_totals
 )
 from keyboards import (
     main_kb, bot_action_kb, plan_kb, pay_method_kb,
-    admin_kb, pay_approve_kb, channels_kb
+    admin_kb, pay_approve_kb, channels_kb, users_page_kb
 )
-from runner import run_bot
+from runner import (
+    start_many, control_broadcast, supervisor, jobs, bc_jobs, job_status,
+    queue_start, queue_stop, queue_restart
+)
+import deps
+import botlogs
 
 
 def register_callbacks(bot):
@@ -42,11 +47,13 @@ def register_callbacks(bot):
         data = call.data
         chat_id = call.message.chat.id
         msg_id = call.message.message_id
+        if not data.startswith("follow:"):
+            botlogs.unfollow(chat_id, msg_id)  # navigating away ends a live view
 
         try:
             # ── VERIFY JOIN ──
             if data == "verify_join":
-                joined, nj = check_joined(uid)
+                joined, nj = check_joined(uid, fresh=True)
                 if joined:
                     safe_answer(call.id, "✅ Verified! Welcome!", show_alert=True)
                     try:
@@ -95,6 +102,8 @@ def register_callbacks(bot):
                     m.add(types.InlineKeyboardButton(
                         f"{st_icon} {b['bot_name'][:15]} #{b['bot_id']}",
                         callback_data=f"detail:{b['bot_id']}"))
+                if rn < len(bots_list):
+                    m.add(types.InlineKeyboardButton(f"▶️ Start All ({len(bots_list) - rn})", callback_data="startall"))
                 m.add(types.InlineKeyboardButton("📤 Deploy New", callback_data="deploy"))
                 safe_edit(t, chat_id, msg_id, reply_markup=m)
 
@@ -116,13 +125,26 @@ def register_callbacks(bot):
                         if st:
                             uptime_str = str(datetime.now() - st).split('.')[0]
                 icon = "🐍" if bd['file_type'] == 'py' else "🟨"
-                status_icon = "🟢 Running" if rn else "🔴 Stopped"
+                status_icon = "🟢 Running" if rn else "💥 Killed (RAM limit)" if bd['status'] == 'oom_killed' else "🔴 Stopped"
                 t = (f"{icon} <b>{bd['bot_name'][:22]}</b>\n━━━━━━━━━━━━━━━━━━━━\n"
                      f"🆔 Bot ID: #{bid}\n📄 Entry: {bd['entry_file']}\n"
                      f"🔤 Type: {bd['file_type'].upper()}\n📊 Status: {status_icon}\n"
                      f"💾 RAM: {ram}MB | ⚡ CPU: {cpu}%\n⏱️ Uptime: {uptime_str}\n"
-                     f"🔄 Restarts: {bd['total_restarts']}\n"
-                     f"📅 Created: {bd['created_at'][:10] if bd.get('created_at') else '?'}\n━━━━━━━━━━━━━━━━━━━━")
+                     f"🔄 Restarts: {bd['total_restarts']}\n📶 Probe: {bd.get('ready_probe') or 'auto'}\n"
+                     f"{'🧩 Framework: ' + bd['framework'] + chr(10) if bd.get('framework') else ''}"
+                     f"📦 Deps: {bd.get('dep_hits') or 0} hit / {bd.get('dep_misses') or 0} miss · "
+                     f"last install {bd.get('dep_secs') or 0}s\n"
+                     f"📅 Created: {bd['created_at'][:10] if bd.get('created_at') else '?'}\n")
+                lc = db.last_crash(bid)
+                if lc and not rn:
+                    t += f"💥 Last crash: <code>{lc['exc_type']}</code> (seen {lc['count']}× panel-wide)\n"
+                js = job_status(bid)
+                if js:
+                    t += {'queued': f"⏳ Job: {js['op']} queued (#{js['pos']})\n",
+                          'running': f"⚙️ Job: {js['op']} running ({js['age']}s)\n",
+                          'done': f"✅ Job: {js['op']} done\n",
+                          'failed': f"❌ Job: {js['op']} failed\n"}[js['state']]
+                t += "━━━━━━━━━━━━━━━━━━━━"
                 safe_edit(t, chat_id, msg_id, reply_markup=bot_action_kb(bid, 'running' if rn else 'stopped'))
                 safe_answer(call.id)
 
@@ -137,8 +159,19 @@ def register_callbacks(bot):
                 sk = f"{bd['user_id']}_{bd['bot_name']}"
                 if is_running(sk):
                     return safe_answer(call.id, "⚠️ Already running!")
+                if not queue_start(bid, uid, chat_id):
+                    return safe_answer(call.id, "⏳ Already queued!")
                 safe_answer(call.id, "🚀 Starting...")
-                threading.Thread(target=run_bot, args=(bid, chat_id), daemon=True).start()
+
+            elif data == "startall":
+                if not db.is_active(uid):
+                    return safe_answer(call.id, "⚠️ Subscription expired!", show_alert=True)
+                bids = [b['bot_id'] for b in db.get_bots(uid)
+                        if not is_running(f"{uid}_{b['bot_name']}")]
+                if not bids:
+                    return safe_answer(call.id, "⚠️ All running!")
+                safe_answer(call.id, f"🚀 Starting {len(bids)}...")
+                start_many(bids, chat_id, uid)
 
             # ── BOT STOP ──
             elif data.startswith("stop:"):
@@ -146,16 +179,14 @@ def register_callbacks(bot):
                 bd = db.get_bot(bid)
                 if not bd:
                     return safe_answer(call.id, "❌ Not found!")
-                sk = f"{bd['user_id']}_{bd['bot_name']}"
-                with bot_lock:
-                    info = bot_scripts.get(sk)
-                if info:
-                    kill_tree(info)
-                    cleanup_script(sk)
-                db.update_bot(bid, status='stopped', last_stopped=datetime.now().isoformat())
-                safe_answer(call.id, "✅ Stopped!")
+                fut = queue_stop(bid, uid)
+                if not fut:
+                    return safe_answer(call.id, "⏳ Already queued!")
+                safe_answer(call.id, "⏹ Stopping...")
                 call.data = f"detail:{bid}"
-                handle_callback(call)
+                if not fut.done():
+                    handle_callback(call)  # shows the queued job meanwhile
+                fut.add_done_callback(lambda _: handle_callback(call))  # then the stopped state
 
             # ── BOT RESTART ──
             elif data.startswith("restart:"):
@@ -163,51 +194,55 @@ def register_callbacks(bot):
                 bd = db.get_bot(bid)
                 if not bd:
                     return safe_answer(call.id, "❌ Not found!")
-                sk = f"{bd['user_id']}_{bd['bot_name']}"
-                with bot_lock:
-                    info = bot_scripts.get(sk)
-                if info:
-                    kill_tree(info)
-                    cleanup_script(sk)
-                time.sleep(2)
+                if not queue_restart(bid, uid, chat_id):
+                    return safe_answer(call.id, "⏳ Already queued!")
                 safe_answer(call.id, "🔄 Restarting...")
-                threading.Thread(target=run_bot, args=(bid, chat_id), daemon=True).start()
 
             # ── LOGS ──
             elif data.startswith("logs:"):
-                bid = int(data.split(":")[1])
+                parts = data.split(":")
+                bid = int(parts[1])
+                pg = int(parts[2]) if len(parts) > 2 else 0
                 bd = db.get_bot(bid)
                 if not bd:
                     return safe_answer(call.id, "❌!")
                 sk = f"{bd['user_id']}_{bd['bot_name']}"
-                lp = os.path.join(LOGS_DIR, f"{sk}.log")
-                logs = "📭 No logs."
-                if os.path.exists(lp):
-                    try:
-                        with open(lp, 'r', encoding='utf-8', errors='ignore') as f:
-                            logs = f.read()[-1500:] or "📭 Empty."
-                    except:
-                        logs = "❌ Error reading logs."
+                logs, older = botlogs.page(sk, pg)
+                logs = logs.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') or \
+                    ("📭 Empty." if pg == 0 else "📭 No older output.")
                 m = types.InlineKeyboardMarkup(row_width=2)
+                nav = []
+                if older:
+                    nav.append(types.InlineKeyboardButton("⬅️ Older", callback_data=f"logs:{bid}:{pg + 1}"))
+                if pg > 0:
+                    nav.append(types.InlineKeyboardButton("Newer ➡️", callback_data=f"logs:{bid}:{pg - 1}"))
+                if nav:
+                    m.add(*nav)
+                m.add(types.InlineKeyboardButton("📡 Follow live", callback_data=f"follow:{bid}"))
                 m.add(
-                    types.InlineKeyboardButton("🔄 Refresh", callback_data=f"logs:{bid}"),
+                    types.InlineKeyboardButton("🔄 Refresh", callback_data=f"logs:{bid}:{pg}"),
                     types.InlineKeyboardButton("🗑 Clear", callback_data=f"clearlogs:{bid}")
                 )
                 m.add(types.InlineKeyboardButton("🔙 Back", callback_data=f"detail:{bid}"))
-                safe_edit(f"📋 <b>Logs — #{bid}</b>\n\n<code>{logs}</code>"[:4000], chat_id, msg_id, reply_markup=m)
+                where = "latest" if pg == 0 else f"page -{pg}"
+                safe_edit(f"📋 <b>Logs — #{bid}</b> ({where} · {fmt_size(botlogs.size(sk))} kept)\n\n"
+                          f"<code>{logs[-3800:]}</code>", chat_id, msg_id, reply_markup=m)
                 safe_answer(call.id)
 
+            elif data.startswith("follow:"):
+                bid = int(data.split(":")[1])
+                bd = db.get_bot(bid)
+                if not bd:
+                    return safe_answer(call.id, "❌!")
+                if not botlogs.follow(chat_id, msg_id, bid, f"{bd['user_id']}_{bd['bot_name']}"):
+                    return safe_answer(call.id, "⏳ Too many live views, try later!", show_alert=True)
+                safe_answer(call.id, "📡 Following...")
+
             elif data.startswith("clearlogs:"):
                 bid = int(data.split(":")[1])
                 bd = db.get_bot(bid)
                 if bd:
-                    sk = f"{bd['user_id']}_{bd['bot_name']}"
-                    lp = os.path.join(LOGS_DIR, f"{sk}.log")
-                    try:
-                        with open(lp, 'w') as f:
-                            f.write("")
-                    except:
-                        pass
+                    botlogs.clear(f"{bd['user_id']}_{bd['bot_name']}")
                 safe_answer(call.id, "🗑 Cleared!")
                 call.data = f"logs:{bid}"
                 handle_callback(call)
@@ -220,6 +255,7 @@ def register_callbacks(bot):
                     return safe_answer(call.id, "!")
                 sk = f"{bd['user_id']}_{bd['bot_name']}"
                 ram, cpu = bot_res(sk)
+                u = bot_usage(sk)
                 uptime_str = "—"
                 with bot_lock:
                     info = bot_scripts.get(sk)
@@ -232,8 +268,15 @@ def register_callbacks(bot):
                     types.InlineKeyboardButton("🔄 Refresh", callback_data=f"res:{bid}"),
                     types.InlineKeyboardButton("🔙 Back", callback_data=f"detail:{bid}")
                 )
-                safe_edit(f"📊 <b>Resources — #{bid}</b>\n\n💾 RAM: {ram}MB\n⚡ CPU: {cpu}%\n"
-                          f"⏱️ Uptime: {uptime_str}\n🔄 Restarts: {bd['total_restarts']}",
+                t = f"📊 <b>Resources — #{bid}</b>\n\n💾 RAM: {ram}MB\n⚡ CPU: {cpu}%\n"
+                if u:
+                    hist = u['hist'][-24:]
+                    t += (f"📈 RAM <code>{sparkline([h[1] for h in hist])}</code>\n"
+                          f"📈 CPU <code>{sparkline([h[2] for h in hist], 0, 100)}</code>\n"
+                          f"🧵 Threads: {u['threads']} | ⚙️ Procs: {u['procs']}\n"
+                          f"💿 IO: R {fmt_size(u['io_r'])} / W {fmt_size(u['io_w'])}\n")
+                safe_edit(t + f"⏱️ Uptime: {uptime_str}\n"
+                          f"🔄 Restarts: {bd['total_restarts']} (today {bd.get('restarts_today') or 0})",
                           chat_id, msg_id, reply_markup=m)
                 safe_answer(call.id)
 
@@ -507,17 +550,27 @@ def register_callbacks(bot):
                     f"Force Sub: {'🟢 ON' if FORCE_SUB_ENABLED else '🔴 OFF'}\n━━━━━━━━━━━━━━━━━━━━",
                     chat_id, msg_id, reply_markup=admin_kb())
 
-            elif data == "a_users":
+            elif data == "a_users" or data.startswith("a_users:"):
                 if uid not in admin_ids and uid != OWNER_ID:
                     return
-                users = db.get_all_users()
-                t = f"👥 <b>Users ({len(users)})</b>\n\n"
-                for u in users[:25]:
+                parts = data.split(":")
+                if len(parts) == 3 and parts[1] == 'p':
+                    users, has_prev, has_next = db.users_page(before=int(parts[2]))
+                elif len(parts) == 3:
+                    users, has_prev, has_next = db.users_page(after=int(parts[2]))
+                else:
+                    users, has_prev, has_next = db.users_page()
+                t = f"👥 <b>Users ({db.user_count()})</b>\n\n"
+                for u in users:
                     st = "🚫" if u['is_banned'] else "💎" if u['plan'] != 'free' else "✅"
                     t += f"{st} <code>{u['user_id']}</code> {u['full_name'] or '-'} [{u['plan']}]\n"
-                if len(users) > 25:
-                    t += f"\n... +{len(users) - 25} more"
-                safe_send(uid, t[:4000])
+                if not users:
+                    t += "No users."
+                m = users_page_kb(users, has_prev, has_next)
+                if len(parts) == 1:
+                    safe_send(uid, t[:4000], reply_markup=m)
+                else:
+                    safe_edit(t[:4000], chat_id, msg_id, reply_markup=m)
                 safe_answer(call.id)
 
             elif data == "a_stats":
@@ -555,6 +608,14 @@ def register_callbacks(bot):
                 safe_answer(call.id)
                 safe_send(uid, "📢 Send broadcast message:")
 
+            elif data.startswith(("bc_pause:", "bc_resume:", "bc_cancel:")):
+                if uid not in admin_ids and uid != OWNER_ID:
+                    return
+                act, bc_id = data[3:].split(":")
+                st = control_broadcast(int(bc_id), act)
+                safe_answer(call.id, {'paused': "⏸ Paused", 'running': "▶️ Resumed",
+                                      'cancelled': "⏹ Cancelled"}.get(st, "Broadcast already finished"))
+
             elif data == "a_addsub":
                 with state_lock:
                     user_states[uid] = {'action': 'a_addsub', 'step': 1}
@@ -678,6 +739,51 @@ def register_callbacks(bot):
                 safe_edit(t, chat_id, msg_id, reply_markup=m)
                 safe_answer(call.id)
 
+            elif data == "a_crashes":
+                if uid not in admin_ids and uid != OWNER_ID:
+                    return
+                top = db.top_crashes(10)
+                t = "💥 <b>Top Crash Signatures</b>\n\n"
+                m = types.InlineKeyboardMarkup(row_width=1)
+                for n, c in enumerate(top, 1):
+                    where = c['frames'].rsplit(' > ', 1)[-1] if c['frames'] else '—'
+                    t += (f"{n}. <code>{html.escape(c['exc_type'], False)}</code> ×{c['count']} · {c['bots']} bots\n"
+                          f"   📍 {html.escape(where[:60], False)} · last {c['last_seen'][5:16]}\n")
+                    m.add(types.InlineKeyboardButton(f"{n}. {c['exc_type'][:30]} ×{c['count']}",
+                                                     callback_data=f"a_crash:{c['sig']}"))
+                if not top:
+                    t += "No crashes recorded! 🎉"
+                fx = db.fix_stats()
+                if fx:
+                    t += "\n🩹 <b>Auto-fix rules</b> (applied → next start ok)\n"
+                    for r in fx:
+                        done = r['succeeded'] + r['failed']
+                        rate = f"{r['succeeded'] * 100 // done}%" if done else "—"
+                        t += f"  {r['rule']}: {r['fixed']}/{r['matched']} applied · {rate} ok\n"
+                m.add(types.InlineKeyboardButton("🔙 Back", callback_data="admin_back"))
+                safe_edit(t, chat_id, msg_id, reply_markup=m)
+                safe_answer(call.id)
+
+            elif data.startswith("a_crash:"):
+                if uid not in admin_ids and uid != OWNER_ID:
+                    return
+                sig = data.split(":")[1]
+                c = db.crash_sig(sig)
+                if not c:
+                    return safe_answer(call.id, "❌ Gone!")
+                esc = lambda s: html.escape(s or '', False)
+                frames = "\n".join(f"  {f}" for f in c['frames'].split(' > ')[-6:]) if c['frames'] else "  (no traceback)"
+                t = (f"💥 <b>{esc(c['exc_type'])}</b> <code>{sig}</code>\n\n"
+                     f"🔢 {c['count']}× · first {c['first_seen'][:16]} · last {c['last_seen'][:16]}\n"
+                     f"💬 <code>{esc((c['sample'] or '')[:300]) or '—'}</code>\n\n"
+                     f"📚 Frames (innermost last):\n<code>{esc(frames)}</code>\n\n🤖 Bots:\n")
+                for b in db.crash_bots(sig):
+                    t += f"  #{b['bot_id']} (user {b['user_id']}) ×{b['n']} · last {b['last'][5:16]}\n"
+                m = types.InlineKeyboardMarkup()
+                m.add(types.InlineKeyboardButton("🔙 Back", callback_data="a_crashes"))
+                safe_edit(t[:4000], chat_id, msg_id, reply_markup=m)
+                safe_answer(call.id)
+
             elif data.startswith("tkt_reply:"):
                 if uid not in admin_ids and uid != OWNER_ID:
                     return
@@ -693,35 +799,63 @@ def register_callbacks(bot):
                 if uid not in admin_ids and uid != OWNER_ID:
                     return
                 ss = sys_stats()
+                ls = db.lock_stats()
+                wb = db.wb_stats()
+                cs = db.cache_stats()
                 with bot_lock:
                     rn = len([k for k in bot_scripts if is_running(k)])
                 m = types.InlineKeyboardMarkup()
-                m.add(types.InlineKeyboardButton("🔙 Back", callback_data="admin_back"))
+                m.add(
+                    types.InlineKeyboardButton("🔄 Refresh", callback_data="a_sys"),
+                    types.InlineKeyboardButton("🔙 Back", callback_data="admin_back")
+                )
+                rt = res_totals()
+                sv = supervisor.stats()
+                jb = jobs.stats()
+                bj = bc_jobs.stats()
+                dp = deps.stats()
+                fl = botlogs.follow_stats()
+                cpu_h, mem_h = metric_history('cpu', 24), metric_history('mem', 24)
+                net_h = [a + b for a, b in zip(metric_history('rx_rate', 24), metric_history('tx_rate', 24))]
                 safe_edit(
-                    f"🖥 <b>System</b>\n\n🖥️ CPU: {ss['cpu']}%\n🧠 RAM: {ss['mem']}%\n"
+                    f"🖥 <b>System</b>\n\n🖥️ CPU: {ss['cpu']}% <code>{sparkline(cpu_h, 0, 100)}</code>\n"
+                    f"🧠 RAM: {ss['mem']}% <code>{sparkline(mem_h, 0, 100)}</code>\n"
+                    f"🌐 Net: ↓{fmt_size(ss.get('rx_rate', 0))}/s ↑{fmt_size(ss.get('tx_rate', 0))}/s "
+                    f"<code>{sparkline(net_h)}</code>\n"
+                    f"📈 Load: {ss.get('load', 0)}\n"
                     f"💾 Disk: {ss['disk']}%\n📊 RAM: {ss.get('mem_total', '?')}\n"
-                    f"💿 Disk: {ss.get('disk_total', '?')}\n⏱️ Uptime: {ss['up']}\n🤖 Running: {rn}",
+                    f"💿 Disk: {ss.get('disk_total', '?')}\n⏱️ Uptime: {ss['up']}\n🤖 Running: {rn}\n"
+                    f"📦 Bots total: {rt['rss']}MB RAM | {rt['cpu']}% CPU\n"
+                    f"👁️ Supervisor ({sv['mode']}): {sv['watched']} watched | {sv['exits']} exits | "
+                    f"{sv['scheduled']} queued\n"
+                    f"🧰 Jobs: {jb['running']}/{jb['workers']} running ({jb['reserved']} kept for stops) | "
+                    f"{jb['depth']} waiting (max {jb['max_depth']}) | {jb['done']} done / {jb['failed']} failed\n"
+                    f"📢 Broadcast jobs: {bj['running']}/{bj['workers']} running | {bj['depth']} waiting\n"
+                    f"📦 Deps: {dp['rate']}% cached ({dp['skip']} skip / {dp['wheel_hit']} wheel / "
+                    f"{dp['wheel_miss'] + dp['fallback']} built, {dp['none']} without deps) | {dp['wheels']} wheels | {dp['venvs']} venvs | "
+                    f"{dp['secs']:.0f}s installing\n"
+                    f"📡 Live logs: {fl['live']} open | {fl['edits']} edits | {fl['throttled']} throttled\n\n"
+                    f"🗄 <b>Database</b>\n"
+                    f"📖 Reads: {ls['reads']} (lock-free)\n"
+                    f"✍️ Writes: {ls['acquired']} | ⏳ Contended: {ls['contended']}\n"
+                    f"⏱️ Wait avg/max: {ls['avg_wait_ms']}ms / {ls['max_wait_ms']}ms\n"
+                    f"🔌 Connections: {ls['conns']}\n"
+                    f"📝 Write-behind: {wb['deferred']} queued → {wb['rows']} rows / {wb['flushes']} flushes\n"
+                    f"🧠 User cache: {cs['users']['hits']} hit / {cs['users']['misses']} miss ({cs['users']['rate']}%)\n"
+                    f"📢 Channel cache: {cs['channels']['hits']} hit / {cs['channels']['misses']} miss ({cs['channels']['rate']}%)\n"
+                    f"📊 Stats snapshot: {db.stats_age() if db.stats_age() is not None else '-'}s old",
                     chat_id, msg_id, reply_markup=m)
                 safe_answer(call.id)
 
             elif data == "a_stopall":
                 if uid not in admin_ids and uid != OWNER_ID:
                     return
-                count = 0
+                # the same stop job as per-bot Stop: status 'stopped', so warm restore skips them
                 with bot_lock:
-                    keys = list(bot_scripts.keys())
-                for sk in keys:
-                    try:
-                        with bot_lock:
-                            info = bot_scripts.get(sk)
-                        if info:
-                            kill_tree(info)
-                            cleanup_script(sk)
-                            count += 1
-                    except:
-                        pass
-                db.admin_log(uid, 'stop_all', details=f"stopped:{count}")
-                safe_answer(call.id, f"🛑 Stopped {count} bots")
+                    running = [(i['bot_id'], i['user_id']) for i in bot_scripts.values() if i.get('bot_id')]
+                count = sum(1 for bid, owner in running if queue_stop(bid, owner))
+                db.admin_log(uid, 'stop_all', det=f"stopped:{count}")
+                safe_answer(call.id, f"🛑 Stopping {count} bots")
 
             elif data == "a_backup":
                 if uid not in admin_ids and uid != OWNER_ID:
@@ -37,8 +37,11 @@ DATA_DIR = os.path.join(BASE_DIR, 'apon_data')
 DB_PATH = os.path.join(DATA_DIR, 'apon.db')
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+WHEEL_DIR = os.path.join(DATA_DIR, 'wheelhouse')
+VENV_DIR = os.path.join(DATA_DIR, 'venvs')
+INCOMING_DIR = os.path.join(DATA_DIR, 'incoming')
 
-for _d in [UPLOAD_DIR, DATA_DIR, LOGS_DIR, BACKUP_DIR]:
+for _d in [UPLOAD_DIR, DATA_DIR, LOGS_DIR, BACKUP_DIR, WHEEL_DIR, VENV_DIR, INCOMING_DIR]:
     os.makedirs(_d, exist_ok=True)
 
 # ═══════════════════════════════════════════
@@ -46,17 +49,19 @@ for _d in [UPLOAD_DIR, DATA_DIR, LOGS_DIR, BACKUP_DIR]:
 # ═══════════════════════════════════════════
 DEFAULT_FORCE_CHANNELS = {'developer_apon_07': 'Developer Apon Updates'}
 FORCE_SUB_ENABLED = True
+FSUB_TTL_JOINED = 600     # seconds a confirmed membership is trusted
+FSUB_TTL_NOT_JOINED = 30  # re-check non-members soon so fresh joins pass
 
 # ═══════════════════════════════════════════
 #  PLANS
 # ═══════════════════════════════════════════
 PLAN_LIMITS = {
-    'free':       {'name': '🆓 Free',        'max_bots': 1,  'ram': 128,  'auto_restart': False, 'price': 0},
-    'starter':    {'name': '🟢 Starter',     'max_bots': 2,  'ram': 256,  'auto_restart': True,  'price': 99},
-    'basic':      {'name': '⭐ Basic',        'max_bots': 5,  'ram': 512,  'auto_restart': True,  'price': 199},
-    'pro':        {'name': '💎 Pro',          'max_bots': 15, 'ram': 2048, 'auto_restart': True,  'price': 499},
-    'enterprise': {'name': '🏢 Enterprise',   'max_bots': 50, 'ram': 4096, 'auto_restart': True,  'price': 999},
-    'lifetime':   {'name': '👑 Lifetime',     'max_bots': -1, 'ram': 8192, 'auto_restart': True,  'price': 1999},
+    'free':       {'name': '🆓 Free',        'max_bots': 1,  'ram': 128,  'cpu': 25,  'auto_restart': False, 'log_mb': 1,  'log_keep': 1,  'price': 0},
+    'starter':    {'name': '🟢 Starter',     'max_bots': 2,  'ram': 256,  'cpu': 50,  'auto_restart': True,  'log_mb': 2,  'log_keep': 2,  'price': 99},
+    'basic':      {'name': '⭐ Basic',        'max_bots': 5,  'ram': 512,  'cpu': 100, 'auto_restart': True,  'log_mb': 5,  'log_keep': 3,  'price': 199},
+    'pro':        {'name': '💎 Pro',          'max_bots': 15, 'ram': 2048, 'cpu': 200, 'auto_restart': True,  'log_mb': 10, 'log_keep': 5,  'price': 499},
+    'enterprise': {'name': '🏢 Enterprise',   'max_bots': 50, 'ram': 4096, 'cpu': 400, 'auto_restart': True,  'log_mb': 20, 'log_keep': 7,  'price': 999},
+    'lifetime':   {'name': '👑 Lifetime',     'max_bots': -1, 'ram': 8192, 'cpu': 800, 'auto_restart': True,  'log_mb': 50, 'log_keep': 10, 'price': 1999},
 }
 
 # ═══════════════════════════════════════════
@@ -77,6 +82,88 @@ PAYMENT_METHODS = {
 REF_BONUS_DAYS = 3
 REF_COMMISSION = 20
 
+# ═══════════════════════════════════════════
+#  BROADCAST (Telegram: ~30 msg/s global, 1 msg/s per chat)
+# ═══════════════════════════════════════════
+BC_RATE = 25        # messages per second across all workers
+BC_WORKERS = 8      # concurrent senders
+BC_BATCH = 100      # users per checkpoint
+
+# ═══════════════════════════════════════════
+#  UPLOADS (streamed to disk, ZIPs unpacked member by member)
+# ═══════════════════════════════════════════
+UPLOAD_SLOTS = 4                         # uploads handled at once
+UPLOAD_WAIT = 30                         # seconds to wait for a free slot
+UPLOAD_CHUNK = 256 * 1024                # bytes per read/write
+UPLOAD_MAX = 100 * 1024 * 1024           # download size
+UPLOAD_MAX_UNZIPPED = 500 * 1024 * 1024  # total bytes written from one ZIP
+UPLOAD_MAX_FILES = 5000                  # members per ZIP
+UPLOAD_MAX_RATIO = 1000                  # uncompressed/compressed per member (deflate tops out ~1032)
+UPLOAD_RATIO_FROM = 8 * 1024 * 1024      # ratio only checked once a member passes this
+
+# ═══════════════════════════════════════════
+#  METRICS SAMPLER
+# ═══════════════════════════════════════════
+METRICS_INTERVAL = 5    # seconds between system samples
+METRICS_HISTORY = 120   # samples kept (10 min at 5s)
+RES_INTERVAL = 5        # seconds between per-bot resource sweeps
+RES_HISTORY = 60        # per-bot samples kept (5 min at 5s)
+
+# ═══════════════════════════════════════════
+#  BOT LIMITS (plan 'ram' MB / 'cpu' % of one core)
+# ═══════════════════════════════════════════
+LIMIT_CGROUP = 'apon'       # cgroup v2 parent group name
+LIMIT_DATA_SLACK = 32       # MB of writable memory over plan RAM, for thread stacks (rlimit fallback)
+LIMIT_VM_BASE = 64          # MB of address space for interpreter + libs (rlimit fallback)
+LIMIT_VM_SLACK = 0.25       # extra address space as a share of plan RAM (rlimit fallback)
+LIMIT_KILL_AFTER = 2        # consecutive over-limit sweeps before the watchdog kills
+
+# ═══════════════════════════════════════════
+#  AUTO-RESTART (backoff per bot)
+# ═══════════════════════════════════════════
+RESTART_BASE = 2            # seconds before the first restart
+RESTART_MAX = 300           # backoff ceiling
+RESTART_STABLE = 600        # a run this long resets the crash streak
+RESTART_MAX_STREAK = 6      # give up after this many quick crashes in a row
+RESTART_WORKERS = 4         # concurrent restarts
+CRASH_TAIL = 8192           # bytes of a crashed run's log fingerprinted
+CRASH_KEEP_DAYS = 30        # crash records/signatures older than this are pruned
+
+# ═══════════════════════════════════════════
+#  READINESS (bot startup)
+# ═══════════════════════════════════════════
+READY_TIMEOUT = 8           # alive this long without a signal still counts as up
+READY_MIN_UP = 2            # ...and never less than this, even with a signal
+READY_POLL = 0.2            # seconds between probes
+READY_PATTERN = (r"(?i)(bot (is )?(started|running|online)|start(ed)? polling|polling started"
+                 r"|application started|logged in as|listening on|running on https?://|server (is )?running)")
+
+# ═══════════════════════════════════════════
+#  JOBS (start / stop / restart / broadcast)
+# ═══════════════════════════════════════════
+JOB_WORKERS = 8             # bot operations running at once, all users
+JOB_PER_USER = 3            # ...and per user (also paces Start All)
+JOB_RESERVED = 2            # ...of JOB_WORKERS kept free for stops
+BC_JOBS = 2                 # broadcasts running at once (own pool, never blocks bot ops)
+RESTORE_ON_BOOT = True      # restart bots that were running when the panel stopped
+RESTORE_ADOPT = True        # ...or re-attach to them if they survived (panel crash)
+
+# ═══════════════════════════════════════════
+#  DEPENDENCIES (wheelhouse + per-bot venvs)
+# ═══════════════════════════════════════════
+BOT_VENVS = True            # Python bots run in a venv keyed by their requirements hash
+VENV_KEEP_DAYS = 3          # unused venvs are pruned after this long
+
+# ═══════════════════════════════════════════
+#  BOT LOGS (size/retention per plan: log_mb, log_keep)
+# ═══════════════════════════════════════════
+LOG_ROTATE_CHECK = 30       # seconds between size checks of running bots' logs
+FOLLOW_POLL = 0.5           # live view: how often followed logs are checked
+FOLLOW_EDIT_S = 3           # ...min seconds between edits of one message
+FOLLOW_IDLE = 120           # ...stops after this long without new output
+FOLLOW_MAX_S = 900          # ...and after this long in any case
+FOLLOW_MAX = 50             # ...live views at once, all users
+
 # ═══════════════════════════════════════════
 #  MODULE MAP (auto-install)
 # ═══════════════════════════════════════════
@@ -0,0 +1,119 @@
+"""
+╔═══════════════════════════════════════════╗
+║  crashes.py — Crash Signatures            ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Fingerprints a crashed bot's output: exception type plus its traceback
+frames with paths, line numbers and messages normalized away, so the
+same bug hashes the same across bots, users and redeploys. Only the
+tail of the run's log is parsed (CRASH_TAIL bytes), never the file.
+"""
+
+import re
+import signal
+import hashlib
+
+from config import CRASH_TAIL, logger
+from database import db
+
+MAX_FRAMES = 8  # innermost frames that make up a signature
+
+_PY_TB = 'Traceback (most recent call last):'
+_PY_FRAME = re.compile(r'^\s*File "([^"]+)", line \d+, in (\S+)')
+_PY_EXC = re.compile(r'^([A-Za-z_][\w.]*)(?::\s?(.*))?$')
+_JS_EXC = re.compile(r'^(?:Uncaught )?([A-Z]\w*(?:Error|Exception))(?: \[\w+\])?: ?(.*)$')
+_JS_FRAME = re.compile(r'^\s+at (?:(?:async )?([^\s(]+) \()?(.+?):\d+:\d+\)?$')
+_NUMS = re.compile(r'\b\d+\b|0x[0-9a-fA-F]+')
+_QUOTED = re.compile(r"'[^']{0,200}'|\"[^\"]{0,200}\"")
+
+
+# ═══════════════════════════════════════════
+#  FINGERPRINT
+# ═══════════════════════════════════════════
+def norm_path(p):
+    """Library frames keep their package path, user code just the file name"""
+    p = p.replace('\\', '/')
+    for mark in ('site-packages/', 'dist-packages/', 'node_modules/'):
+        if mark in p:
+            return p.rsplit(mark, 1)[1]
+    if p.startswith('node:') or p.startswith('<'):
+        return p
+    return p.rsplit('/', 1)[-1]
+
+
+def norm_msg(m):
+    return _QUOTED.sub("'…'", _NUMS.sub('N', m or '')).strip()[:200]
+
+
+def _python(lines):
+    start = max(i for i, ln in enumerate(lines) if ln.startswith(_PY_TB))
+    frames, exc, msg = [], None, ''
+    for ln in lines[start + 1:]:
+        m = _PY_FRAME.match(ln)
+        if m:
+            frames.append(f"{norm_path(m.group(1))}:{m.group(2)}")
+            continue
+        if ln and not ln[0].isspace():
+            m = _PY_EXC.match(ln.strip())
+            if m:
+                exc, msg = m.group(1), m.group(2) or ''
+                break
+    return exc, frames, msg
+
+
+def _node(lines):
+    for i in range(len(lines) - 1, -1, -1):
+        m = _JS_EXC.match(lines[i])
+        if not m:
+            continue
+        frames = []
+        for ln in lines[i + 1:]:
+            f = _JS_FRAME.match(ln)
+            if not f:
+                break
+            frames.append(f"{norm_path(f.group(2))}:{f.group(1) or '<anon>'}")
+        if frames:
+            return m.group(1), frames[::-1], m.group(2)  # innermost last, as in Python
+    return None, [], ''
+
+
+def _exit_name(code):
+    if code is None:
+        return 'exit ?'
+    if code < 0:
+        try:
+            return f"signal {signal.Signals(-code).name}"
+        except ValueError:
+            return f"signal {-code}"
+    return f"exit {code}"
+
+
+def fingerprint(text, code=None):
+    """(sig, exc_type, frames, message) for a crash's log tail"""
+    lines = text.splitlines()
+    exc, frames, msg = None, [], ''
+    if any(ln.startswith(_PY_TB) for ln in lines):
+        exc, frames, msg = _python(lines)
+    if not exc:
+        exc, frames, msg = _node(lines)
+    if not exc:
+        exc = _exit_name(code)  # no traceback: group by how it died
+        msg = next((ln.strip() for ln in reversed(lines) if ln.strip() and not ln.startswith('────')), '')
+    frames = frames[-MAX_FRAMES:]
+    key = exc + '|' + ' > '.join(frames)
+    return hashlib.sha1(key.encode()).hexdigest()[:12], exc, ' > '.join(frames), norm_msg(msg)
+
+
+# ═══════════════════════════════════════════
+#  RECORD
+# ═══════════════════════════════════════════
+def record(bid, uid, text, code=None):
+    """Fingerprint one crash and count it -> sig"""
+    try:
+        sig, exc, frames, msg = fingerprint(text[-CRASH_TAIL:], code)
+        db.record_crash(bid, uid, sig, exc, frames, msg, code)
+        return sig
+    except Exception as e:
+        logger.error(f"Crash record failed for #{bid}: {e}")
+        return None
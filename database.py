@@ -5,50 +5,389 @@
 ╚═══════════════════════════════════════════╝
 """
 
+import time
 import sqlite3
 import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from config import DB_PATH, PLAN_LIMITS, OWNER_ID, admin_ids, logger
 
 
-class DB:
-    _lock = threading.Lock()
+class TimedLock:
+    """Mutex that records how long callers wait to acquire it"""
 
     def __init__(self):
-        self.path = DB_PATH
+        self._lock = threading.Lock()
+        self._stat_lock = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            waited = 0.0
+        else:
+            t = time.perf_counter()
+            self._lock.acquire()
+            waited = time.perf_counter() - t
+        with self._stat_lock:
+            self.acquired += 1
+            if waited:
+                self.contended += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def stats(self):
+        with self._stat_lock:
+            n = self.acquired or 1
+            return {
+                'acquired': self.acquired,
+                'contended': self.contended,
+                'avg_wait_ms': round(self.wait_total / n * 1000, 3),
+                'max_wait_ms': round(self.wait_max * 1000, 2),
+            }
+
+
+_MISS = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, maxsize=5000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.gen = 0  # bumped by clear(); pop/patch bump only their key's count
+        self._kgen = {}
+        self._d = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k):
+        with self._lock:
+            e = self._d.get(k)
+            if e is not None:
+                if e[0] > time.monotonic():
+                    self._d.move_to_end(k)
+                    self.hits += 1
+                    return e[1]
+                del self._d[k]
+            self.misses += 1
+            return _MISS
+
+    def token(self, k):
+        """Take before reading the source; put() drops the value if k changed since"""
+        with self._lock:
+            return self.gen, self._kgen.get(k, 0)
+
+    def _bump(self, k):
+        self._kgen[k] = self._kgen.get(k, 0) + 1
+        if len(self._kgen) > self.maxsize * 4:  # bound it; one global bump covers the rest
+            self._kgen.clear()
+            self.gen += 1
+
+    def put(self, k, v, tok):
+        """Store unless k was invalidated or written since the read began"""
+        with self._lock:
+            if tok != (self.gen, self._kgen.get(k, 0)):
+                return
+            self._d[k] = (time.monotonic() + self.ttl, v)
+            self._d.move_to_end(k)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+
+    def patch(self, k, fields):
+        """Merge fields into a cached entry (if any) after a write; fills of k
+        that read before the write are dropped, other keys' fills are not"""
+        with self._lock:
+            self._bump(k)
+            e = self._d.get(k)
+            if e is not None:
+                self._d[k] = (e[0], {**e[1], **fields})
+
+    def pop(self, k):
+        with self._lock:
+            self._bump(k)
+            self._d.pop(k, None)
+
+    def clear(self):
+        with self._lock:
+            self.gen += 1
+            self._d.clear()
+
+    def stats(self):
+        with self._lock:
+            n = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._d),
+                    'rate': round(self.hits / n * 100, 1) if n else 0.0}
+
+
+# Shared with HOT_QUERIES so /explain audits the exact SQL the methods run
+_Q_TOP_CRASHES = """SELECT s.*, (SELECT COUNT(DISTINCT bot_id) FROM crash_records r
+    WHERE r.sig=s.sig) as bots FROM crash_sigs s ORDER BY count DESC LIMIT ?"""
+_Q_LAST_CRASH = """SELECT s.sig, s.exc_type, s.count FROM crash_records r
+    JOIN crash_sigs s ON s.sig=r.sig WHERE r.bot_id=? ORDER BY r.id DESC LIMIT 1"""
+
+
+class DB:
+    # WAL lets readers run alongside the writer, so SELECTs take no lock
+    # and only writes serialize (SQLite allows one writer at a time anyway).
+    _wlock = TimedLock()
+
+    # Write-behind: hot, idempotent updates coalesced per row
+    FLUSH_MS = 500     # flush at least this often
+    FLUSH_ROWS = 200   # ...or as soon as this many rows are pending
+    _KEYS = {'users': 'user_id', 'bots': 'bot_id'}
+
+    # Connection pool: one long-lived connection per worker thread
+    HEALTH_INTERVAL = 60  # seconds idle before a connection is re-checked
+
+    # Stats snapshot: recomputed in the background, read for free
+    STATS_INTERVAL = 60  # full recompute at least this often
+    STATS_DEBOUNCE = 2   # seconds to coalesce a burst of invalidations
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        self._local = threading.local()
+        self._pool = {}  # thread ident -> connection
+        self._pool_lock = threading.Lock()
+        self._tallies = {}   # thread ident -> [reads]; each thread bumps only its own
+        self._reads_gone = 0  # reads by threads that have exited
+        self._pending = {}   # (table, key) -> {col: val}
+        self._flushing = {}  # batch currently being written
+        self._pending_lock = threading.Lock()
+        self._flush_evt = threading.Event()
+        self._wb = {'deferred': 0, 'rows': 0, 'flushes': 0}
+        self._user_cache = TTLCache(maxsize=5000, ttl=60)
+        self._chan_cache = TTLCache(maxsize=4, ttl=300)
+        self._stats = None
+        self._stats_at = 0
+        self._stats_evt = threading.Event()
         self._init()
 
-    def _conn(self):
+    def _connect(self):
         c = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
         c.row_factory = sqlite3.Row
         c.execute("PRAGMA journal_mode=WAL")
         c.execute("PRAGMA busy_timeout=5000")
+        c.execute("PRAGMA synchronous=NORMAL")
         return c
 
-    def exe(self, q, p=(), fetch=False, one=False):
-        with self._lock:
-            c = self._conn()
-            cur = c.cursor()
+    def _conn(self):
+        """Per-thread connection — PRAGMAs run once, health-checked when idle"""
+        c = getattr(self._local, 'conn', None)
+        now = time.monotonic()
+        if c is not None and now - self._local.used > self.HEALTH_INTERVAL:
+            try:
+                c.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                self._drop()
+                c = None
+        if c is None:
+            c = self._connect()
+            self._local.conn = c
+            with self._pool_lock:
+                self._reap()
+                self._pool[threading.get_ident()] = c
+        self._local.used = now
+        return c
+
+    def _drop(self):
+        """Discard this thread's connection (reconnect on next use)"""
+        c = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        with self._pool_lock:
+            self._pool.pop(threading.get_ident(), None)
+        if c is not None:
             try:
-                cur.execute(q, p)
-                if fetch:
-                    r = [dict(x) for x in cur.fetchall()]
-                    c.close()
-                    return r
-                if one:
-                    x = cur.fetchone()
-                    c.close()
-                    return dict(x) if x else None
-                c.commit()
-                lid = cur.lastrowid
                 c.close()
-                return lid
+            except:
+                pass
+
+    def _reap(self):
+        """Close connections owned by threads that have exited"""
+        alive = {t.ident for t in threading.enumerate()}
+        for tid in [t for t in self._pool if t not in alive]:
+            try:
+                self._pool.pop(tid).close()
+            except:
+                pass
+        for tid in [t for t in self._tallies if t not in alive]:
+            self._reads_gone += self._tallies.pop(tid)[0]
+
+    def _tally(self):
+        """This thread's read counter, registered on first use"""
+        t = self._local.reads = [0]
+        with self._pool_lock:
+            old = self._tallies.get(threading.get_ident())
+            if old is not None:  # ident reused from an exited thread
+                self._reads_gone += old[0]
+            self._tallies[threading.get_ident()] = t
+        return t
+
+    def close_all(self):
+        with self._pool_lock:
+            for c in self._pool.values():
+                try:
+                    c.close()
+                except:
+                    pass
+            self._pool.clear()
+        self._local = threading.local()
+
+    def pool_size(self):
+        with self._pool_lock:
+            return len(self._pool)
+
+    def _run(self, q, p, fetch, one):
+        c = self._conn()
+        cur = c.execute(q, p)
+        if fetch:
+            return [dict(x) for x in cur.fetchall()]
+        if one:
+            x = cur.fetchone()
+            return dict(x) if x else None
+        c.commit()
+        return cur.lastrowid
+
+    def exe(self, q, p=(), fetch=False, one=False):
+        if fetch or one:
+            (getattr(self._local, 'reads', None) or self._tally())[0] += 1
+            return self._exe(q, p, fetch, one)
+        with self._wlock:
+            return self._exe(q, p, fetch, one)
+
+    def _exe(self, q, p, fetch, one):
+        for retry in (True, False):
+            try:
+                return self._run(q, p, fetch, one)
+            except sqlite3.Error as e:
+                if retry and self._broken(e):
+                    # Stale/closed connection → reconnect once and retry
+                    logger.warning(f"DB reconnect: {e}")
+                    self._drop()
+                    continue
+                self._rollback()
+                logger.error(f"DB Error: {e}")
+                return None
             except Exception as e:
-                c.close()
+                self._rollback()
                 logger.error(f"DB Error: {e}")
                 return None
 
+    def lock_stats(self):
+        """Writer-lock contention + lock-free read count"""
+        st = self._wlock.stats()
+        with self._pool_lock:
+            st['reads'] = self._reads_gone + sum(t[0] for t in self._tallies.values())
+        st['conns'] = self.pool_size()
+        return st
+
+    @staticmethod
+    def _broken(e):
+        m = str(e).lower()
+        return any(x in m for x in ('closed', 'disk i/o', 'unable to open', 'not a database'))
+
+    def _rollback(self):
+        c = getattr(self._local, 'conn', None)
+        if c is not None:
+            try:
+                c.rollback()
+            except:
+                self._drop()
+
+    # ════════════════════════════════
+    #  WRITE-BEHIND QUEUE
+    # ════════════════════════════════
+    def _defer(self, table, key, kw):
+        if not kw:
+            return
+        with self._pending_lock:
+            self._pending.setdefault((table, key), {}).update(kw)
+            self._wb['deferred'] += 1
+            n = len(self._pending)
+        if n >= self.FLUSH_ROWS:
+            self._flush_evt.set()
+
+    def _overlay(self, table, row):
+        """Apply not-yet-flushed values so callers read their own writes"""
+        if row:
+            k = (table, row[self._KEYS[table]])
+            with self._pending_lock:
+                for src in (self._flushing, self._pending):
+                    if k in src:
+                        row.update(src[k])
+        return row
+
+    def _forget(self, table, key, cols):
+        """A direct update supersedes queued values for the same columns"""
+        with self._pending_lock:
+            p = self._pending.get((table, key))
+            if p:
+                for c in cols:
+                    p.pop(c, None)
+                if not p:
+                    del self._pending[(table, key)]
+
+    def flush(self):
+        """Write all queued updates in one transaction"""
+        with self._wlock:
+            with self._pending_lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+            try:
+                c = self._conn()
+                for (table, key), kw in batch.items():
+                    c.execute(f"UPDATE {table} SET {','.join(f'{k}=?' for k in kw)} WHERE {self._KEYS[table]}=?",
+                              list(kw.values()) + [key])
+                c.commit()
+                for (table, key), kw in batch.items():
+                    if table == 'users':
+                        # the row now holds what was queued: patch the cached copy, and
+                        # drop in-flight fills of this user that read before the commit
+                        self._user_cache.patch(key, kw)
+                self._wb['rows'] += len(batch)
+                self._wb['flushes'] += 1
+            except Exception as e:
+                self._rollback()
+                logger.error(f"DB flush error: {e}")
+                # Re-queue, keeping anything newer that arrived meanwhile
+                with self._pending_lock:
+                    for k, kw in batch.items():
+                        kw.update(self._pending.get(k, {}))
+                        self._pending[k] = kw
+                return 0
+            finally:
+                with self._pending_lock:
+                    self._flushing = {}
+            return len(batch)
+
+    def flush_loop(self):
+        """Background write-behind flusher"""
+        while True:
+            self._flush_evt.wait(self.FLUSH_MS / 1000)
+            self._flush_evt.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Flush loop error: {e}")
+
+    def cache_stats(self):
+        return {'users': self._user_cache.stats(), 'channels': self._chan_cache.stats()}
+
+    def wb_stats(self):
+        with self._pending_lock:
+            return dict(self._wb, pending=len(self._pending))
+
     def _init(self):
         self.exe("""CREATE TABLE IF NOT EXISTS users(
             user_id INTEGER PRIMARY KEY,
@@ -173,26 +512,124 @@ class DB:
             created_at TEXT DEFAULT(datetime('now'))
         )""")
 
+        self._migrate()
         logger.info("✅ All DB tables ready")
 
+    # ════════════════════════════════
+    #  SCHEMA MIGRATIONS
+    # ════════════════════════════════
+    def _migrate(self):
+        """Apply pending MIGRATIONS in order, each in its own transaction; raises on failure"""
+        self.exe("""CREATE TABLE IF NOT EXISTS schema_version(
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT(datetime('now'))
+        )""")
+        cur = self.schema_version()
+        for ver, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if ver <= cur:
+                continue
+            t = time.perf_counter()
+            with self._wlock:
+                c = self._conn()
+                try:
+                    c.execute("BEGIN")
+                    fn(self, c)
+                    c.execute("INSERT INTO schema_version(version,name) VALUES(?,?)", (ver, name))
+                    c.commit()
+                except Exception as e:
+                    self._rollback()
+                    # later migrations and queries assume this one; don't run half-migrated
+                    logger.critical(f"❌ Migration {ver} ({name}) failed, refusing to start: {e}")
+                    raise
+            logger.info(f"🔧 Migration {ver}: {name} ({(time.perf_counter() - t) * 1000:.0f}ms)")
+
+    def schema_version(self):
+        return (self.exe("SELECT MAX(version) as v FROM schema_version", one=True) or {}).get('v') or 0
+
+    def explain(self):
+        """EXPLAIN QUERY PLAN for every HOT_QUERIES entry → [(name, plan, flagged)]"""
+        out = []
+        for name, (q, p) in HOT_QUERIES.items():
+            rows = self.exe(f"EXPLAIN QUERY PLAN {q}", p, fetch=True)
+            if rows is None:
+                out.append((name, ['error'], True))
+                continue
+            plan = [r['detail'] for r in rows]
+            # Full scans are "SCAN t" / "SCAN TABLE t"; "SCAN t USING INDEX" is an ordered index walk
+            bad = any((d.startswith('SCAN') and 'USING' not in d) or 'TEMP B-TREE' in d for d in plan)
+            out.append((name, plan, bad))
+        return out
+
+    @staticmethod
+    def _add_column(c, table, col, decl):
+        if col not in {r[1] for r in c.execute(f"PRAGMA table_info({table})")}:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl}")
+
     # ════════════════════════════════
     #  USERS
     # ════════════════════════════════
     def get_user(self, uid):
-        return self.exe("SELECT * FROM users WHERE user_id=?", (uid,), one=True)
+        u = self._user_cache.get(uid)
+        if u is _MISS:
+            g = self._user_cache.token(uid)
+            u = self.exe("SELECT * FROM users WHERE user_id=?", (uid,), one=True)
+            if u:
+                self._user_cache.put(uid, u, g)
+        return self._overlay('users', dict(u)) if u else None
 
     def create_user(self, uid, un='', fn='', rc='', rb=None):
         self.exe("INSERT OR IGNORE INTO users(user_id,username,full_name,referral_code,referred_by) VALUES(?,?,?,?,?)",
                  (uid, un, fn, rc, rb))
+        self._user_cache.pop(uid)
+        self._stats_dirty()
 
     def update_user(self, uid, **kw):
         if not kw:
             return
+        self._forget('users', uid, kw)
         self.exe(f"UPDATE users SET {','.join(f'{k}=?' for k in kw)} WHERE user_id=?",
                  list(kw.values()) + [uid])
+        self._user_cache.pop(uid)
+
+    def update_user_later(self, uid, **kw):
+        """Queued update for low-value fields (last_active, names)"""
+        self._defer('users', uid, kw)
+
+    def iter_users(self, cols='user_id', where='', params=(), after=None, batch=500):
+        """Stream users in user_id order — one keyset page in memory at a time"""
+        if 'user_id' not in [c.strip() for c in cols.split(',')]:
+            cols = f"user_id,{cols}"
+        cond = f"AND ({where})" if where else ""
+        last = after
+        while True:
+            if last is None:
+                rows = self.exe(f"SELECT {cols} FROM users WHERE 1 {cond} ORDER BY user_id LIMIT ?",
+                                (*params, batch), fetch=True) or []
+            else:
+                rows = self.exe(f"SELECT {cols} FROM users WHERE user_id>? {cond} ORDER BY user_id LIMIT ?",
+                                (last, *params, batch), fetch=True) or []
+            yield from rows
+            if len(rows) < batch:
+                return
+            last = rows[-1]['user_id']
+
+    def users_page(self, after=None, before=None, lim=25):
+        """Admin list page → (rows, has_prev, has_next)"""
+        cols = "user_id,full_name,plan,is_banned"
+        if before is not None:
+            rows = self.exe(f"SELECT {cols} FROM users WHERE user_id<? ORDER BY user_id DESC LIMIT ?",
+                            (before, lim + 1), fetch=True) or []
+            return rows[:lim][::-1], len(rows) > lim, True
+        if after is None:
+            rows = self.exe(f"SELECT {cols} FROM users ORDER BY user_id LIMIT ?", (lim + 1,), fetch=True) or []
+        else:
+            rows = self.exe(f"SELECT {cols} FROM users WHERE user_id>? ORDER BY user_id LIMIT ?",
+                            (after, lim + 1), fetch=True) or []
+        return rows[:lim], after is not None, len(rows) > lim
 
-    def get_all_users(self):
-        return self.exe("SELECT * FROM users", fetch=True) or []
+    def user_count(self):
+        return (self.exe("SELECT COUNT(*) as c FROM users", one=True) or {}).get('c', 0)
 
     def ban(self, uid, r=''):
         self.update_user(uid, is_banned=1, ban_reason=r)
@@ -206,9 +643,11 @@ class DB:
         else:
             self.update_user(uid, plan=plan, is_lifetime=0,
                              subscription_end=(datetime.now() + timedelta(days=days)).isoformat())
+        self._stats_dirty()
 
     def rem_sub(self, uid):
         self.update_user(uid, plan='free', is_lifetime=0, subscription_end=None)
+        self._stats_dirty()
 
     def is_active(self, uid):
         u = self.get_user(uid)
@@ -235,35 +674,104 @@ class DB:
     #  BOTS
     # ════════════════════════════════
     def add_bot(self, uid, name, path, entry='main.py', ft='py', tok='', sz=0, conf=''):
-        return self.exe(
+        bid = self.exe(
             "INSERT INTO bots(user_id,bot_name,file_path,entry_file,file_type,bot_token,file_size,detection_confidence) VALUES(?,?,?,?,?,?,?,?)",
             (uid, name, path, entry, ft, tok, sz, conf))
+        self._stats_dirty()
+        return bid
 
     def get_bots(self, uid):
-        return self.exe("SELECT * FROM bots WHERE user_id=?", (uid,), fetch=True) or []
+        return [self._overlay('bots', b) for b in
+                self.exe("SELECT * FROM bots WHERE user_id=?", (uid,), fetch=True) or []]
 
     def get_bot(self, bid):
-        return self.exe("SELECT * FROM bots WHERE bot_id=?", (bid,), one=True)
+        return self._overlay('bots', self.exe("SELECT * FROM bots WHERE bot_id=?", (bid,), one=True))
 
     def update_bot(self, bid, **kw):
         if not kw:
             return
+        self._forget('bots', bid, kw)
         self.exe(f"UPDATE bots SET {','.join(f'{k}=?' for k in kw)} WHERE bot_id=?",
                  list(kw.values()) + [bid])
 
+    def update_bot_later(self, bid, **kw):
+        """Queued update for runner/monitor bookkeeping"""
+        self._defer('bots', bid, kw)
+
+    def bots_with_status(self, st):
+        return [self._overlay('bots', b) for b in
+                self.exe("SELECT * FROM bots WHERE status=?", (st,), fetch=True) or []]
+
+    def note_restart(self, bid):
+        self.exe("UPDATE bots SET restarts_today=restarts_today+1,total_restarts=total_restarts+1 WHERE bot_id=?",
+                 (bid,))
+
+    def note_deps(self, bid, hit, secs=None):
+        """Count a dependency cache hit/miss; secs = last real install time"""
+        col = 'dep_hits' if hit else 'dep_misses'
+        if secs is None:
+            self.exe(f"UPDATE bots SET {col}={col}+1 WHERE bot_id=?", (bid,))
+        else:
+            self.exe(f"UPDATE bots SET {col}={col}+1,dep_secs=? WHERE bot_id=?", (round(secs, 1), bid))
+
+    def reset_restarts_today(self):
+        self.exe("UPDATE bots SET restarts_today=0 WHERE restarts_today>0")
+
     def del_bot(self, bid):
         self.exe("DELETE FROM bots WHERE bot_id=?", (bid,))
+        self._stats_dirty()
 
     def bot_count(self, uid):
         return (self.exe("SELECT COUNT(*) as c FROM bots WHERE user_id=?", (uid,), one=True) or {}).get('c', 0)
 
+    # ════════════════════════════════
+    #  CRASHES
+    # ════════════════════════════════
+    def record_crash(self, bid, uid, sig, exc, frames, msg, code=None):
+        self.exe("""INSERT INTO crash_sigs(sig,exc_type,frames,sample,count,last_bot)
+            VALUES(?,?,?,?,1,?)
+            ON CONFLICT(sig) DO UPDATE SET count=count+1,last_seen=datetime('now'),
+                sample=excluded.sample,last_bot=excluded.last_bot""",
+                 (sig, exc, frames, msg, bid))
+        self.exe("INSERT INTO crash_records(bot_id,user_id,sig,exit_code) VALUES(?,?,?,?)",
+                 (bid, uid, sig, code))
+
+    def top_crashes(self, lim=10):
+        """Most frequent signatures, with how many distinct bots hit each"""
+        return self.exe(_Q_TOP_CRASHES, (lim,), fetch=True) or []
+
+    def crash_sig(self, sig):
+        return self.exe("SELECT * FROM crash_sigs WHERE sig=?", (sig,), one=True)
+
+    def crash_bots(self, sig, lim=10):
+        return self.exe("""SELECT bot_id, user_id, COUNT(*) as n, MAX(created_at) as last
+            FROM crash_records WHERE sig=? GROUP BY bot_id ORDER BY n DESC LIMIT ?""",
+                        (sig, lim), fetch=True) or []
+
+    def last_crash(self, bid):
+        return self.exe(_Q_LAST_CRASH, (bid,), one=True)
+
+    def note_fix(self, rule, col):
+        """Bump one autofix counter: matched / fixed / succeeded / failed"""
+        self.exe(f"""INSERT INTO autofix_stats(rule,{col}) VALUES(?,1)
+            ON CONFLICT(rule) DO UPDATE SET {col}={col}+1""", (rule,))
+
+    def fix_stats(self):
+        return self.exe("SELECT * FROM autofix_stats ORDER BY matched DESC", fetch=True) or []
+
+    def prune_crashes(self, days=30):
+        self.exe("DELETE FROM crash_records WHERE created_at<datetime('now',?)", (f"-{days} days",))
+        self.exe("DELETE FROM crash_sigs WHERE last_seen<datetime('now',?)", (f"-{days} days",))
+
     # ════════════════════════════════
     #  PAYMENTS
     # ════════════════════════════════
     def add_pay(self, uid, amt, method, trx, plan, days=30):
-        return self.exe(
+        pid = self.exe(
             "INSERT INTO payments(user_id,amount,method,transaction_id,plan,duration_days) VALUES(?,?,?,?,?,?)",
             (uid, amt, method, trx, plan, days))
+        self._stats_dirty()
+        return pid
 
     def pending_pay(self):
         return self.exe("SELECT * FROM payments WHERE status='pending' ORDER BY created_at DESC", fetch=True) or []
@@ -283,6 +791,7 @@ class DB:
     def reject_pay(self, pid, aid):
         self.exe("UPDATE payments SET status='rejected',approved_by=?,processed_at=datetime('now') WHERE payment_id=?",
                  (aid, pid))
+        self._stats_dirty()
 
     # ════════════════════════════════
     #  REFERRALS
@@ -313,6 +822,7 @@ class DB:
             self.exe("UPDATE users SET wallet_balance=wallet_balance+? WHERE user_id=?", (amt, uid))
         elif tt in ('debit', 'withdraw', 'purchase'):
             self.exe("UPDATE users SET wallet_balance=wallet_balance-? WHERE user_id=?", (amt, uid))
+        self._user_cache.pop(uid)
 
     def wallet_hist(self, uid, lim=20):
         return self.exe("SELECT * FROM wallet_tx WHERE user_id=? ORDER BY created_at DESC LIMIT ?",
@@ -327,16 +837,26 @@ class DB:
         if ex:
             self.exe("UPDATE force_channels SET is_active=1,channel_name=? WHERE channel_username=?",
                      (name or username, username))
-            return ex['channel_id']
-        return self.exe("INSERT INTO force_channels(channel_username,channel_name,added_by) VALUES(?,?,?)",
-                        (username, name or username, added_by))
+            cid = ex['channel_id']
+        else:
+            cid = self.exe("INSERT INTO force_channels(channel_username,channel_name,added_by) VALUES(?,?,?)",
+                           (username, name or username, added_by))
+        self._chan_cache.clear()
+        return cid
 
     def remove_channel(self, username):
         self.exe("UPDATE force_channels SET is_active=0 WHERE channel_username=?",
                  (username.strip().lstrip('@').lower(),))
+        self._chan_cache.clear()
 
     def get_active_channels(self):
-        return self.exe("SELECT * FROM force_channels WHERE is_active=1", fetch=True) or []
+        chs = self._chan_cache.get('active')
+        if chs is _MISS:
+            g = self._chan_cache.token('active')
+            chs = self.exe("SELECT * FROM force_channels WHERE is_active=1", fetch=True)
+            if chs is not None:
+                self._chan_cache.put('active', chs, g)
+        return [dict(c) for c in chs or []]
 
     def get_all_channels(self):
         return self.exe("SELECT * FROM force_channels ORDER BY is_active DESC", fetch=True) or []
@@ -346,11 +866,13 @@ class DB:
         if ch:
             ns = 0 if ch['is_active'] else 1
             self.exe("UPDATE force_channels SET is_active=? WHERE channel_id=?", (ns, cid))
+            self._chan_cache.clear()
             return ns
         return None
 
     def delete_channel(self, cid):
         self.exe("DELETE FROM force_channels WHERE channel_id=?", (cid,))
+        self._chan_cache.clear()
 
     # ════════════════════════════════
     #  TICKETS
@@ -388,17 +910,220 @@ class DB:
         self.exe("INSERT INTO admin_logs(admin_id,action,target_user,details) VALUES(?,?,?,?)",
                  (aid, act, tgt, det))
 
+    # ════════════════════════════════
+    #  BROADCASTS
+    # ════════════════════════════════
+    def add_broadcast(self, aid, text, total):
+        return self.exe("INSERT INTO broadcasts(admin_id,text,total) VALUES(?,?,?)", (aid, text, total))
+
+    def get_broadcast(self, bc_id):
+        return self.exe("SELECT * FROM broadcasts WHERE bc_id=?", (bc_id,), one=True)
+
+    def update_broadcast(self, bc_id, **kw):
+        if not kw:
+            return
+        self.exe(f"UPDATE broadcasts SET {','.join(f'{k}=?' for k in kw)} WHERE bc_id=?",
+                 list(kw.values()) + [bc_id])
+
+    def running_broadcasts(self):
+        return self.exe("SELECT * FROM broadcasts WHERE status='running'", fetch=True) or []
+
+    def count_targets(self):
+        return (self.exe("SELECT COUNT(*) as c FROM users WHERE is_blocked=0", one=True) or {}).get('c', 0)
+
     # ════════════════════════════════
     #  STATS
     # ════════════════════════════════
+    def compute_stats(self):
+        """One scan per table, one round trip"""
+        s = self.exe("""SELECT * FROM
+            (SELECT COUNT(*) as users,
+                    COALESCE(SUM(date(created_at)=date('now')),0) as today,
+                    COALESCE(SUM(plan!='free' AND(is_lifetime=1 OR subscription_end>datetime('now'))),0) as active_subs
+             FROM users),
+            (SELECT COUNT(*) as bots FROM bots),
+            (SELECT COALESCE(SUM(status='pending'),0) as pending,
+                    COALESCE(SUM(CASE WHEN status='approved' THEN amount END),0) as revenue
+             FROM payments)""", one=True) or {}
+        return {k: s.get(k, 0) for k in ('users', 'bots', 'pending', 'revenue', 'today', 'active_subs')}
+
+    def refresh_stats(self):
+        s = self.compute_stats()
+        self._stats, self._stats_at = s, time.time()
+        return s
+
     def stats(self):
-        tu = (self.exe("SELECT COUNT(*) as c FROM users", one=True) or {}).get('c', 0)
-        tb = (self.exe("SELECT COUNT(*) as c FROM bots", one=True) or {}).get('c', 0)
-        pp = (self.exe("SELECT COUNT(*) as c FROM payments WHERE status='pending'", one=True) or {}).get('c', 0)
-        rv = (self.exe("SELECT COALESCE(SUM(amount),0) as s FROM payments WHERE status='approved'", one=True) or {}).get('s', 0)
-        td = (self.exe("SELECT COUNT(*) as c FROM users WHERE date(created_at)=date('now')", one=True) or {}).get('c', 0)
-        ac = (self.exe("SELECT COUNT(*) as c FROM users WHERE plan!='free' AND(is_lifetime=1 OR subscription_end>datetime('now'))", one=True) or {}).get('c', 0)
-        return {'users': tu, 'bots': tb, 'pending': pp, 'revenue': rv, 'today': td, 'active_subs': ac}
+        """Latest snapshot; only the very first call hits the DB"""
+        s = self._stats or self.refresh_stats()
+        return dict(s)
+
+    def stats_age(self):
+        return int(time.time() - self._stats_at) if self._stats_at else None
+
+    def _stats_dirty(self):
+        self._stats_evt.set()
+
+    def stats_loop(self):
+        """Background snapshot refresher"""
+        while True:
+            if self._stats_evt.wait(self.STATS_INTERVAL):
+                time.sleep(self.STATS_DEBOUNCE)
+            self._stats_evt.clear()
+            try:
+                self.refresh_stats()
+            except Exception as e:
+                logger.error(f"Stats loop error: {e}")
+
+
+# ═══════════════════════════════════════════
+#  MIGRATIONS — append only, never renumber
+# ═══════════════════════════════════════════
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def deco(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return deco
+
+
+@migration(1, "users.is_blocked (broadcast skip-list)")
+def _m_user_blocked(d, c):
+    d._add_column(c, 'users', 'is_blocked', 'INTEGER DEFAULT 0')
+
+
+@migration(2, "backfill missing/short referral codes")
+def _m_referral_codes(d, c):
+    from utils import gen_ref_code
+    c.create_function('gen_ref_code', 1, gen_ref_code, deterministic=True)
+    n = c.execute("UPDATE users SET referral_code=gen_ref_code(user_id) "
+                  "WHERE referral_code IS NULL OR length(referral_code)<5").rowcount
+    if n:
+        logger.info(f"🔧 Fixed {n} referral codes")
+
+
+# Secondary indexes for the hot lookups (users.referral_code is already
+# covered by its UNIQUE constraint's automatic index)
+INDEXES = [
+    ('idx_bots_user', 'bots', 'user_id'),
+    ('idx_refs_referrer', 'referrals', 'referrer_id'),
+    ('idx_wallet_user_time', 'wallet_tx', 'user_id, created_at'),
+    ('idx_notif_user_time', 'notifications', 'user_id, created_at'),
+    ('idx_notif_user_unread', 'notifications', 'user_id, is_read'),
+    ('idx_pay_status_time', 'payments', 'status, created_at'),
+    ('idx_pay_user_time', 'payments', 'user_id, created_at'),
+    ('idx_tickets_status_time', 'tickets', 'status, created_at'),
+    ('idx_users_sub_end', 'users', 'subscription_end'),
+    ('idx_users_refcount', 'users', 'referral_count'),
+]
+
+
+@migration(3, "secondary indexes for hot queries")
+def _m_indexes(d, c):
+    for name, table, cols in INDEXES:
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({cols})")
+    c.execute("ANALYZE")
+
+
+@migration(4, "bots.ready_probe (startup readiness signal)")
+def _m_ready_probe(d, c):
+    d._add_column(c, 'bots', 'ready_probe', "TEXT DEFAULT ''")
+
+
+@migration(5, "bots.deps_hash (skip installs on warm restore)")
+def _m_deps_hash(d, c):
+    d._add_column(c, 'bots', 'deps_hash', "TEXT DEFAULT ''")
+
+
+@migration(6, "bots.dep_hits/dep_misses/dep_secs (dependency cache stats)")
+def _m_dep_stats(d, c):
+    d._add_column(c, 'bots', 'dep_hits', 'INTEGER DEFAULT 0')
+    d._add_column(c, 'bots', 'dep_misses', 'INTEGER DEFAULT 0')
+    d._add_column(c, 'bots', 'dep_secs', 'REAL DEFAULT 0')
+
+
+@migration(7, "crash_sigs + crash_records (crash fingerprints)")
+def _m_crashes(d, c):
+    c.execute("""CREATE TABLE IF NOT EXISTS crash_sigs(
+        sig TEXT PRIMARY KEY,
+        exc_type TEXT NOT NULL,
+        frames TEXT DEFAULT '',
+        sample TEXT DEFAULT '',
+        count INTEGER DEFAULT 0,
+        last_bot INTEGER,
+        first_seen TEXT DEFAULT(datetime('now')),
+        last_seen TEXT DEFAULT(datetime('now'))
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS crash_records(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bot_id INTEGER NOT NULL,
+        user_id INTEGER,
+        sig TEXT NOT NULL,
+        exit_code INTEGER,
+        created_at TEXT DEFAULT(datetime('now'))
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_crash_sigs_count ON crash_sigs(count)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_crash_rec_sig ON crash_records(sig, bot_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_crash_rec_bot ON crash_records(bot_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_crash_rec_time ON crash_records(created_at)")
+
+
+@migration(8, "autofix_stats (per-rule remediation outcomes)")
+def _m_autofix(d, c):
+    c.execute("""CREATE TABLE IF NOT EXISTS autofix_stats(
+        rule TEXT PRIMARY KEY,
+        matched INTEGER DEFAULT 0,
+        fixed INTEGER DEFAULT 0,
+        succeeded INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0
+    )""")
+
+
+@migration(9, "bots.deps/framework (upload-time import scan)")
+def _m_bot_scan(d, c):
+    d._add_column(c, 'bots', 'deps', "TEXT DEFAULT ''")
+    d._add_column(c, 'bots', 'framework', "TEXT DEFAULT ''")
+
+
+@migration(10, "broadcasts (resumable broadcast checkpoints)")
+def _m_broadcasts(d, c):
+    c.execute("""CREATE TABLE IF NOT EXISTS broadcasts(
+        bc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT DEFAULT 'running',
+        last_uid INTEGER DEFAULT 0,
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        blocked INTEGER DEFAULT 0,
+        status_chat INTEGER,
+        status_msg INTEGER,
+        created_at TEXT DEFAULT(datetime('now')),
+        finished_at TEXT
+    )""")
+
+
+# Queries on the per-message / per-screen / background paths — audited by /explain
+HOT_QUERIES = {
+    'get_user': ("SELECT * FROM users WHERE user_id=?", (0,)),
+    'ref_code_lookup': ("SELECT user_id FROM users WHERE referral_code=?", ('',)),
+    'get_bots': ("SELECT * FROM bots WHERE user_id=?", (0,)),
+    'bot_count': ("SELECT COUNT(*) as c FROM bots WHERE user_id=?", (0,)),
+    'user_refs': ("SELECT * FROM referrals WHERE referrer_id=?", (0,)),
+    'wallet_hist': ("SELECT * FROM wallet_tx WHERE user_id=? ORDER BY created_at DESC LIMIT ?", (0, 20)),
+    'get_notifs': ("SELECT * FROM notifications WHERE user_id=? ORDER BY created_at DESC LIMIT ?", (0, 10)),
+    'unread_count': ("SELECT COUNT(*) as c FROM notifications WHERE user_id=? AND is_read=0", (0,)),
+    'pending_pay': ("SELECT * FROM payments WHERE status='pending' ORDER BY created_at DESC", ()),
+    'pay_history': ("SELECT * FROM payments WHERE user_id=? ORDER BY created_at DESC LIMIT 10", (0,)),
+    'open_tickets': ("SELECT * FROM tickets WHERE status='open' ORDER BY created_at DESC", ()),
+    'expiry_scan': ("SELECT * FROM users WHERE subscription_end<=? AND is_lifetime=0 AND plan!='free'", ('',)),
+    'ref_board': ("SELECT * FROM users ORDER BY referral_count DESC LIMIT ?", (10,)),
+    'users_page': ("SELECT user_id,full_name,plan,is_banned FROM users WHERE user_id>? ORDER BY user_id LIMIT ?", (0, 26)),
+    'top_crashes': (_Q_TOP_CRASHES, (10,)),
+    'last_crash': (_Q_LAST_CRASH, (0,)),
+}
 
 
 # Global instance
@@ -0,0 +1,368 @@
+"""
+╔═══════════════════════════════════════════╗
+║  deps.py — Dependency Manager             ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Installs a bot's requirements through a shared local wheelhouse, and
+skips the install entirely when its manifests hash hasn't changed since
+the last successful one. Tracks hit/miss and install time per bot.
+
+Python bots with requirements get their own venv, keyed by that hash
+(bots with the same requirements share one); bots without any run on the
+panel's interpreter as before. Files in every venv's site-packages are
+hardlinked into a content store, so each distinct file is on disk once.
+
+Single-file bots share their user's folder, so packages added for one of
+them go to its own list (.reqs/<bot_id>.txt) rather than the folder's
+requirements.txt, which every bot in that folder would pick up.
+"""
+
+import os
+import sys
+import time
+import venv
+import shutil
+import hashlib
+import threading
+import subprocess
+
+from config import WHEEL_DIR, VENV_DIR, BOT_VENVS, VENV_KEEP_DAYS, logger
+from database import db
+from utils import safe_send, report_error, user_folder
+
+_lock = threading.Lock()
+_st = {'none': 0, 'skip': 0, 'wheel_hit': 0, 'wheel_miss': 0, 'fallback': 0, 'failed': 0, 'secs': 0.0}
+HIT = ('skip', 'wheel_hit')  # 'none' (nothing to install) is neither hit nor miss
+PY_TAG = f"cp{sys.version_info[0]}{sys.version_info[1]}"
+_venv_locks = {}
+
+
+# ═══════════════════════════════════════════
+#  MANIFEST HASH
+# ═══════════════════════════════════════════
+def _norm_req(data):
+    """requirements.txt minus comments, blanks, case and order"""
+    lines = set()
+    for ln in data.decode('utf-8', 'ignore').splitlines():
+        ln = ln.split('#', 1)[0].strip().lower()
+        if ln:
+            lines.add(ln)
+    return "\n".join(sorted(lines)).encode()
+
+
+def own_req(bd, wd):
+    """Where packages added for this bot go"""
+    if os.path.normpath(wd) == os.path.normpath(user_folder(bd['user_id'])):
+        return os.path.join(wd, '.reqs', f"{bd['bot_id']}.txt")
+    return os.path.join(wd, 'requirements.txt')
+
+
+def req_files(bd, wd):
+    """A bot's existing requirements files: its folder's, plus its own list if it shares the folder"""
+    files = [os.path.join(wd, 'requirements.txt'), own_req(bd, wd)]
+    return [p for n, p in enumerate(files) if os.path.isfile(p) and p not in files[:n]]
+
+
+def py_manifest(bd, wd):
+    """(requirements files, hash) for a Python bot; hash is '' without any"""
+    reqs = req_files(bd, wd)
+    return reqs, manifest_hash(wd, reqs) if reqs else ''
+
+
+def manifest_hash(d, reqs=None):
+    """Fingerprint of the dependency manifests; '' when there are none
+
+    reqs: requirements files to use instead of d/requirements.txt
+    """
+    if reqs is None:
+        reqs = [p for p in [os.path.join(d, 'requirements.txt')] if os.path.isfile(p)]
+    h = hashlib.sha256()
+    if reqs:
+        data = b''
+        for p in reqs:
+            with open(p, 'rb') as f:
+                data += f.read() + b'\n'
+        h.update(b'requirements.txt')
+        h.update(_norm_req(data))
+    found = bool(reqs)
+    for fn in ('package.json', 'package-lock.json'):
+        p = os.path.join(d, fn)
+        if os.path.isfile(p):
+            found = True
+            with open(p, 'rb') as f:
+                h.update(fn.encode())
+                h.update(f.read())
+    return h.hexdigest()[:16] if found else ''
+
+
+# ═══════════════════════════════════════════
+#  PIP VIA WHEELHOUSE
+# ═══════════════════════════════════════════
+def _pip(args, cwd=None, timeout=300, py=None):
+    target = ['--python', py] if py else []  # install into another env with the panel's pip
+    try:
+        r = subprocess.run([sys.executable, '-m', 'pip'] + target + args + ['--quiet', '--disable-pip-version-check'],
+                           capture_output=True, text=True, timeout=timeout, cwd=cwd)
+        return r.returncode == 0
+    except Exception as e:
+        report_error(e, f"pip {args[0]}")
+        return False
+
+
+def pip_via_wheelhouse(spec, cwd=None, py=None, wheels=WHEEL_DIR):
+    """spec: ['-r', path] or [pkg, ...] -> (ok, how); py = target interpreter
+
+    1. offline install from the wheelhouse (no index traffic at all)
+    2. miss: build/download the wheels into it, then install offline
+    3. last resort: plain pip install
+    """
+    offline = ['install', '--no-index', '--find-links', wheels] + spec
+    if _pip(offline, cwd, py=py):
+        return True, 'wheel_hit'
+    if _pip(['wheel', '--wheel-dir', wheels, '--find-links', wheels] + spec, cwd, timeout=600) \
+            and _pip(offline, cwd, py=py):
+        return True, 'wheel_miss'
+    if _pip(['install'] + spec, cwd, py=py):
+        return True, 'fallback'
+    return False, 'failed'
+
+
+def install_packages(pkgs):
+    """Into the panel's own environment, one pip run (bots use add_requirement)"""
+    t = time.time()
+    ok, how = pip_via_wheelhouse(list(pkgs))
+    _record(None, how, time.time() - t)
+    return ok
+
+
+def add_requirement(bd, wd, *pkgs):
+    """Append pkgs to the bot's own requirements, so its venv key changes with it"""
+    p = own_req(bd, wd)
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, 'a+', encoding='utf-8') as f:
+            f.seek(0)
+            body = f.read()
+            f.write(('' if not body or body.endswith('\n') else '\n') + ''.join(f"{x}\n" for x in pkgs))
+        return True
+    except OSError as e:
+        report_error(e, f"add_requirement({', '.join(pkgs)})")
+        return False
+
+
+def npm_add(wd, pkgs):
+    """npm install the given packages in one run"""
+    try:
+        r = subprocess.run(['npm', 'install', '--prefer-offline', '--no-audit', '--no-fund'] + list(pkgs),
+                           cwd=wd, capture_output=True, text=True, timeout=300)
+        return r.returncode == 0
+    except Exception as e:
+        report_error(e, "npm install")
+        return False
+
+
+def _npm(d):
+    try:
+        r = subprocess.run(['npm', 'install', '--production', '--prefer-offline', '--no-audit', '--no-fund'],
+                           capture_output=True, text=True, timeout=300, cwd=d)
+        return (True, 'fallback') if r.returncode == 0 else (False, 'failed')
+    except Exception as e:
+        report_error(e, "npm install")
+        return False, 'failed'
+
+
+# ═══════════════════════════════════════════
+#  PER-BOT VENVS
+# ═══════════════════════════════════════════
+def venv_key(h):
+    return f"{PY_TAG}-{h or 'none'}"
+
+
+def _venv_py(path):
+    return os.path.join(path, 'Scripts', 'python.exe') if os.name == 'nt' else os.path.join(path, 'bin', 'python')
+
+
+def _site_dirs(path):
+    for root in ('lib', 'Lib'):
+        base = os.path.join(path, root)
+        if os.path.isdir(base):
+            for d, _, _ in os.walk(base):
+                if d.endswith('site-packages'):
+                    yield d
+
+
+def dedupe(path, root=VENV_DIR):
+    """Hardlink every site-packages file into root/.store -> (files, bytes saved)"""
+    store = os.path.join(root, '.store')
+    n = saved = 0
+    for sp in _site_dirs(path):
+        for d, _, fs in os.walk(sp):
+            for fn in fs:
+                p = os.path.join(d, fn)
+                try:
+                    st = os.lstat(p)
+                    if not os.path.isfile(p) or os.path.islink(p) or st.st_nlink > 1:
+                        continue
+                    h = hashlib.sha256()
+                    with open(p, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1 << 20), b''):
+                            h.update(chunk)
+                    h = h.hexdigest()
+                    sp_ = os.path.join(store, h[:2], h)
+                    if os.path.exists(sp_):
+                        tmp = p + '.lnk'
+                        os.link(sp_, tmp)
+                        os.replace(tmp, p)
+                        saved += st.st_size
+                    else:
+                        os.makedirs(os.path.dirname(sp_), exist_ok=True)
+                        os.link(p, sp_)
+                    n += 1
+                except OSError:
+                    pass  # cross-device or vanished; leave the file as is
+    return n, saved
+
+
+def build_venv(key, wd, root=VENV_DIR, wheels=WHEEL_DIR, reqs=None):
+    """Create root/key with wd's requirements (or reqs) -> (path, ok, how); reuses a finished one"""
+    path = os.path.join(root, key)
+    with _lock:
+        lk = _venv_locks.setdefault(path, threading.Lock())
+    with lk:
+        if os.path.exists(os.path.join(path, '.ready')):
+            os.utime(path)  # last used, for prune_venvs
+            return path, True, 'skip'
+        shutil.rmtree(path, ignore_errors=True)  # half-built leftover
+        venv.EnvBuilder(with_pip=False, symlinks=os.name != 'nt').create(path)
+        if reqs is None:
+            reqs = [p for p in [os.path.join(wd, 'requirements.txt')] if os.path.isfile(p)]
+        ok, how = True, 'none'
+        if reqs:
+            spec = [a for p in reqs for a in ('-r', p)]
+            ok, how = pip_via_wheelhouse(spec, wd, py=_venv_py(path), wheels=wheels)
+        if ok:
+            n, saved = dedupe(path, root)
+            open(os.path.join(path, '.ready'), 'w').close()
+            logger.info(f"🐍 Venv {key}: {how}, {n} files, {saved // 1024}KB shared")
+        return path, ok, how
+
+
+def python_for(bd, wd):
+    """Interpreter for a Python bot: its venv's, or the panel's when it has no requirements"""
+    if not BOT_VENVS:
+        return sys.executable
+    _, h = py_manifest(bd, wd)
+    if not h:
+        return sys.executable  # keeps the panel's packages (telebot, requests) importable
+    py = _venv_py(os.path.join(VENV_DIR, venv_key(h)))
+    return py if os.path.exists(py) else sys.executable
+
+
+def prune_venvs(live_hashes, root=VENV_DIR):
+    """Drop venvs no bot uses (after VENV_KEEP_DAYS idle), then orphaned store files"""
+    keep = {venv_key(h) for h in live_hashes if h}
+    cutoff = time.time() - VENV_KEEP_DAYS * 86400
+    gone = 0
+    for name in os.listdir(root):
+        p = os.path.join(root, name)
+        if name.startswith('.') or name in keep or not os.path.isdir(p):
+            continue
+        try:
+            if os.path.getmtime(p) < cutoff:
+                shutil.rmtree(p, ignore_errors=True)
+                gone += 1
+        except OSError:
+            pass
+    store = os.path.join(root, '.store')
+    for d, _, fs in os.walk(store):
+        for fn in fs:
+            p = os.path.join(d, fn)
+            try:
+                if os.stat(p).st_nlink == 1:
+                    os.remove(p)
+            except OSError:
+                pass
+    if gone:
+        logger.info(f"🐍 Pruned {gone} unused venvs")
+    return gone
+
+
+# ═══════════════════════════════════════════
+#  PER-BOT ENTRY POINT
+# ═══════════════════════════════════════════
+def _record(bid, how, secs):
+    with _lock:
+        _st[how] += 1
+        _st['secs'] += secs
+    if bid and how != 'none':
+        db.note_deps(bid, how in HIT, None if how == 'skip' else secs)
+
+
+def ensure(bd, wd, ft, cid=None):
+    """Install a bot's deps unless its manifests are unchanged -> how"""
+    bid = bd['bot_id']
+    reqs, h = py_manifest(bd, wd) if ft == 'py' else (None, manifest_hash(wd))
+    if not h:
+        _record(bid, 'none', 0)
+        if bd.get('deps_hash'):
+            db.update_bot_later(bid, deps_hash='')  # requirements removed: let its venv be pruned
+        return 'none'
+    if ft == 'py' and BOT_VENVS:
+        return _ensure_venv(bid, h, wd, reqs, cid)
+    if h == (bd.get('deps_hash') or ''):
+        _record(bid, 'skip', 0)
+        return 'skip'
+    t = time.time()
+    if ft == 'py':
+        if not reqs:
+            ok, how = True, 'skip'
+        else:
+            if cid:
+                safe_send(cid, "📦 Installing requirements...")
+            ok, how = pip_via_wheelhouse([a for p in reqs for a in ('-r', p)], wd)
+    else:
+        if cid:
+            safe_send(cid, "📦 npm install...")
+        ok, how = _npm(wd)
+    secs = time.time() - t
+    _record(bid, how, secs)
+    if ok:
+        db.update_bot_later(bid, deps_hash=h)
+    logger.info(f"📦 Deps #{bid}: {how} in {secs:.1f}s")
+    return how
+
+
+def _ensure_venv(bid, h, wd, reqs, cid=None):
+    key = venv_key(h)
+    if cid and not os.path.exists(os.path.join(VENV_DIR, key, '.ready')):
+        safe_send(cid, "📦 Preparing environment...")
+    t = time.time()
+    try:
+        _, ok, how = build_venv(key, wd, reqs=reqs)
+    except Exception as e:
+        report_error(e, f"build_venv({key})")
+        ok, how = False, 'failed'
+    secs = time.time() - t
+    _record(bid, how, secs)
+    if ok:
+        db.update_bot_later(bid, deps_hash=h)
+    if how != 'skip':
+        logger.info(f"📦 Deps #{bid}: venv {how} in {secs:.1f}s")
+    return how
+
+
+def stats():
+    with _lock:
+        s = dict(_st)
+    n = sum(s[k] for k in ('skip', 'wheel_hit', 'wheel_miss', 'fallback', 'failed'))
+    s['rate'] = round((s['skip'] + s['wheel_hit']) / n * 100, 1) if n else 0.0
+    try:
+        s['wheels'] = len([f for f in os.listdir(WHEEL_DIR) if f.endswith('.whl')])
+    except OSError:
+        s['wheels'] = 0
+    try:
+        s['venvs'] = len([f for f in os.listdir(VENV_DIR) if not f.startswith('.')])
+    except OSError:
+        s['venvs'] = 0
+    return s
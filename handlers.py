@@ -9,10 +9,7 @@ import os
 import re
 import sys
 import time
-import shutil
 import zipfile
-import tempfile
-import threading
 from datetime import datetime
 from telebot import types
 
@@ -20,7 +17,7 @@ from config import (
     logger, OWNER_ID, admin_ids, PLAN_LIMITS, PAYMENT_METHODS,
     BRAND, BRAND_VER, BRAND_TAG, BRAND_SHORT, BOT_USERNAME,
     YOUR_USERNAME, UPDATE_CHANNEL, REF_COMMISSION, REF_BONUS_DAYS,
-    FORCE_SUB_ENABLED, DEFAULT_FORCE_CHANNELS,
+    FORCE_SUB_ENABLED, DEFAULT_FORCE_CHANNELS, UPLOAD_MAX, UPLOAD_WAIT,
     bot_lock, state_lock, active_lock,
     bot_scripts, active_users, user_states, payment_states, bot_locked
 )
@@ -36,7 +33,9 @@ from keyboards import (
     main_kb, bot_action_kb, plan_kb, pay_method_kb,
     admin_kb, pay_approve_kb, force_sub_kb, channels_kb
 )
-from runner import run_bot, run_broadcast_thread
+from runner import queue_broadcast, queue_prewarm, parse_probe
+import autofix
+import uploads
 
 
 # ═══════════════════════════════════════════
@@ -108,7 +107,9 @@ def register_handlers(bot):
                     f"📅 +{REF_BONUS_DAYS} days bonus!\n"
                     f"👥 Total: {rd['referral_count'] if rd else '?'}")
         else:
-            db.update_user(uid, username=un, full_name=fn, last_active=datetime.now().isoformat())
+            db.update_user_later(uid, username=un, full_name=fn, last_active=datetime.now().isoformat())
+            if ex.get('is_blocked'):
+                db.update_user(uid, is_blocked=0)
             if not ex.get('referral_code') or len(ex.get('referral_code', '')) < 5:
                 db.update_user(uid, referral_code=code)
 
@@ -265,7 +266,7 @@ def register_handlers(bot):
         except:
             pass
         db.add_channel(ch_username, ch_name, uid)
-        db.admin_log(uid, 'add_channel', details=f"@{ch_username}")
+        db.admin_log(uid, 'add_channel', det=f"@{ch_username}")
         bot.reply_to(msg, f"✅ Channel @{ch_username} added!\n⚠️ Make sure bot is admin!")
 
     @bot.message_handler(commands=['removechannel', 'rmchannel'])
@@ -294,6 +295,40 @@ def register_handlers(bot):
             t += "No channels. Default: @developer_apon_07\n"
         safe_send(uid, t)
 
+    @bot.message_handler(commands=['probe'])
+    def cmd_probe(msg):
+        uid = msg.from_user.id
+        parts = msg.text.split(maxsplit=2)
+        bd = db.get_bot(int(parts[1])) if len(parts) > 1 and parts[1].isdigit() else None
+        if not bd or (bd['user_id'] != uid and uid not in admin_ids and uid != OWNER_ID):
+            return safe_send(uid,
+                "📶 <b>Readiness probe</b>\n\n<code>/probe BOT_ID [auto|none|getme|log:TEXT|port:N]</code>\n\n"
+                "auto — any of: log line, Telegram getMe, open port\n"
+                "log:TEXT — wait for a log line containing TEXT\nport:N — wait for a listening port\n"
+                "getme — token answers getMe\nnone — no signal, just stay up")
+        if len(parts) < 3:
+            return safe_send(uid, f"📶 #{bd['bot_id']} probe: <code>{bd.get('ready_probe') or 'auto'}</code>")
+        spec = parts[2].strip()
+        if not parse_probe(spec):
+            return safe_send(uid, "❌ Invalid probe. Use auto, none, getme, log:TEXT or port:N")
+        db.update_bot(bd['bot_id'], ready_probe='' if spec == 'auto' else spec)
+        safe_send(uid, f"✅ #{bd['bot_id']} probe set: <code>{spec}</code>")
+
+    @bot.message_handler(commands=['explain'])
+    def cmd_explain(msg):
+        uid = msg.from_user.id
+        if uid not in admin_ids and uid != OWNER_ID:
+            return
+        res = db.explain()
+        bad = sum(1 for _, _, f in res if f)
+        t = (f"🔍 <b>Query Plan Audit</b>\n"
+             f"📐 Schema v{db.schema_version()} | {len(res)} hot queries | "
+             f"{'✅ no full scans' if not bad else f'⚠️ {bad} flagged'}\n\n")
+        for name, plan, flagged in res:
+            plan = '; '.join(plan)[:150].replace('<', '&lt;').replace('>', '&gt;')
+            t += f"{'⚠️' if flagged else '✅'} <b>{name}</b>\n<code>{plan}</code>\n"
+        safe_send(uid, t[:4000])
+
     @bot.message_handler(commands=['broadcast', 'bc'])
     def cmd_broadcast(msg):
         uid = msg.from_user.id
@@ -305,12 +340,8 @@ def register_handlers(bot):
                 user_states[uid] = {'action': 'broadcast'}
             return bot.reply_to(msg, "📢 Send broadcast message:")
         # Background broadcast
-        threading.Thread(
-            target=run_broadcast_thread,
-            args=(text[1], uid),
-            daemon=True
-        ).start()
-        bot.reply_to(msg, "📢 Broadcasting in background...")
+        bot.reply_to(msg, "📢 Broadcasting in background — live status below.")
+        queue_broadcast(text[1], uid)
 
     @bot.message_handler(commands=['userinfo'])
     def cmd_userinfo(msg):
@@ -428,6 +459,8 @@ def register_handlers(bot):
             return
         if bot_locked and uid not in admin_ids and uid != OWNER_ID:
             return bot.reply_to(msg, "🔒 Maintenance mode")
+        if u:
+            db.update_user_later(uid, last_active=datetime.now().isoformat())
 
         with state_lock:
             has_pay = uid in payment_states
@@ -495,71 +528,45 @@ def register_handlers(bot):
         if ext not in allowed:
             return bot.reply_to(msg, f"❌ Unsupported file type: .{ext}")
 
-        if fs > 100 * 1024 * 1024:
-            return bot.reply_to(msg, "❌ File too large! Max 100MB.")
+        if fs > UPLOAD_MAX:
+            return bot.reply_to(msg, f"❌ File too large! Max {UPLOAD_MAX // (1024 * 1024)}MB.")
 
         pm = bot.reply_to(msg, f"📤 Uploading {fn[:25]} ({fmt_size(fs)})...")
+        if not uploads.slots.acquire(timeout=UPLOAD_WAIT):
+            return safe_edit("⏳ Server busy with other uploads, please try again shortly.",
+                             msg.chat.id, pm.message_id)
 
+        tp = None
         try:
             fi = bot.get_file(msg.document.file_id)
-            dl = bot.download_file(fi.file_path)
+            tp, _ = uploads.download(fi.file_path)
             uf = user_folder(uid)
 
             if ext == 'zip':
-                _handle_zip(msg, uid, fn, fs, dl, uf, pm)
+                _handle_zip(msg, uid, fn, fs, tp, uf, pm)
             elif ext in ['py', 'js']:
-                _handle_script(msg, uid, fn, fs, dl, uf, ext, pm)
+                _handle_script(msg, uid, fn, fs, tp, uf, ext, pm)
             else:
-                file_path = os.path.join(uf, fn)
-                with open(file_path, 'wb') as f:
-                    f.write(dl)
+                uploads.save_to(tp, os.path.join(uf, fn))
                 safe_edit(f"✅ Config file {fn} saved!", msg.chat.id, pm.message_id)
 
+        except uploads.UploadRejected as e:
+            safe_edit(f"❌ {e}", msg.chat.id, pm.message_id)
         except Exception as e:
             logger.error(f"Upload error: {e}", exc_info=True)
             report_error(e, "handle_doc")
             safe_edit(f"❌ Error: {str(e)[:100]}", msg.chat.id, pm.message_id)
+        finally:
+            uploads.slots.release()
+            if tp and os.path.exists(tp):
+                os.unlink(tp)
 
     # ── ZIP Handler ──
-    def _handle_zip(msg, uid, fn, fs, dl, uf, pm):
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp:
-            tmp.write(dl)
-            tp = tmp.name
-
+    def _handle_zip(msg, uid, fn, fs, tp, uf, pm):
         try:
-            with zipfile.ZipFile(tp, 'r') as z:
-                for n in z.namelist():
-                    if n.startswith('/') or '..' in n:
-                        safe_edit("❌ Suspicious file paths!", msg.chat.id, pm.message_id)
-                        os.unlink(tp)
-                        return
-
-                bn = fn.replace('.zip', '').replace(' ', '_')
-                ed = os.path.join(uf, bn)
-                if os.path.exists(ed):
-                    shutil.rmtree(ed, ignore_errors=True)
-                os.makedirs(ed, exist_ok=True)
-                z.extractall(ed)
-
-                # Handle single root folder
-                items = os.listdir(ed)
-                if len(items) == 1 and os.path.isdir(os.path.join(ed, items[0])):
-                    inner = os.path.join(ed, items[0])
-                    for item in os.listdir(inner):
-                        src = os.path.join(inner, item)
-                        dst = os.path.join(ed, item)
-                        if os.path.exists(dst):
-                            if os.path.isdir(dst):
-                                shutil.rmtree(dst)
-                            else:
-                                os.remove(dst)
-                        shutil.move(src, dst)
-                    try:
-                        os.rmdir(inner)
-                    except:
-                        pass
-
-            os.unlink(tp)
+            bn = fn.replace('.zip', '').replace(' ', '_')
+            ed = os.path.join(uf, bn)
+            uploads.extract(tp, ed)  # single root folder is stripped while unpacking
 
             entry, ft, report = det.report(ed)
             if not entry:
@@ -578,6 +585,7 @@ def register_handlers(bot):
                 return
 
             bid = db.add_bot(uid, bn, ed, entry, ft, '', fs, '')
+            scan = _prewarm(bid, uid, ed, ft)
             mk = types.InlineKeyboardMarkup(row_width=2)
             mk.add(
                 types.InlineKeyboardButton("▶️ Start Now", callback_data=f"start:{bid}"),
@@ -588,23 +596,35 @@ def register_handlers(bot):
             safe_edit(
                 f"✅ <b>ZIP DEPLOYED!</b>\n\n"
                 f"📦 {bn[:20]}\n🆔 Bot ID: #{bid}\n\n"
-                f"🔍 Detection:\n{report}",
+                f"🔍 Detection:\n{report}{scan}",
                 msg.chat.id, pm.message_id, reply_markup=mk)
 
         except zipfile.BadZipFile:
             safe_edit("❌ Invalid or corrupted ZIP file!", msg.chat.id, pm.message_id)
-            try:
-                os.unlink(tp)
-            except:
-                pass
+
+    # ── Upload analysis ──
+    def _prewarm(bid, uid, wd, ft, entry=None):
+        """Scan imports, store them on the bot, queue the install -> report lines"""
+        try:
+            pkgs, fw = autofix.analyze(wd, ft, entry)
+        except Exception as e:
+            report_error(e, f"analyze(#{bid})")
+            return ""
+        db.update_bot(bid, deps=','.join(pkgs), framework=fw)
+        queue_prewarm(bid, uid)
+        out = f"\n🧩 Framework: {fw}" if fw else ""
+        if pkgs:
+            shown = ', '.join(pkgs[:8]) + (f" +{len(pkgs) - 8}" if len(pkgs) > 8 else "")
+            out += f"\n📦 Deps: {shown}\n⏳ Installing in background..."
+        return out
 
     # ── Script Handler ──
-    def _handle_script(msg, uid, fn, fs, dl, uf, ext, pm):
+    def _handle_script(msg, uid, fn, fs, tp, uf, ext, pm):
         file_path = os.path.join(uf, fn)
-        with open(file_path, 'wb') as f:
-            f.write(dl)
+        uploads.save_to(tp, file_path)
 
         bid = db.add_bot(uid, fn, uf, fn, ext, '', fs, 'exact')
+        scan = _prewarm(bid, uid, uf, ext, file_path)
         mk = types.InlineKeyboardMarkup(row_width=2)
         mk.add(
             types.InlineKeyboardButton("▶️ Run Now", callback_data=f"start:{bid}"),
@@ -613,7 +633,7 @@ def register_handlers(bot):
         safe_edit(
             f"✅ <b>FILE UPLOADED!</b>\n\n"
             f"📄 {fn[:25]}\n🆔 Bot ID: #{bid}\n"
-            f"🔤 {'🐍 Python' if ext == 'py' else '🟨 Node.js'}\n📊 {fmt_size(fs)}",
+            f"🔤 {'🐍 Python' if ext == 'py' else '🟨 Node.js'}\n📊 {fmt_size(fs)}{scan}",
             msg.chat.id, pm.message_id, reply_markup=mk)
 
     # ──────────────────────────────
@@ -746,7 +766,7 @@ def register_handlers(bot):
         ss = sys_stats()
         safe_send(msg.chat.id,
             f"⚡ <b>Speed Test</b>\n\n🖥️ CPU: {ss['cpu']}%\n🧠 RAM: {ss['mem']}%\n"
-            f"💾 Disk: {ss['disk']}%\n🌐 Mem: {ss['mem_total']}\n⏱️ {ss['up']}")
+            f"💾 Disk: {ss['disk']}%\n📈 Load: {ss.get('load', 0)}\n🌐 Mem: {ss['mem_total']}\n⏱️ {ss['up']}")
 
     def show_notifs(msg):
         uid = msg.from_user.id
@@ -857,12 +877,8 @@ def register_handlers(bot):
                 return
             text = msg.text
             # Background broadcast — NO FREEZE
-            threading.Thread(
-                target=run_broadcast_thread,
-                args=(text, uid),
-                daemon=True
-            ).start()
             bot.reply_to(msg, f"📢 Broadcasting in background to all users...")
+            queue_broadcast(text, uid)
             with state_lock:
                 user_states.pop(uid, None)
 
@@ -974,7 +990,7 @@ def register_handlers(bot):
                     bot.reply_to(msg,
                         f"✅ <b>Promo Created!</b>\n\n🎟 Code: <code>{code}</code>\n"
                         f"💰 Discount: {discount}%\n🔢 Max Uses: {max_uses}", parse_mode='HTML')
-                    db.admin_log(uid, 'create_promo', details=f"{code}/{discount}%/{max_uses}")
+                    db.admin_log(uid, 'create_promo', det=f"{code}/{discount}%/{max_uses}")
                 except:
                     bot.reply_to(msg, "❌ Error!")
             else:
@@ -998,7 +1014,7 @@ def register_handlers(bot):
             except:
                 pass
             db.add_channel(ch_username, ch_name, uid)
-            db.admin_log(uid, 'add_channel', details=f"@{ch_username}")
+            db.admin_log(uid, 'add_channel', det=f"@{ch_username}")
             bot.reply_to(msg,
                 f"✅ <b>Channel Added!</b>\n\n📢 @{ch_username}\n📝 {ch_name}\n\n"
                 f"⚠️ Make sure bot is admin!", parse_mode='HTML')
@@ -1013,7 +1029,7 @@ def register_handlers(bot):
                     user_states.pop(uid, None)
                 return
             db.remove_channel(text)
-            db.admin_log(uid, 'remove_channel', details=f"@{text}")
+            db.admin_log(uid, 'remove_channel', det=f"@{text}")
             bot.reply_to(msg, f"✅ Removed @{text} from force subscribe!")
             with state_lock:
                 user_states.pop(uid, None)
@@ -0,0 +1,133 @@
+"""
+╔═══════════════════════════════════════════╗
+║  jobs.py — Bot Operation Executor         ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+One queue for start / stop / restart work instead of a fresh thread per
+click. Jobs on the same key (a bot) run strictly one after another, each
+user has a concurrency cap, and the pool has a global one. `reserved`
+workers only take `urgent` ops (stops), which also skip the per-user cap,
+so a pool full of pip installs can't hold a Stop behind it. Broadcasts run
+in their own Jobs instance.
+"""
+
+import time
+import itertools
+import threading
+from collections import deque, Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import logger
+
+
+class Jobs:
+    KEEP_DONE_S = 120  # how long a finished job's status stays visible
+
+    def __init__(self, workers=8, per_user=2, reserved=0, urgent=(), name='job'):
+        self.workers = workers
+        self.per_user = per_user
+        self.reserved = reserved
+        self.urgent = frozenset(urgent)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._q = deque()        # waiting jobs, FIFO
+        self._busy_keys = set()  # keys with a job running
+        self._busy_users = Counter()
+        self._running = 0
+        self._status = {}        # key -> last job dict
+        self._ids = itertools.count(1)
+        self._st = {'submitted': 0, 'done': 0, 'failed': 0, 'deduped': 0, 'max_depth': 0}
+
+    # ════════════════════════════════
+    #  PUBLIC API
+    # ════════════════════════════════
+    def submit(self, op, key, uid, fn, *args):
+        """Queue fn(*args); returns a Future, or None if the same op is already waiting on key"""
+        with self._lock:
+            if key is not None and any(j['key'] == key and j['op'] == op for j in self._q):
+                self._st['deduped'] += 1
+                return None
+            job = {'id': next(self._ids), 'op': op, 'key': key, 'uid': uid, 'fn': fn, 'args': args,
+                   'state': 'queued', 'queued_at': time.time(), 'fut': Future()}
+            self._q.append(job)
+            if key is not None:
+                self._status[key] = job
+            self._st['submitted'] += 1
+            self._st['max_depth'] = max(self._st['max_depth'], len(self._q))
+        self._pump()
+        return job['fut']
+
+    def status(self, key):
+        """Latest job on key: {'op', 'state', 'pos', 'age'} or None"""
+        with self._lock:
+            j = self._status.get(key)
+            if not j:
+                return None
+            if j['state'] in ('done', 'failed') and time.time() - j['ended_at'] > self.KEEP_DONE_S:
+                del self._status[key]
+                return None
+            pos = next((n for n, q in enumerate(self._q, 1) if q is j), 0)
+            return {'op': j['op'], 'state': j['state'], 'pos': pos,
+                    'age': int(time.time() - j.get('started_at', j['queued_at']))}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._st, depth=len(self._q), running=self._running, workers=self.workers,
+                        reserved=self.reserved)
+
+    # ════════════════════════════════
+    #  SCHEDULING
+    # ════════════════════════════════
+    def _pump(self):
+        """Start every waiting job that fits the global, per-user and per-key limits"""
+        with self._lock:
+            ready = []
+            for j in list(self._q):
+                if self._running >= self.workers:
+                    break
+                urgent = j['op'] in self.urgent
+                if not urgent and self._running >= self.workers - self.reserved:
+                    continue  # keep the reserved workers for urgent ops further back
+                if j['key'] is not None and j['key'] in self._busy_keys:
+                    continue
+                if not urgent and j['uid'] is not None and self._busy_users[j['uid']] >= self.per_user:
+                    continue
+                self._q.remove(j)
+                self._running += 1
+                if j['key'] is not None:
+                    self._busy_keys.add(j['key'])
+                if j['uid'] is not None:
+                    self._busy_users[j['uid']] += 1
+                j['state'] = 'running'
+                j['started_at'] = time.time()
+                ready.append(j)
+        for j in ready:
+            self._pool.submit(self._run, j)
+
+    def _run(self, j):
+        res, err = None, RuntimeError('job interrupted')
+        try:
+            res = j['fn'](*j['args'])
+            err = None
+        except Exception as e:
+            err = e
+            logger.error(f"Job {j['op']} #{j['id']} ({j['key']}) failed: {e}", exc_info=True)
+        finally:
+            # ended_at before the state flips (status() reads it for finished jobs),
+            # and both before the future wakes waiters and done-callbacks
+            j['ended_at'] = time.time()
+            with self._lock:
+                j['state'] = 'failed' if err else 'done'
+                self._running -= 1
+                self._busy_keys.discard(j['key'])
+                if j['uid'] is not None:
+                    self._busy_users[j['uid']] -= 1
+                    if self._busy_users[j['uid']] <= 0:
+                        del self._busy_users[j['uid']]
+                self._st['done' if j['state'] == 'done' else 'failed'] += 1
+            if err:
+                j['fut'].set_exception(err)
+            else:
+                j['fut'].set_result(res)
+            self._pump()
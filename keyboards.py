@@ -37,6 +37,7 @@ def bot_action_kb(bid, st):
             types.InlineKeyboardButton("📋 Logs", callback_data=f"logs:{bid}"),
             types.InlineKeyboardButton("📊 Resources", callback_data=f"res:{bid}")
         )
+        m.add(types.InlineKeyboardButton("📡 Live Logs", callback_data=f"follow:{bid}"))
     else:
         m.add(
             types.InlineKeyboardButton("▶️ Start", callback_data=f"start:{bid}"),
@@ -104,12 +105,26 @@ def admin_kb():
         types.InlineKeyboardButton("🛑 Stop All", callback_data="a_stopall"),
         types.InlineKeyboardButton("💾 Backup", callback_data="a_backup")
     )
+    m.add(types.InlineKeyboardButton("💥 Top Crashes", callback_data="a_crashes"))
     fsub_status = "🟢" if FORCE_SUB_ENABLED else "🔴"
     m.add(types.InlineKeyboardButton(f"{fsub_status} Force Subscribe", callback_data="a_fsub_toggle"))
     m.add(types.InlineKeyboardButton("🔙 Back", callback_data="menu"))
     return m
 
 
+def users_page_kb(users, has_prev, has_next):
+    m = types.InlineKeyboardMarkup(row_width=2)
+    nav = []
+    if users and has_prev:
+        nav.append(types.InlineKeyboardButton("⬅️ Prev", callback_data=f"a_users:p:{users[0]['user_id']}"))
+    if users and has_next:
+        nav.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"a_users:n:{users[-1]['user_id']}"))
+    if nav:
+        m.add(*nav)
+    m.add(types.InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_back"))
+    return m
+
+
 def pay_approve_kb(pid):
     m = types.InlineKeyboardMarkup(row_width=2)
     m.add(
@@ -141,4 +156,18 @@ def channels_kb():
     m.add(types.InlineKeyboardButton("➕ Add Channel", callback_data="ch_add"))
     m.add(types.InlineKeyboardButton("🗑 Remove Channel", callback_data="ch_remove"))
     m.add(types.InlineKeyboardButton("🔙 Back to Admin", callback_data="admin_back"))
-    return m
\ No newline at end of file
+    return m
+
+def broadcast_kb(bc_id, status):
+    m = types.InlineKeyboardMarkup(row_width=2)
+    if status == 'running':
+        m.add(
+            types.InlineKeyboardButton("⏸ Pause", callback_data=f"bc_pause:{bc_id}"),
+            types.InlineKeyboardButton("⏹ Cancel", callback_data=f"bc_cancel:{bc_id}")
+        )
+    elif status == 'paused':
+        m.add(
+            types.InlineKeyboardButton("▶️ Resume", callback_data=f"bc_resume:{bc_id}"),
+            types.InlineKeyboardButton("⏹ Cancel", callback_data=f"bc_cancel:{bc_id}")
+        )
+    return m
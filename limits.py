@@ -0,0 +1,169 @@
+"""
+╔═══════════════════════════════════════════╗
+║  limits.py — Per-Bot Resource Limits      ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Plan RAM/CPU caps for hosted bots. Uses a cgroup v2 child group when the
+host delegates one to us (memory.max / cpu.max, kernel OOM-kills the
+bot), otherwise falls back to RLIMIT_DATA + RLIMIT_AS. Both are applied from the parent
+right after Popen (cgroup.procs write / prlimit), never in a preexec_fn:
+the panel is multi-threaded and only async-signal-safe work is allowed
+between fork and exec. Either way runner's watchdog also kills on tree RSS.
+
+RLIMIT_DATA (private writable memory: heap, anonymous mmaps, thread
+stacks) is what holds a Python bot near plan RAM: plan RAM plus
+LIMIT_DATA_SLACK, since each thread stack is reserved there in full
+(a telebot bot with 4 threads: ~55MB data for ~33MB RSS). RLIMIT_AS is
+only a backstop for kernels before 4.7, where RLIMIT_DATA covers brk
+alone: plan RAM plus LIMIT_VM_SLACK of it plus LIMIT_VM_BASE for the
+interpreter and shared libraries.
+"""
+
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import LIMIT_CGROUP, LIMIT_DATA_SLACK, LIMIT_VM_BASE, LIMIT_VM_SLACK, logger
+
+CG_ROOT = '/sys/fs/cgroup'
+_cg_base = False  # False = not probed yet, None = unavailable
+
+
+# ═══════════════════════════════════════════
+#  CGROUP v2
+# ═══════════════════════════════════════════
+def _write(path, val):
+    with open(path, 'w') as f:
+        f.write(str(val))
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except:
+        return ''
+
+
+def cgroup_base():
+    """Our delegated parent group, or None if cgroup v2 memory isn't usable"""
+    global _cg_base
+    if _cg_base is not False:
+        return _cg_base
+    _cg_base = None
+    if os.name == 'nt' or 'memory' not in _read(os.path.join(CG_ROOT, 'cgroup.controllers')).split():
+        return None
+    base = os.path.join(CG_ROOT, LIMIT_CGROUP)
+    try:
+        os.makedirs(base, exist_ok=True)
+        try:
+            _write(os.path.join(CG_ROOT, 'cgroup.subtree_control'), '+memory +cpu')
+        except OSError:
+            pass  # already enabled, or not ours to change
+        _write(os.path.join(base, 'cgroup.subtree_control'), '+memory +cpu')
+        if 'memory' in _read(os.path.join(base, 'cgroup.subtree_control')).split():
+            _cg_base = base
+            logger.info(f"🧱 Bot limits: cgroup v2 at {base}")
+    except OSError as e:
+        logger.warning(f"cgroup v2 unavailable ({e}), using rlimits")
+    return _cg_base
+
+
+def _cgroup(sk, ram, cpu):
+    base = cgroup_base()
+    if not base:
+        return None
+    cg = os.path.join(base, sk)
+    try:
+        try:
+            os.rmdir(cg)  # fresh group, so memory.events counts start at 0
+        except OSError:
+            pass
+        os.makedirs(cg, exist_ok=True)
+        _write(os.path.join(cg, 'memory.max'), ram * 1024 * 1024)
+        try:
+            _write(os.path.join(cg, 'memory.swap.max'), 0)
+        except OSError:
+            pass
+        try:
+            _write(os.path.join(cg, 'cpu.max'), f"{cpu * 1000} 100000")
+        except OSError:
+            pass
+        return cg
+    except OSError as e:
+        logger.warning(f"cgroup setup failed for {sk}: {e}")
+        return None
+
+
+# ═══════════════════════════════════════════
+#  PUBLIC API
+# ═══════════════════════════════════════════
+def data_cap(ram):
+    """MB of private writable memory allowed for plan RAM under RLIMIT_DATA"""
+    return ram + LIMIT_DATA_SLACK
+
+
+def vm_cap(ram):
+    """MB of address space allowed for plan RAM under RLIMIT_AS (backstop)"""
+    return int(ram * (1 + LIMIT_VM_SLACK)) + LIMIT_VM_BASE
+
+
+def prepare(sk, plan, ft='py'):
+    """Limits info for launching one bot under its plan; apply() once it's spawned"""
+    ram, cpu = plan['ram'], plan.get('cpu', 100)
+    info = {'ram': ram, 'cpu': cpu, 'mode': 'none', 'cg': None, 'vm': None, 'data': None}
+    if os.name == 'nt':
+        return info
+    cg = _cgroup(sk, ram, cpu)
+    # V8 reserves far more than it uses, so Node gets --max-old-space-size
+    # (node_args) plus the RSS watchdog instead of rlimits
+    if not cg and ft == 'py' and hasattr(resource, 'prlimit'):
+        info['vm'] = vm_cap(ram) * 1024 * 1024
+        info['data'] = data_cap(ram) * 1024 * 1024
+    info['mode'] = 'cgroup' if cg else 'rlimit' if info['vm'] else 'watchdog'
+    info['cg'] = cg
+    return info
+
+
+def apply(pid, info):
+    """Put a freshly spawned bot under its limits (from the parent)"""
+    try:
+        if info.get('cg'):
+            _write(os.path.join(info['cg'], 'cgroup.procs'), pid)
+        elif info.get('vm'):
+            resource.prlimit(pid, resource.RLIMIT_DATA, (info['data'], info['data']))
+            resource.prlimit(pid, resource.RLIMIT_AS, (info['vm'], info['vm']))
+    except OSError as e:
+        logger.warning(f"Applying limits to pid {pid} failed ({e}), watchdog only")
+        info['mode'] = 'watchdog'
+
+
+def node_args(info):
+    """V8 heap cap a bit under the plan RAM"""
+    return [f"--max-old-space-size={max(64, int(info['ram'] * 0.75))}"]
+
+
+def oom_killed(info, log_tail=''):
+    """Did the bot die from its memory cap?"""
+    if not info:
+        return False
+    if info.get('cg'):
+        for line in _read(os.path.join(info['cg'], 'memory.events')).splitlines():
+            k, _, v = line.partition(' ')
+            if k == 'oom_kill' and v.strip() not in ('', '0'):
+                return True
+        return False
+    return info.get('mode') == 'rlimit' and 'MemoryError' in log_tail
+
+
+def release(info):
+    """Remove the bot's cgroup once its processes are gone"""
+    if info and info.get('cg'):
+        try:
+            os.rmdir(info['cg'])
+        except OSError:
+            pass
@@ -7,6 +7,7 @@
 """
 
 import time
+_boot_t = time.perf_counter()  # startup timing starts before the heavy imports
 import atexit
 import requests
 import telebot
@@ -15,17 +16,32 @@ import os
 from config import (
     TOKEN, OWNER_ID, BRAND, BRAND_VER, BRAND_TAG, BRAND_SHORT,
     logger, bot_lock, bot_scripts, admin_ids,
-    DEFAULT_FORCE_CHANNELS, FORCE_SUB_ENABLED
+    DEFAULT_FORCE_CHANNELS, FORCE_SUB_ENABLED, RESTORE_ON_BOOT
 )
 from database import db
 from utils import (
-    set_bot_instance, safe_send, gen_ref_code,
+    set_bot_instance, safe_send,
     is_running, kill_tree, get_uptime, report_error
 )
-from runner import start_all_threads
+from runner import start_all_threads, resume_broadcasts, restore_bots
+import uploads
 from handlers import register_handlers
 from callbacks import register_callbacks
 
+# ═══════════════════════════════════════════
+#  STARTUP TIMING
+# ═══════════════════════════════════════════
+_boot = []  # (phase, seconds)
+
+def boot_phase(name):
+    """Close the current startup phase under `name`"""
+    global _boot_t
+    now = time.perf_counter()
+    _boot.append((name, now - _boot_t))
+    _boot_t = now
+
+boot_phase("imports + DB")
+
 # ═══════════════════════════════════════════
 #  FORCE KILL OLD BOT SESSION
 # ═══════════════════════════════════════════
@@ -43,6 +59,7 @@ except:
 
 logger.info("⏳ Waiting 3 seconds for old session to die...")
 time.sleep(3)
+boot_phase("session reset")
 
 # ═══════════════════════════════════════════
 #  CREATE FRESH BOT INSTANCE
@@ -97,6 +114,8 @@ def cleanup_all():
         bot.stop_polling()
     except:
         pass
+    db.flush()
+    db.close_all()
     logger.info(f"🛑 Stopped {count} bots")
 
 atexit.register(cleanup_all)
@@ -106,6 +125,7 @@ atexit.register(cleanup_all)
 # ═══════════════════════════════════════════
 register_handlers(bot)
 register_callbacks(bot)
+boot_phase("handlers")
 
 # ═══════════════════════════════════════════
 #  MAIN ENTRY POINT
@@ -128,28 +148,26 @@ def main():
         except Exception as e:
             logger.warning(f"Clear attempt {attempt + 1}: {e}")
             time.sleep(3)
+    boot_phase("session clear")
 
     # Seed default channels
+    # (referral codes are fixed once by DB migration 2, not on every boot)
     existing_channels = db.get_all_channels()
     if not existing_channels:
         for ch_user, ch_name in DEFAULT_FORCE_CHANNELS.items():
             db.add_channel(ch_user, ch_name, OWNER_ID)
+    boot_phase("seed channels")
 
-    # Fix referral codes
-    fixed = 0
-    for u in db.get_all_users():
-        rc = u.get('referral_code', '')
-        if not rc or len(rc) < 5:
-            try:
-                db.update_user(u['user_id'], referral_code=gen_ref_code(u['user_id']))
-                fixed += 1
-            except:
-                pass
-    if fixed:
-        logger.info(f"🔧 Fixed {fixed} referral codes")
+    uploads.purge_incoming()
 
     # Start background threads
     start_all_threads()
+    resume_broadcasts()
+    boot_phase("threads")
+
+    # Warm restore — runs on the job queue, admins get the total when it settles
+    restoring = restore_bots() if RESTORE_ON_BOOT else 0
+    boot_phase("restore queued")
 
     # Flask keep-alive
     keep_alive()
@@ -161,14 +179,19 @@ def main():
             f"🚀 <b>{BRAND_SHORT} STARTED!</b>\n"
             f"{BRAND_TAG}\n━━━━━━━━━━━━━━━━━━━━\n"
             f"✅ All systems online\n"
-            f"🧵 4 background threads\n"
+            f"🧵 11 background threads\n"
             f"🔒 Thread-safe mode\n"
             f"👥 Users: {stats['users']}\n"
             f"🤖 Bots: {stats['bots']}\n"
+            f"♻️ Restoring: {restoring}\n"
             f"💰 Revenue: {stats['revenue']} BDT\n"
             f"Force Sub: {'🟢 ON' if FORCE_SUB_ENABLED else '🔴 OFF'}\n"
             f"━━━━━━━━━━━━━━━━━━━━")
+    boot_phase("admin notify")
 
+    total = sum(s for _, s in _boot)
+    logger.info(f"⏱️ Boot {total:.2f}s — " + " | ".join(f"{n} {s:.2f}s" for n, s in _boot)
+                + f" | schema v{db.schema_version()}")
     logger.info("🟢 Bot READY! Starting polling...")
 
     # ═══════════════════════════════════════
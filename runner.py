@@ -7,48 +7,142 @@
 
 import os
 import re
-import sys
+import json
 import time
+import random
+import psutil
+import urllib.request
 import subprocess
 import threading
 import shutil
+import telebot
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     logger, bot_lock, bot_scripts, admin_ids,
-    LOGS_DIR, MODULES_MAP, PLAN_LIMITS, BACKUP_DIR, DB_PATH
+    PLAN_LIMITS, BACKUP_DIR, DB_PATH, BRAND_TAG,
+    BC_RATE, BC_WORKERS, BC_BATCH, RES_INTERVAL, LIMIT_KILL_AFTER,
+    RESTART_BASE, RESTART_MAX, RESTART_STABLE, RESTART_MAX_STREAK, RESTART_WORKERS,
+    CRASH_TAIL, CRASH_KEEP_DAYS,
+    RESTORE_ADOPT, BOT_VENVS,
+    READY_TIMEOUT, READY_MIN_UP, READY_POLL, READY_PATTERN, JOB_WORKERS, JOB_PER_USER,
+    JOB_RESERVED, BC_JOBS
 )
 from database import db
 from utils import (
-    safe_send, report_error, det, user_folder,
-    is_running, cleanup_script, kill_tree
+    safe_send, safe_edit, report_error, det, user_folder,
+    is_running, cleanup_script, kill_tree, get_bot_instance, metrics_loop,
+    resource_loop, bot_usage, Adopted
 )
+from supervisor import Supervisor
+from jobs import Jobs
+import limits
+import deps
+import botlogs
+import crashes
+import autofix
+from keyboards import broadcast_kb
 
 
 # ═══════════════════════════════════════════
-#  PIP INSTALLER
+#  READINESS PROBES
 # ═══════════════════════════════════════════
-def pip_install(mod, cid):
-    pkg = MODULES_MAP.get(mod.split('.')[0].lower(), mod)
+_probe_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='probe')
+PROBES = ('auto', 'none', 'getme', 'log', 'port')
+PROBE_TEXT_MAX = 100  # chars in a log: probe
+
+
+def parse_probe(spec):
+    """'' / auto | none | getme | log:<text> | port:<n> -> (kind, arg) or None if invalid
+
+    log: takes plain text matched as a substring; user regexes would run in
+    the panel process and a backtracking one could stall it.
+    """
+    kind, _, arg = (spec or 'auto').strip().partition(':')
+    if kind not in PROBES:
+        return None
+    if kind == 'log':
+        return (kind, arg or None) if len(arg) <= PROBE_TEXT_MAX else None
+    if kind == 'port':
+        return (kind, int(arg)) if arg.isdigit() and 0 < int(arg) < 65536 else None
+    return kind, None
+
+
+def _get_me(token):
     try:
-        safe_send(cid, f"📦 Installing {pkg}...")
-        r = subprocess.run(
-            [sys.executable, '-m', 'pip', 'install', pkg, '--quiet'],
-            capture_output=True, text=True, timeout=120
-        )
-        if r.returncode == 0:
-            safe_send(cid, f"✅ Installed {pkg}")
-            return True
-        return False
-    except Exception as e:
-        report_error(e, f"pip_install({pkg})")
+        with urllib.request.urlopen(f"https://api.telegram.org/bot{token}/getMe", timeout=READY_TIMEOUT) as r:
+            return bool(json.loads(r.read()).get('ok'))
+    except:
         return False
 
 
+def _listening(pid, port=None):
+    try:
+        root = psutil.Process(pid)
+        for p in [root] + root.children(recursive=True):
+            conns = p.net_connections(kind='inet') if hasattr(p, 'net_connections') else p.connections(kind='inet')
+            for c in conns:
+                if c.status == psutil.CONN_LISTEN and (port is None or c.laddr.port == port):
+                    return True
+    except psutil.Error:
+        pass
+    return False
+
+
+def wait_ready(proc, lp, spec='', token='', pos=0):
+    """('ready', signal) | ('timeout', None) if alive but silent | ('exited', None) at once on exit
+
+    pos: log offset where this run's output starts
+    """
+    kind, arg = parse_probe(spec) or ('auto', None)
+    text = arg if kind == 'log' else None
+    pat = re.compile(READY_PATTERN)
+    use_log = kind in ('auto', 'log')
+    use_port = kind in ('auto', 'port')
+    gm = _probe_pool.submit(_get_me, token) if token and kind in ('auto', 'getme') else None
+    t0 = time.time()
+    tail, seen, next_port = '', None, 0
+    while True:
+        if proc.poll() is not None:
+            return 'exited', None
+        up = time.time() - t0
+        if seen is None and kind == 'none':
+            seen = 'none'
+        if seen is None and use_log:
+            try:
+                with open(lp, 'rb') as f:
+                    if pos > os.fstat(f.fileno()).st_size:
+                        pos = 0  # rotated under us
+                    f.seek(pos)
+                    new = f.read().decode('utf-8', 'ignore')
+                    pos = f.tell()
+                if new:
+                    tail = (tail + new)[-4000:]
+                    if (text in tail) if text else pat.search(tail):
+                        seen = 'log'
+            except OSError:
+                pass
+        if seen is None and use_port and up >= next_port:
+            next_port = up + 1  # connection tables are the costly probe
+            if _listening(proc.pid, arg if kind == 'port' else None):
+                seen = 'port'
+        if seen is None and gm and gm.done() and gm.result():
+            seen = 'getMe'
+        if seen and up >= READY_MIN_UP:
+            return 'ready', seen
+        if up >= READY_TIMEOUT:
+            return 'timeout', None
+        time.sleep(READY_POLL)
+
+
 # ═══════════════════════════════════════════
 #  BOT RUNNER (Process-Safe)
 # ═══════════════════════════════════════════
-def run_bot(bid, cid, att=1):
+def run_bot(bid, cid, att=1, warm=False, fix=None):
+    """warm: restoring a known-good bot — keep its entry, skip installs if deps are unchanged
+    fix: the autofix rule this attempt is retrying after, for its success rate"""
     if att > 3:
         safe_send(cid, "❌ <b>Failed 3 attempts!</b> Check your code.")
         return
@@ -67,12 +161,12 @@ def run_bot(bid, cid, att=1):
     wd = fp if os.path.isdir(fp) else user_folder(uid)
 
     # Re-detect on first attempt
-    if att == 1:
+    if att == 1 and not warm:
         de, dt, dr = det.report(wd)
         if de:
             ef = de
             ft = dt or 'py'
-            db.update_bot(bid, entry_file=ef, file_type=ft)
+            db.update_bot_later(bid, entry_file=ef, file_type=ft)
 
     fsp = os.path.join(wd, ef)
 
@@ -83,7 +177,7 @@ def run_bot(bid, cid, att=1):
             if os.path.basename(ef) in files:
                 fsp = os.path.join(root, os.path.basename(ef))
                 ef = os.path.relpath(fsp, wd)
-                db.update_bot(bid, entry_file=ef)
+                db.update_bot_later(bid, entry_file=ef)
                 found = True
                 break
         if not found:
@@ -97,12 +191,12 @@ def run_bot(bid, cid, att=1):
             safe_send(cid, err)
             return
 
-    # Install deps on first attempt
+    # Install deps on first attempt (no-op while the manifests hash is unchanged),
+    # then anything the sources import that's still missing, in one batch
     if att == 1:
-        if ft == 'py':
-            det.install_req(wd, cid)
-        else:
-            det.install_npm(wd, cid)
+        deps.ensure(bd, wd, ft, cid)
+        if not warm and autofix.prescan(bd, wd, ft, cid):
+            fix = 'prescan'
 
     type_icon = '🐍 Python' if ft == 'py' else '🟨 Node.js'
     safe_send(cid,
@@ -110,85 +204,75 @@ def run_bot(bid, cid, att=1):
         f"📄 {ef}\n🔤 {type_icon}\n🔄 Attempt: {att}/3")
 
     try:
-        lp = os.path.join(LOGS_DIR, f"{sk}.log")
-        lf = open(lp, 'w', encoding='utf-8', errors='ignore')
+        lp = botlogs.path(sk)
+        lf, l0 = botlogs.open_log(sk, f"──── {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                                      f"start #{att} ({ef}) ────\n")
 
-        cmd = ['node', fsp] if ft == 'js' else [sys.executable, '-u', fsp]
+        lim = limits.prepare(sk, db.get_plan(uid), ft)
+        cmd = ['node'] + limits.node_args(lim) + [fsp] if ft == 'js' else [deps.python_for(bd, wd), '-u', fsp]
 
         env = os.environ.copy()
         if bd.get('bot_token'):
             env['BOT_TOKEN'] = bd['bot_token']
         env['PYTHONUNBUFFERED'] = '1'
+        # keep glibc from reserving 64MB per thread; under RLIMIT_AS even one extra arena counts
+        env['MALLOC_ARENA_MAX'] = '1' if lim['mode'] == 'rlimit' else '2'
 
         proc = subprocess.Popen(
             cmd, cwd=wd, stdout=lf, stderr=subprocess.STDOUT,
             text=True, encoding='utf-8', errors='ignore', env=env,
-            preexec_fn=os.setsid if os.name != 'nt' else None
+            start_new_session=True
         )
+        limits.apply(proc.pid, lim)
 
         with bot_lock:
             bot_scripts[sk] = {
                 'process': proc, 'file_name': bn, 'bot_id': bid,
                 'user_id': uid, 'start_time': datetime.now(),
                 'log_file': lf, 'log_path': lp, 'entry_file': ef,
-                'work_dir': wd, 'type': ft, 'attempt': att,
+                'work_dir': wd, 'type': ft, 'attempt': att, 'limits': lim, 'log_start': l0,
+                'starting': True,  # exits during startup are handled below, not by the supervisor
             }
+        supervisor.watch(sk, proc)
 
-        # Wait to check if bot stays running
-        time.sleep(5)
-        if proc.poll() is None:
-            time.sleep(3)
-            if proc.poll() is None:
-                db.update_bot(bid, status='running', pid=proc.pid,
-                              last_started=datetime.now().isoformat(),
-                              entry_file=ef, file_type=ft)
-                safe_send(cid,
-                    f"✅ <b>BOT IS RUNNING!</b>\n\n"
-                    f"📄 {ef}\n🆔 PID: {proc.pid}\n"
-                    f"🔤 {type_icon}\n⏱️ {datetime.now().strftime('%H:%M:%S')}\n"
-                    f"📊 🟢 Running")
+        # Up on the first readiness signal; an exit fails fast
+        t0 = time.time()
+        state, sig = wait_ready(proc, lp, bd.get('ready_probe') or '', bd.get('bot_token') or '', l0)
+        if state != 'exited':
+            with bot_lock:
+                bot_scripts[sk]['starting'] = False
+            if proc.poll() is not None:
+                supervisor.dispatch(sk, proc)  # exited in the hand-off window
                 return
+            autofix.outcome(fix, True)
+            db.update_bot_later(bid, status='running', pid=proc.pid,
+                          last_started=datetime.now().isoformat(),
+                          entry_file=ef, file_type=ft)
+            safe_send(cid,
+                f"✅ <b>BOT IS RUNNING!</b>\n\n"
+                f"📄 {ef}\n🆔 PID: {proc.pid}\n"
+                f"🔤 {type_icon}\n⏱️ {datetime.now().strftime('%H:%M:%S')}\n"
+                f"📶 Ready: {sig or f'no signal, alive {READY_TIMEOUT}s'} ({time.time() - t0:.1f}s)\n"
+                f"📊 🟢 Running")
+            return
 
         # Bot crashed — read error
         lf.close()
-        err = ""
-        try:
-            with open(lp, 'r', encoding='utf-8', errors='ignore') as f:
-                err = f.read()[-2000:]
-        except:
-            pass
-
-        # Auto-install missing Python module
-        match = re.search(r"ModuleNotFoundError: No module named '([^']+)'", err)
-        if match:
-            cleanup_script(sk)
-            if pip_install(match.group(1).split('.')[0], cid):
-                time.sleep(1)
-                run_bot(bid, cid, att + 1)
-                return
+        err = botlogs.read_from(lp, l0)
 
-        # Auto-install missing npm module
-        match = re.search(r"Cannot find module '([^']+)'", err)
-        if match and not match.group(1).startswith('.'):
+        # Over the plan's RAM cap — retrying won't help
+        if limits.oom_killed(lim, err):
+            mark_limit_killed(bid, uid, ef, lim['ram'], cid)
             cleanup_script(sk)
-            try:
-                subprocess.run(['npm', 'install', match.group(1)],
-                               cwd=wd, capture_output=True, timeout=60)
-                time.sleep(1)
-                run_bot(bid, cid, att + 1)
-                return
-            except:
-                pass
+            return
 
-        # Try alternate entry file
-        if att == 1:
-            for alt in ['app.py', 'main.py', 'bot.py', 'run.py', 'index.js', 'app.js']:
-                if os.path.exists(os.path.join(wd, alt)) and alt != ef:
-                    cleanup_script(sk)
-                    db.update_bot(bid, entry_file=alt,
-                                  file_type='js' if alt.endswith('.js') else 'py')
-                    run_bot(bid, cid, att + 1)
-                    return
+        # Known error → fix → one retry per fix
+        autofix.outcome(fix, False)
+        cleanup_script(sk)
+        applied = autofix.remedy(err, {'bd': bd, 'bid': bid, 'wd': wd, 'ft': ft, 'ef': ef, 'att': att, 'cid': cid})
+        if applied:
+            run_bot(bid, cid, att + 1, fix=applied)
+            return
 
         err_display = err[-500:] if err.strip() else 'No output'
         safe_send(cid,
@@ -199,6 +283,7 @@ def run_bot(bid, cid, att=1):
         db.update_bot(bid, status='crashed',
                       last_crash=datetime.now().isoformat(),
                       error_log=err[-500:])
+        crashes.record(bid, uid, botlogs.read_from(lp, l0, CRASH_TAIL), proc.returncode)
         cleanup_script(sk)
 
     except Exception as e:
@@ -209,46 +294,322 @@ def run_bot(bid, cid, att=1):
 
 
 # ═══════════════════════════════════════════
-#  BACKGROUND THREADS
+#  BOT OPERATIONS (via the job queue)
 # ═══════════════════════════════════════════
-def thread_monitor():
-    """Auto-restart crashed bots"""
+jobs = Jobs(workers=JOB_WORKERS, per_user=JOB_PER_USER, reserved=JOB_RESERVED, urgent=('stop',))
+bc_jobs = Jobs(workers=BC_JOBS, per_user=BC_JOBS, name='bcjob')
+
+
+def bot_key(bid):
+    return f"bot:{bid}"
+
+
+def job_status(bid):
+    return jobs.status(bot_key(bid))
+
+
+def stop_bot(bid):
+    bd = db.get_bot(bid)
+    if not bd:
+        return False
+    sk = f"{bd['user_id']}_{bd['bot_name']}"
+    with bot_lock:
+        info = bot_scripts.get(sk)
+    if info:
+        kill_tree(info)
+        cleanup_script(sk)
+    db.update_bot(bid, status='stopped', last_stopped=datetime.now().isoformat())
+    return True
+
+
+def _restart(bid, cid):
+    stop_bot(bid)
+    run_bot(bid, cid)
+
+
+def queue_start(bid, uid, cid):
+    """Future, or None when a start is already waiting for this bot"""
+    _crash_streak.pop(bid, None)  # a start by hand gets a fresh auto-restart budget
+    return jobs.submit('start', bot_key(bid), uid, run_bot, bid, cid)
+
+
+def queue_stop(bid, uid):
+    return jobs.submit('stop', bot_key(bid), uid, stop_bot, bid)
+
+
+def queue_restart(bid, uid, cid):
+    _crash_streak.pop(bid, None)
+    return jobs.submit('restart', bot_key(bid), uid, _restart, bid, cid)
+
+
+def prewarm(bid):
+    """Install a freshly uploaded bot's deps ahead of its first Start"""
+    bd = db.get_bot(bid)
+    if not bd:
+        return
+    wd = bd['file_path'] if os.path.isdir(bd['file_path']) else user_folder(bd['user_id'])
+    t = time.time()
+    deps.ensure(bd, wd, bd['file_type'])
+    pkgs = autofix.prescan(db.get_bot(bid) or bd, wd, bd['file_type'])
+    logger.info(f"🔥 Prewarmed #{bid} in {time.time() - t:.1f}s (+{len(pkgs or [])} scanned deps)")
+
+
+def queue_prewarm(bid, uid):
+    return jobs.submit('prewarm', bot_key(bid), uid, prewarm, bid)
+
+
+def queue_broadcast(text, admin_id):
+    """Record the broadcast and post its status message, then queue it under bc:<id>"""
+    bc_id = db.add_broadcast(admin_id, text, db.count_targets())
+    if not bc_id:
+        safe_send(admin_id, "❌ Could not start broadcast!")
+        return None
+    m = safe_send(admin_id, _bc_text(db.get_broadcast(bc_id)), reply_markup=broadcast_kb(bc_id, 'running'))
+    if m:
+        db.update_broadcast(bc_id, status_chat=m.chat.id, status_msg=m.message_id)
+    return bc_jobs.submit('broadcast', f"bc:{bc_id}", admin_id, run_broadcast, bc_id)
+
+
+def _when_all(futs, fn):
+    """Call fn() once every future has settled (at once if there are none)"""
+    left = [len(futs)]
+    lock = threading.Lock()
+
+    def settled(_):
+        with lock:
+            left[0] -= 1
+            if left[0]:
+                return
+        fn()
+
+    if not futs:
+        return fn()
+    for f in futs:
+        f.add_done_callback(settled)
+
+
+def _count_up(bids):
+    up = 0
+    for b in bids:
+        bd = db.get_bot(b)
+        if bd and is_running(f"{bd['user_id']}_{bd['bot_name']}"):
+            up += 1
+    return up
+
+
+def start_many(bids, cid, uid=None):
+    """Queue several starts (paced by JOB_PER_USER); reports once the last one settles"""
+    t0 = time.time()
+    futs = [f for f in (queue_start(b, uid, cid) for b in bids) if f]
+    _when_all(futs, lambda: safe_send(cid,
+        f"🚀 <b>Start All</b>\n\n🟢 {_count_up(bids)}/{len(bids)} running\n⏱️ {time.time() - t0:.1f}s"))
+    return len(futs)
+
+
+# ═══════════════════════════════════════════
+#  WARM RESTORE (after a panel restart)
+# ═══════════════════════════════════════════
+def adopt_bot(bd):
+    """Re-attach to a bot process that survived the panel; True if adopted"""
+    pid = bd.get('pid')
+    if not pid:
+        return False
+    uid, bn = bd['user_id'], bd['bot_name']
+    wd = bd['file_path'] if os.path.isdir(bd['file_path']) else user_folder(uid)
+    try:
+        p = psutil.Process(pid)
+        if p.status() == psutil.STATUS_ZOMBIE or os.path.realpath(p.cwd()) != os.path.realpath(wd) \
+                or not any(os.path.basename(bd['entry_file']) in a for a in p.cmdline()):
+            return False  # PID reused by something else
+        started = datetime.fromtimestamp(p.create_time())
+    except psutil.Error:
+        return False
+    sk = f"{uid}_{bn}"
+    proc = Adopted(p)
+    lim = {'ram': db.get_plan(uid)['ram'], 'cpu': 0, 'mode': 'adopted', 'cg': None}
+    with bot_lock:
+        bot_scripts[sk] = {
+            'process': proc, 'file_name': bn, 'bot_id': bd['bot_id'],
+            'user_id': uid, 'start_time': started,
+            'log_file': None, 'log_path': botlogs.path(sk),
+            'entry_file': bd['entry_file'], 'work_dir': wd, 'type': bd['file_type'],
+            'attempt': 1, 'limits': lim, 'adopted': True,
+        }
+    supervisor.watch(sk, proc)
+    logger.info(f"♻️ Adopted {sk} (PID {pid})")
+    return True
+
+
+def restore_bots():
+    """Bring back every bot that was running when the panel went down"""
+    t0 = time.time()
+    rows = db.bots_with_status('running')
+    adopted, skipped, futs, bids = 0, 0, [], []
+    for bd in rows:
+        if not db.is_active(bd['user_id']):
+            db.update_bot(bd['bot_id'], status='stopped')
+            skipped += 1
+            continue
+        if RESTORE_ADOPT and adopt_bot(bd):
+            adopted += 1
+            continue
+        f = jobs.submit('restore', bot_key(bd['bot_id']), bd['user_id'],
+                        run_bot, bd['bot_id'], bd['user_id'], 1, True)
+        if f:
+            futs.append(f)
+            bids.append(bd['bot_id'])
+
+    def report():
+        up = _count_up(bids)
+        logger.info(f"♻️ Restore: {up}/{len(bids)} restarted, {adopted} adopted, "
+                    f"{skipped} skipped in {time.time() - t0:.1f}s")
+        for aid in admin_ids:
+            safe_send(aid,
+                f"♻️ <b>Warm Restore</b>\n━━━━━━━━━━━━━━━━━━━━\n"
+                f"🔁 Restarted: {up}/{len(bids)}\n🧷 Adopted: {adopted}\n"
+                f"⏭️ Skipped (expired): {skipped}\n⏱️ Total: {time.time() - t0:.1f}s")
+
+    if rows:
+        _when_all(futs, report)
+    return len(rows)
+
+
+# ═══════════════════════════════════════════
+#  RESOURCE LIMITS
+# ═══════════════════════════════════════════
+def _log_tail(i, n=2000):
+    return botlogs.read_from(i['log_path'], i.get('log_start', 0), n)
+
+
+def limit_hit(i):
+    """Exited bot that was stopped by its plan's RAM cap (kernel, rlimit or watchdog)"""
+    return i.get('limit_killed') or limits.oom_killed(i.get('limits'), _log_tail(i))
+
+
+def mark_limit_killed(bid, uid, name, ram, cid=None):
+    db.update_bot(bid, status='oom_killed', last_crash=datetime.now().isoformat(),
+                  error_log=f"Killed: over the {ram}MB plan RAM limit")
+    safe_send(cid or uid,
+        f"💥 <b>BOT KILLED — RAM LIMIT</b>\n\n"
+        f"📄 {name}\n💾 Limit: {ram}MB\n\n"
+        f"Your bot used more memory than your plan allows.\n"
+        f"Reduce its memory use or upgrade your plan.")
+
+
+def check_limits(over):
+    """One watchdog pass over the collector's numbers -> keys killed
+
+    over: sk -> consecutive sweeps above plan RAM, kept between passes
+    """
+    with bot_lock:
+        items = [(sk, i) for sk, i in bot_scripts.items()
+                 if i.get('limits') and not i.get('limit_killed')]
+    hot, killed = set(), []
+    for sk, i in items:
+        u = bot_usage(sk)
+        if not u or u['rss'] <= i['limits']['ram']:
+            continue
+        hot.add(sk)
+        over[sk] = over.get(sk, 0) + 1
+        if over[sk] < LIMIT_KILL_AFTER:
+            continue
+        logger.warning(f"💥 {sk} over RAM limit: {u['rss']}MB > {i['limits']['ram']}MB")
+        i['limit_killed'] = True
+        kill_tree(i)
+        if i.get('bot_id'):
+            mark_limit_killed(i['bot_id'], i['user_id'], i.get('file_name', '?'), i['limits']['ram'])
+        cleanup_script(sk)
+        killed.append(sk)
+    for sk in [k for k in over if k not in hot]:
+        del over[sk]
+    return killed
+
+
+def thread_limits():
+    """RSS watchdog over the resource collector's numbers"""
+    over = {}
     while True:
+        time.sleep(RES_INTERVAL)
         try:
-            with bot_lock:
-                keys = list(bot_scripts.keys())
+            check_limits(over)
+        except Exception as e:
+            logger.error(f"Limits watchdog error: {e}")
 
-            for sk in keys:
-                with bot_lock:
-                    i = bot_scripts.get(sk)
-                if not i:
-                    continue
-
-                if i.get('process') and i['process'].poll() is not None:
-                    bid = i.get('bot_id')
-                    uid = i.get('user_id')
-                    if bid:
-                        db.update_bot(bid, status='crashed',
-                                      last_crash=datetime.now().isoformat())
-                    if uid and bid:
-                        u = db.get_user(uid)
-                        if u and db.is_active(uid):
-                            pl = PLAN_LIMITS.get(u['plan'], PLAN_LIMITS['free'])
-                            if pl.get('auto_restart') and i.get('attempt', 1) < 3:
-                                cleanup_script(sk)
-                                time.sleep(5)
-                                threading.Thread(
-                                    target=run_bot,
-                                    args=(bid, uid, i.get('attempt', 1) + 1),
-                                    daemon=True
-                                ).start()
-                                continue
-                    cleanup_script(sk)
 
-        except Exception as e:
-            logger.error(f"Monitor error: {e}")
-            report_error(e, "thread_monitor")
-        time.sleep(30)
+# ═══════════════════════════════════════════
+#  BACKGROUND THREADS
+# ═══════════════════════════════════════════
+_crash_streak = {}  # bot_id -> consecutive quick crashes
+
+
+def restart_delay(streak):
+    """Exponential backoff with jitter: ~2s, 4s, 8s ... capped at RESTART_MAX"""
+    return min(RESTART_BASE * 2 ** (streak - 1), RESTART_MAX) * random.uniform(0.5, 1.5)
+
+
+def on_bot_exit(sk, proc):
+    """Supervisor callback — runs on its restart pool, never on the watcher"""
+    with bot_lock:
+        i = bot_scripts.get(sk)
+        if not i or i.get('process') is not proc or i.get('starting') \
+                or i.get('stopping') or i.get('exit_handled'):
+            return
+        i['exit_handled'] = True
+    bid = i.get('bot_id')
+    uid = i.get('user_id')
+    if limit_hit(i):
+        if bid and not i.get('limit_killed'):
+            mark_limit_killed(bid, uid, i.get('file_name', '?'), i['limits']['ram'])
+        cleanup_script(sk)
+        return
+    cleanup_script(sk)
+    if not (bid and uid):
+        return
+    db.update_bot_later(bid, status='crashed', last_crash=datetime.now().isoformat())
+    crashes.record(bid, uid, _log_tail(i, CRASH_TAIL), proc.returncode)
+
+    up = (datetime.now() - i.get('start_time', datetime.now())).total_seconds()
+    streak = 1 if up >= RESTART_STABLE else _crash_streak.get(bid, 0) + 1
+    _crash_streak[bid] = streak
+    u = db.get_user(uid)
+    if not u or not db.is_active(uid):
+        return
+    if not PLAN_LIMITS.get(u['plan'], PLAN_LIMITS['free']).get('auto_restart'):
+        return
+    if streak > RESTART_MAX_STREAK:
+        safe_send(uid,
+            f"⚠️ <b>Auto-restart paused</b>\n\n📄 {i.get('file_name', '?')}\n"
+            f"Crashed {streak - 1} times in a row. Fix the error and start it again.")
+        return
+    delay = restart_delay(streak)
+    logger.info(f"🔁 {sk} exited ({proc.returncode}), restart #{streak} in {delay:.1f}s")
+    supervisor.later(delay, jobs.submit, 'autorestart', bot_key(bid), uid, restart_bot, bid, uid)
+
+
+def restart_bot(bid, uid):
+    bd = db.get_bot(bid)
+    if not bd or is_running(f"{uid}_{bd['bot_name']}"):
+        return  # deleted, or started by hand meanwhile
+    db.note_restart(bid)
+    # a fresh attempt budget: startup failures still get their autofix retries;
+    # crash loops are bounded by the supervisor's streak, not by att
+    run_bot(bid, uid, warm=True)
+
+
+def reset_daily_restarts():
+    """Zero restarts_today and prune old crash records at midnight, then re-arm"""
+    db.reset_restarts_today()
+    db.prune_crashes(CRASH_KEEP_DAYS)
+    _crash_streak.clear()
+    supervisor.later(_until_midnight(), reset_daily_restarts)
+
+
+def _until_midnight():
+    now = datetime.now()
+    return 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+
+
+supervisor = Supervisor(on_bot_exit, workers=RESTART_WORKERS)
 
 
 def thread_cleanup():
@@ -271,9 +632,13 @@ def thread_cleanup():
                     if (datetime.now() - start).total_seconds() > 300:
                         cleanup_script(key)
 
-            # Clean rate limiter memory
-            from utils import cleanup_rate_limiter
+            # Clean rate limiter + membership cache memory
+            from utils import cleanup_rate_limiter, cleanup_member_cache
             cleanup_rate_limiter()
+            cleanup_member_cache()
+            if BOT_VENVS:
+                live = db.exe("SELECT DISTINCT deps_hash FROM bots WHERE file_type='py'", fetch=True) or []
+                deps.prune_venvs([r['deps_hash'] for r in live])
 
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
@@ -332,35 +697,203 @@ def thread_expiry():
             report_error(e, "thread_expiry")
 
 
-def run_broadcast_thread(text, admin_id):
-    """Background broadcast — no freeze"""
-    users = db.get_all_users()
-    sent = failed = 0
-
-    from config import BRAND_TAG
-    for u in users:
+# ═══════════════════════════════════════════
+#  BROADCAST ENGINE (Rate-Limited, Resumable)
+# ═══════════════════════════════════════════
+class TokenBucket:
+    """Thread-safe token bucket; pause() honours Telegram retry_after"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.until = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.until:
+                    wait = self.until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                    self.stamp = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, secs):
+        with self.lock:
+            self.until = max(self.until, time.monotonic() + secs)
+            self.tokens = 0
+
+
+# One bucket for every broadcast: the global limit is per bot token.
+# Each user gets one message, so the per-chat limit is never hit.
+_bc_bucket = TokenBucket(BC_RATE)
+_bc_state = {}    # bc_id -> 'running' | 'paused' | 'cancelled'
+_bc_active = set()  # broadcasts with a live sender thread
+_bc_lock = threading.Lock()
+
+
+def _bc_send(uid, text):
+    """Send one broadcast message → 'sent' / 'blocked' / 'failed'"""
+    kw = {'parse_mode': 'HTML'}
+    for _ in range(3):
+        _bc_bucket.take()
         try:
-            safe_send(u['user_id'], f"📢 <b>Broadcast</b>\n\n{text}\n\n{BRAND_TAG}")
-            sent += 1
-        except:
-            failed += 1
-        time.sleep(0.05)
+            get_bot_instance().send_message(uid, text, **kw)
+            return 'sent'
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                ra = ((e.result_json or {}).get('parameters') or {}).get('retry_after', 5)
+                logger.warning(f"📢 Flood wait {ra}s")
+                _bc_bucket.pause(ra + 0.5)
+                continue
+            if e.error_code == 403:
+                return 'blocked'
+            if "can't parse" in str(e).lower() and kw:
+                kw = {}
+                continue
+            return 'failed'
+        except Exception:
+            return 'failed'
+    return 'failed'
+
+
+def _bc_text(bc, rate=0.0):
+    done = bc['sent'] + bc['failed'] + bc['blocked']
+    total = max(bc['total'], done) or 1
+    icon = {'running': '🟢 Running', 'paused': '⏸ Paused', 'cancelled': '⏹ Cancelled',
+            'done': '✅ Complete'}.get(bc['status'], bc['status'])
+    return (f"📢 <b>Broadcast #{bc['bc_id']}</b> — {icon}\n━━━━━━━━━━━━━━━━━━━━\n"
+            f"✅ Sent: {bc['sent']}\n🚫 Blocked: {bc['blocked']}\n❌ Failed: {bc['failed']}\n"
+            f"📊 Progress: {done}/{total} ({done * 100 // total}%)\n"
+            f"⚡ Rate: {rate:.1f} msg/s\n━━━━━━━━━━━━━━━━━━━━")
+
+
+def _bc_render(bc, rate=0.0):
+    if bc.get('status_chat') and bc.get('status_msg'):
+        safe_edit(_bc_text(bc, rate), bc['status_chat'], bc['status_msg'],
+                  reply_markup=broadcast_kb(bc['bc_id'], bc['status']))
+
+
+def run_broadcast(bc_id):
+    """Send (or resume) a broadcast from its last checkpoint"""
+    bc = db.get_broadcast(bc_id)
+    if not bc:
+        return
+    with _bc_lock:
+        if bc_id in _bc_active:
+            return
+        _bc_state[bc_id] = 'running'
+        _bc_active.add(bc_id)
+    db.update_broadcast(bc_id, status='running')
+    bc['status'] = 'running'
+    text = f"📢 <b>Broadcast</b>\n\n{bc['text']}\n\n{BRAND_TAG}"
+    t0, n0, last_edit = time.time(), 0, 0
+    targets = db.iter_users('user_id', 'is_blocked=0', after=bc['last_uid'], batch=BC_BATCH * 5)
 
-    safe_send(admin_id,
-        f"📢 <b>Broadcast Complete!</b>\n\n"
-        f"✅ Sent: {sent}\n❌ Failed: {failed}\n👥 Total: {len(users)}")
-    db.admin_log(admin_id, 'broadcast', details=f"sent:{sent} failed:{failed}")
+    try:
+        with ThreadPoolExecutor(max_workers=BC_WORKERS, thread_name_prefix=f"bc{bc_id}") as pool:
+            while True:
+                with _bc_lock:
+                    st = _bc_state.get(bc_id)
+                if st == 'cancelled':
+                    bc['status'] = 'cancelled'
+                    break
+                if st == 'paused':
+                    bc['status'] = 'paused'  # give the worker back; resume resubmits
+                    break
+
+                uids = [u['user_id'] for u in islice(targets, BC_BATCH)]
+                if not uids:
+                    bc['status'] = 'done'
+                    break
+                for uid, r in zip(uids, pool.map(lambda u: _bc_send(u, text), uids)):
+                    bc[r] += 1
+                    if r == 'blocked':
+                        db.update_user_later(uid, is_blocked=1)
+                n0 += len(uids)
+                bc['last_uid'] = uids[-1]
+                db.update_broadcast(bc_id, last_uid=bc['last_uid'], sent=bc['sent'],
+                                    failed=bc['failed'], blocked=bc['blocked'])
+                if time.time() - last_edit >= 3:
+                    _bc_render(bc, n0 / max(time.time() - t0, 0.001))
+                    last_edit = time.time()
+    finally:
+        with _bc_lock:
+            _bc_active.discard(bc_id)
+            st = _bc_state.get(bc_id)
+            if bc['status'] == 'paused' and st == 'cancelled':
+                bc['status'] = 'cancelled'  # cancelled while winding down
+            if bc['status'] in ('done', 'cancelled'):
+                _bc_state.pop(bc_id, None)
+
+    if bc['status'] == 'paused':
+        if st == 'running':  # resumed while winding down, after control_broadcast saw us live
+            bc_jobs.submit('broadcast', f"bc:{bc_id}", None, run_broadcast, bc_id)
+            return
+        db.update_broadcast(bc_id, status='paused')
+        return _bc_render(bc)
+
+    db.update_broadcast(bc_id, status=bc['status'], finished_at=datetime.now().isoformat())
+    _bc_render(bc)
+    if bc['status'] == 'done':
+        safe_send(bc['admin_id'],
+            f"📢 <b>Broadcast Complete!</b>\n\n"
+            f"✅ Sent: {bc['sent']}\n🚫 Blocked: {bc['blocked']}\n❌ Failed: {bc['failed']}\n"
+            f"👥 Total: {bc['sent'] + bc['failed'] + bc['blocked']}")
+    db.admin_log(bc['admin_id'], 'broadcast',
+                 det=f"#{bc_id} {bc['status']} sent:{bc['sent']} failed:{bc['failed']} blocked:{bc['blocked']}")
+
+
+def control_broadcast(bc_id, action):
+    """pause / resume / cancel → new status, or None if unknown"""
+    bc = db.get_broadcast(bc_id)
+    if not bc or bc['status'] in ('done', 'cancelled'):
+        return None
+    st = {'pause': 'paused', 'resume': 'running', 'cancel': 'cancelled'}[action]
+    with _bc_lock:
+        _bc_state[bc_id] = st
+        live = bc_id in _bc_active
+    db.update_broadcast(bc_id, status=st)
+    if not live:
+        bc['status'] = st
+        _bc_render(bc)
+        if st == 'running':
+            bc_jobs.submit('broadcast', f"bc:{bc_id}", None, run_broadcast, bc_id)
+    return st
+
+
+def resume_broadcasts():
+    """Continue broadcasts interrupted by a restart"""
+    for bc in db.running_broadcasts():
+        logger.info(f"📢 Resuming broadcast #{bc['bc_id']} after uid {bc['last_uid']}")
+        bc_jobs.submit('broadcast', f"bc:{bc['bc_id']}", None, run_broadcast, bc['bc_id'])
 
 
 def start_all_threads():
     """Start all background threads"""
     threads = [
-        ("Monitor", thread_monitor),
+        ("Supervisor", supervisor.run),
         ("Cleanup", thread_cleanup),
         ("Backup", thread_backup),
         ("Expiry", thread_expiry),
+        ("DBFlush", db.flush_loop),
+        ("DBStats", db.stats_loop),
+        ("Metrics", metrics_loop),
+        ("Resources", resource_loop),
+        ("Limits", thread_limits),
+        ("Logs", botlogs.log_loop),
+        ("LogFollow", botlogs.follow_loop),
     ]
     for name, target in threads:
         t = threading.Thread(target=target, daemon=True, name=name)
         t.start()
-        logger.info(f"🧵 Thread started: {name}")
\ No newline at end of file
+        logger.info(f"🧵 Thread started: {name}")
+    supervisor.later(_until_midnight(), reset_daily_restarts)
\ No newline at end of file
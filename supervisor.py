@@ -0,0 +1,159 @@
+"""
+╔═══════════════════════════════════════════╗
+║  supervisor.py — Child Exit Watcher       ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+One thread waits on a pidfd per hosted bot (epoll), so an exit is seen
+the moment it happens instead of on the next poll. Exit handling and
+delayed jobs (backoff restarts) run on a small bounded pool, never on
+the watcher itself. Falls back to a 1s poll where pidfd isn't available.
+"""
+
+import os
+import time
+import heapq
+import select
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import logger
+
+
+class Supervisor:
+    POLL_S = 1.0  # fallback poll interval
+
+    def __init__(self, on_exit, workers=4):
+        self._on_exit = on_exit
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='restart')
+        self._lock = threading.Lock()
+        self._watch = {}    # pidfd (or pid in poll mode) -> (sk, proc)
+        self._timers = []   # heap of (due, seq, fn, args)
+        self._seq = itertools.count()
+        self._evt = threading.Event()
+        self._st = {'exits': 0, 'jobs': 0}
+        self._ep = None
+        if hasattr(os, 'pidfd_open') and hasattr(select, 'epoll'):
+            try:
+                self._ep = select.epoll()
+                self._rd, self._wr = os.pipe()
+                os.set_blocking(self._rd, False)
+                os.set_blocking(self._wr, False)
+                self._ep.register(self._rd, select.EPOLLIN)
+            except OSError:
+                self._ep = None
+
+    @property
+    def mode(self):
+        return 'pidfd' if self._ep else 'poll'
+
+    def _wake(self):
+        if self._ep:
+            try:
+                os.write(self._wr, b'x')
+            except OSError:
+                pass  # pipe full — a wake-up is already pending
+        else:
+            self._evt.set()
+
+    # ════════════════════════════════
+    #  PUBLIC API
+    # ════════════════════════════════
+    def watch(self, sk, proc):
+        """Report proc's exit to on_exit(sk, proc)"""
+        if not self._ep:
+            with self._lock:
+                self._watch[proc.pid] = (sk, proc)
+            return
+        try:
+            fd = os.pidfd_open(proc.pid)
+        except ProcessLookupError:
+            return self.dispatch(sk, proc)  # already gone
+        with self._lock:
+            self._watch[fd] = (sk, proc)
+        self._ep.register(fd, select.EPOLLIN)
+
+    def dispatch(self, sk, proc):
+        self._st['exits'] += 1
+        self._pool.submit(self._safe, self._on_exit, sk, proc)
+
+    def later(self, delay, fn, *args):
+        """Run fn(*args) on the pool after delay seconds"""
+        with self._lock:
+            heapq.heappush(self._timers, (time.time() + delay, next(self._seq), fn, args))
+        self._wake()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._st, mode=self.mode, watched=len(self._watch), scheduled=len(self._timers))
+
+    # ════════════════════════════════
+    #  LOOP
+    # ════════════════════════════════
+    def _safe(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f"Supervisor job {getattr(fn, '__name__', fn)} failed: {e}", exc_info=True)
+
+    def _timeout(self):
+        with self._lock:
+            t = self._timers[0][0] - time.time() if self._timers else None
+        if not self._ep:
+            return self.POLL_S if t is None else max(0, min(t, self.POLL_S))
+        return -1 if t is None else max(0, t)
+
+    def _fire_due(self):
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers))
+        for _, _, fn, args in due:
+            self._st['jobs'] += 1
+            self._pool.submit(self._safe, fn, *args)
+
+    def _reap_epoll(self, timeout):
+        for fd, _ in self._ep.poll(timeout):
+            if fd == self._rd:
+                try:
+                    while os.read(self._rd, 512):
+                        pass
+                except OSError:
+                    pass
+                continue
+            with self._lock:
+                item = self._watch.pop(fd, None)
+            try:
+                self._ep.unregister(fd)
+            except OSError:
+                pass
+            os.close(fd)
+            if item:
+                item[1].poll()  # reap so returncode is set
+                self.dispatch(*item)
+
+    def _reap_poll(self, timeout):
+        self._evt.wait(timeout)
+        self._evt.clear()
+        with self._lock:
+            items = list(self._watch.items())
+        for pid, (sk, proc) in items:
+            if proc.poll() is not None:
+                with self._lock:
+                    self._watch.pop(pid, None)
+                self.dispatch(sk, proc)
+
+    def run(self):
+        logger.info(f"👁️ Supervisor running ({self.mode})")
+        while True:
+            try:
+                if self._ep:
+                    self._reap_epoll(self._timeout())
+                else:
+                    self._reap_poll(self._timeout())
+                self._fire_due()
+            except Exception as e:
+                logger.error(f"Supervisor loop error: {e}")
+                time.sleep(1)
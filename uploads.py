@@ -0,0 +1,159 @@
+"""
+╔═══════════════════════════════════════════╗
+║  uploads.py — Streaming Upload Pipeline   ║
+║  APON HOSTING PANEL v4.1                  ║
+╚═══════════════════════════════════════════╝
+
+Uploaded files stream from Telegram to disk in UPLOAD_CHUNK pieces and
+ZIPs are extracted member by member, so an upload never sits in memory
+whole. Extraction enforces file-count and total-size caps on the bytes
+actually written (headers can lie), plus a per-member ratio cap near
+deflate's ~1032:1 ceiling for members past UPLOAD_RATIO_FROM, so only
+non-deflate bombs trip it. A single root folder is stripped while
+extracting. UPLOAD_SLOTS bounds how many uploads run at once, and with
+it peak memory.
+"""
+
+import os
+import stat
+import shutil
+import tempfile
+import threading
+import zipfile
+import requests
+from telebot import apihelper
+
+from config import (
+    TOKEN, INCOMING_DIR, UPLOAD_MAX, UPLOAD_MAX_UNZIPPED, UPLOAD_MAX_RATIO,
+    UPLOAD_MAX_FILES, UPLOAD_RATIO_FROM, UPLOAD_SLOTS, UPLOAD_CHUNK
+)
+
+slots = threading.BoundedSemaphore(UPLOAD_SLOTS)
+_http = requests.Session()  # keep-alive to the file server across uploads
+
+
+class UploadRejected(Exception):
+    """Shown to the user as-is"""
+
+
+# ═══════════════════════════════════════════
+#  DOWNLOAD
+# ═══════════════════════════════════════════
+def download(file_path, limit=UPLOAD_MAX):
+    """Stream a Telegram file to a temp path -> (path, bytes); caller removes it"""
+    base = apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}"
+    fd, tp = tempfile.mkstemp(dir=INCOMING_DIR, suffix='.part')
+    n = 0
+    try:
+        with os.fdopen(fd, 'wb') as f, _http.get(base.format(TOKEN, file_path), proxies=apihelper.proxy,
+                                                 stream=True, timeout=(10, 60)) as r:
+            if r.status_code != 200:
+                raise UploadRejected(f"Download failed (HTTP {r.status_code})")
+            for chunk in r.iter_content(UPLOAD_CHUNK):
+                n += len(chunk)
+                if n > limit:
+                    raise UploadRejected(f"File too large! Max {limit // (1024 * 1024)}MB.")
+                f.write(chunk)
+        return tp, n
+    except BaseException:
+        try:
+            os.unlink(tp)
+        except OSError:
+            pass
+        raise
+
+
+def purge_incoming():
+    """Drop partial downloads left by a previous run (call once at startup)"""
+    n = 0
+    for fn in os.listdir(INCOMING_DIR):
+        try:
+            os.remove(os.path.join(INCOMING_DIR, fn))
+            n += 1
+        except OSError:
+            pass
+    return n
+
+
+def save_to(tp, dest):
+    """Move a downloaded temp file into place"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.move(tp, dest)
+
+
+# ═══════════════════════════════════════════
+#  ZIP EXTRACTION
+# ═══════════════════════════════════════════
+def _clean(name):
+    """Safe relative path parts for a member name, or None"""
+    name = name.replace('\\', '/')
+    if name.startswith('/') or (len(name) > 1 and name[1] == ':'):
+        return None
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if any(p == '..' for p in parts):
+        return None
+    return parts
+
+
+def _root_prefix(members):
+    """The single top-level folder every member lives under, if there is one"""
+    tops = {m[0] for _, m in members}
+    if len(tops) != 1:
+        return 0
+    # a lone file at the top level is not a root folder
+    return 1 if all(len(m) > 1 or i.is_dir() for i, m in members) else 0
+
+
+def extract(zp, dest):
+    """Extract zp into dest (replaced only on success) -> number of files"""
+    with zipfile.ZipFile(zp) as z:
+        infos = z.infolist()
+        if len(infos) > UPLOAD_MAX_FILES:
+            raise UploadRejected(f"Too many files in ZIP ({len(infos)} > {UPLOAD_MAX_FILES})")
+        members = []
+        for i in infos:
+            parts = _clean(i.filename)
+            if parts is None:
+                raise UploadRejected("Suspicious file paths!")
+            if stat.S_ISLNK(i.external_attr >> 16):
+                raise UploadRejected("Symlinks are not allowed in ZIPs!")
+            if parts:
+                members.append((i, parts))
+        if sum(i.file_size for i, _ in members) > UPLOAD_MAX_UNZIPPED:
+            raise UploadRejected(f"ZIP unpacks to over {UPLOAD_MAX_UNZIPPED // (1024 * 1024)}MB!")
+        strip = _root_prefix(members)
+
+        stage = tempfile.mkdtemp(dir=os.path.dirname(dest), prefix='.unzip_')
+        total = files = 0
+        try:
+            for i, parts in members:
+                parts = parts[strip:]
+                if not parts:
+                    continue
+                out = os.path.join(stage, *parts)
+                if i.is_dir():
+                    os.makedirs(out, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                cap = max(i.compress_size, 1) * UPLOAD_MAX_RATIO
+                n = 0
+                with z.open(i) as src, open(out, 'wb') as dst:
+                    while True:
+                        chunk = src.read(UPLOAD_CHUNK)
+                        if not chunk:
+                            break
+                        n += len(chunk)
+                        total += len(chunk)
+                        if n > cap and n > UPLOAD_RATIO_FROM:
+                            raise UploadRejected(f"Suspicious compression ratio in {'/'.join(parts)[:40]}!")
+                        if total > UPLOAD_MAX_UNZIPPED:
+                            raise UploadRejected(f"ZIP unpacks to over {UPLOAD_MAX_UNZIPPED // (1024 * 1024)}MB!")
+                        dst.write(chunk)
+                files += 1
+            if os.path.exists(dest):
+                shutil.rmtree(dest, ignore_errors=True)
+            os.replace(stage, dest)
+            return files
+        except BaseException:
+            shutil.rmtree(stage, ignore_errors=True)
+            raise
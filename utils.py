@@ -7,23 +7,26 @@
 
 import os
 import re
-import sys
 import json
 import time
 import string
 import hashlib
 import psutil
-import subprocess
+import threading
 import telebot
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     logger, bot_lock, rate_lock, active_lock, state_lock,
     bot_scripts, active_users, admin_ids, user_states, payment_states,
     UPLOAD_DIR, LOGS_DIR, MODULES_MAP, OWNER_ID, BRAND_TAG,
-    FORCE_SUB_ENABLED, DEFAULT_FORCE_CHANNELS
+    FORCE_SUB_ENABLED, DEFAULT_FORCE_CHANNELS,
+    FSUB_TTL_JOINED, FSUB_TTL_NOT_JOINED,
+    METRICS_INTERVAL, METRICS_HISTORY, RES_INTERVAL, RES_HISTORY
 )
+import limits
 
 # ═══════════════════════════════════════════
 #  BOT START TIME
@@ -72,6 +75,9 @@ def set_bot_instance(bot):
     global _bot_instance
     _bot_instance = bot
 
+def get_bot_instance():
+    return _bot_instance
+
 def safe_send(chat_id, text, **kwargs):
     """Thread-safe message sender with HTML fallback"""
     try:
@@ -205,6 +211,23 @@ def is_running(sk):
             return False
     return False
 
+class Adopted:
+    """Popen-alike for a bot process that outlived a previous panel run"""
+    def __init__(self, p):
+        self._p = p
+        self.pid = p.pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                alive = self._p.is_running() and self._p.status() != psutil.STATUS_ZOMBIE
+            except psutil.Error:
+                alive = False
+            if not alive:
+                self.returncode = -1  # not our child: the real code is gone
+        return self.returncode
+
 def bot_running(uid, name):
     return is_running(f"{uid}_{name}")
 
@@ -218,10 +241,12 @@ def cleanup_script(sk):
                     lf.close()
             except:
                 pass
+            limits.release(i.get('limits'))
             del bot_scripts[sk]
 
 def kill_tree(pi):
     """Kill process and all children safely"""
+    pi['stopping'] = True  # an intended exit: the supervisor must not restart it
     try:
         try:
             lf = pi.get('log_file')
@@ -257,39 +282,185 @@ def kill_tree(pi):
     except Exception as e:
         report_error(e, "kill_tree")
 
+# ═══════════════════════════════════════════
+#  BOT RESOURCES (Background Collector)
+# ═══════════════════════════════════════════
+_res = {}         # sk -> latest totals over the bot's process tree
+_res_hist = {}    # sk -> deque of (ts, rss_mb, cpu)
+_res_procs = {}   # pid -> psutil.Process, kept so cpu_percent() has a baseline
+_res_lock = threading.Lock()
+
+def _proc(pid):
+    """Cached handle; is_running() also catches PID reuse"""
+    h = _res_procs.get(pid)
+    if h is None or not h.is_running():
+        h = _res_procs[pid] = psutil.Process(pid)
+    return h
+
+def collect_resources():
+    """One sweep over every tracked bot and its children"""
+    with bot_lock:
+        items = [(sk, i['process'].pid) for sk, i in bot_scripts.items()
+                 if i.get('process') and i['process'].poll() is None]
+    now = time.time()
+    out, seen = {}, set()
+    for sk, pid in items:
+        try:
+            root = _proc(pid)
+            tree = [root] + [_proc(c.pid) for c in root.children(recursive=True)]
+        except psutil.Error:
+            continue
+        t = {'rss': 0, 'cpu': 0.0, 'threads': 0, 'procs': 0, 'io_r': 0, 'io_w': 0, 'ts': now}
+        for p in tree:
+            seen.add(p.pid)
+            try:
+                with p.oneshot():
+                    t['rss'] += p.memory_info().rss
+                    t['cpu'] += p.cpu_percent(None)
+                    t['threads'] += p.num_threads()
+                    t['procs'] += 1
+                    try:
+                        io = p.io_counters()
+                        t['io_r'] += io.read_bytes
+                        t['io_w'] += io.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        pass
+            except psutil.Error:
+                pass
+        t['rss'] = round(t['rss'] / (1024 ** 2), 1)
+        t['cpu'] = round(t['cpu'], 1)
+        out[sk] = t
+    with _res_lock:
+        for pid in [p for p in _res_procs if p not in seen]:
+            del _res_procs[pid]
+        for sk in [k for k in _res_hist if k not in out]:
+            del _res_hist[k]
+        for sk, t in out.items():
+            _res_hist.setdefault(sk, deque(maxlen=RES_HISTORY)).append((now, t['rss'], t['cpu']))
+        _res.clear()
+        _res.update(out)
+    return len(out)
+
+def resource_loop():
+    """Background per-bot resource collector"""
+    while True:
+        try:
+            collect_resources()
+        except Exception as e:
+            logger.error(f"Resource collector error: {e}")
+        time.sleep(RES_INTERVAL)
+
+def bot_usage(sk):
+    """Latest totals + history for one bot, or None if not collected yet"""
+    with _res_lock:
+        t = _res.get(sk)
+        return dict(t, hist=list(_res_hist.get(sk, ()))) if t else None
+
+def res_totals():
+    with _res_lock:
+        return {'bots': len(_res), 'rss': round(sum(t['rss'] for t in _res.values()), 1),
+                'cpu': round(sum(t['cpu'] for t in _res.values()), 1)}
+
 def bot_res(sk):
+    """(RAM MB, CPU%) from the collector; never blocks"""
+    with _res_lock:
+        t = _res.get(sk)
+    if t:
+        return t['rss'], t['cpu']
     with bot_lock:
         i = bot_scripts.get(sk)
     if not i or not i.get('process'):
         return 0, 0
     try:
-        p = psutil.Process(i['process'].pid)
-        return round(p.memory_info().rss / (1024 ** 2), 1), round(p.cpu_percent(0.3), 1)
+        # Started since the last sweep: RSS now, CPU on the next tick
+        return round(psutil.Process(i['process'].pid).memory_info().rss / (1024 ** 2), 1), 0
     except:
         return 0, 0
 
 # ═══════════════════════════════════════════
-#  SYSTEM STATS
+#  SYSTEM STATS (Background Sampler)
 # ═══════════════════════════════════════════
+_metrics = deque(maxlen=METRICS_HISTORY)
+_metrics_lock = threading.Lock()
+_SPARKS = "▁▂▃▄▅▆▇█"
+
+def _sample():
+    """One non-blocking reading; CPU% is measured since the previous call"""
+    now = time.time()
+    c = psutil.cpu_percent(interval=None)
+    m = psutil.virtual_memory()
+    d = psutil.disk_usage('/')
+    n = psutil.net_io_counters()
+    with _metrics_lock:
+        prev = _metrics[-1] if _metrics else None
+    dt = now - prev['ts'] if prev else 0
+    s = {
+        'ts': now, 'cpu': c, 'mem': m.percent,
+        'disk': round(d.used / d.total * 100, 1),
+        'load': round(os.getloadavg()[0], 2) if hasattr(os, 'getloadavg') else 0,
+        'mem_total': fmt_size(m.total), 'disk_total': fmt_size(d.total),
+        'rx': n.bytes_recv, 'tx': n.bytes_sent,
+        'rx_rate': (n.bytes_recv - prev['rx']) / dt if dt > 0 else 0,
+        'tx_rate': (n.bytes_sent - prev['tx']) / dt if dt > 0 else 0,
+    }
+    with _metrics_lock:
+        _metrics.append(s)
+    return s
+
+def metrics_loop():
+    """Background sampler — the only caller of psutil system probes"""
+    psutil.cpu_percent(interval=None)  # prime the CPU counter
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            _sample()
+        except Exception as e:
+            logger.error(f"Metrics sampler error: {e}")
+
 def sys_stats():
+    """Latest sample, O(1)"""
     try:
-        c = psutil.cpu_percent(interval=1)
-        m = psutil.virtual_memory()
-        d = psutil.disk_usage('/')
-        return {
-            'cpu': c, 'mem': m.percent,
-            'disk': round(d.used / d.total * 100, 1),
-            'up': get_uptime(),
-            'mem_total': fmt_size(m.total),
-            'disk_total': fmt_size(d.total)
-        }
+        with _metrics_lock:
+            s = _metrics[-1] if _metrics else None
+        s = dict(s or _sample())
+        s['up'] = get_uptime()
+        return s
     except:
-        return {'cpu': 0, 'mem': 0, 'disk': 0, 'up': get_uptime(), 'mem_total': '?', 'disk_total': '?'}
+        return {'cpu': 0, 'mem': 0, 'disk': 0, 'load': 0, 'up': get_uptime(),
+                'mem_total': '?', 'disk_total': '?', 'rx_rate': 0, 'tx_rate': 0}
+
+def metric_history(key, n=METRICS_HISTORY):
+    with _metrics_lock:
+        return [s[key] for s in list(_metrics)[-n:]]
+
+def sparkline(vals, lo=None, hi=None):
+    """▁▃▅█ trend line; fixed bounds for percentages, auto-scaled otherwise"""
+    if not vals:
+        return "-"
+    lo = min(vals) if lo is None else lo
+    hi = max(vals) if hi is None else hi
+    span = (hi - lo) or 1
+    return "".join(_SPARKS[min(len(_SPARKS) - 1, max(0, int((v - lo) / span * len(_SPARKS))))] for v in vals)
 
 # ═══════════════════════════════════════════
-#  FORCE SUBSCRIBE
+#  FORCE SUBSCRIBE (Cached Membership)
 # ═══════════════════════════════════════════
-def check_joined(uid):
+_member_cache = {}  # (uid, channel) -> (joined, expires_at)
+_member_lock = threading.Lock()
+_member_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='fsub')
+
+def _member_status(uid, cu):
+    """True/False = member or not, None = unknown (not cached)"""
+    try:
+        mem = _bot_instance.get_chat_member(f"@{cu}", uid)
+        return mem.status not in ['left', 'kicked']
+    except telebot.apihelper.ApiTelegramException:
+        return False
+    except:
+        return None
+
+def check_joined(uid, fresh=False):
+    """fresh=True skips the cache (used by Verify button)"""
     if not FORCE_SUB_ENABLED:
         return True, []
     if uid == OWNER_ID or uid in admin_ids:
@@ -303,18 +474,40 @@ def check_joined(uid):
     else:
         ch_list = [(c['channel_username'], c['channel_name']) for c in channels]
 
-    not_joined = []
-    for cu, cn in ch_list:
-        try:
-            mem = _bot_instance.get_chat_member(f"@{cu}", uid)
-            if mem.status in ['left', 'kicked']:
-                not_joined.append((cu, cn))
-        except telebot.apihelper.ApiTelegramException:
-            not_joined.append((cu, cn))
-        except:
-            continue
+    now = time.time()
+    res, todo = {}, []
+    with _member_lock:
+        for cu, cn in ch_list:
+            e = None if fresh else _member_cache.get((uid, cu))
+            if e and e[1] > now:
+                res[cu] = e[0]
+            else:
+                todo.append(cu)
+
+    # Cache misses: ask Telegram for all channels at once
+    if len(todo) == 1:
+        got = {todo[0]: _member_status(uid, todo[0])}
+    elif todo:
+        got = dict(zip(todo, _member_pool.map(lambda cu: _member_status(uid, cu), todo)))
+    else:
+        got = {}
+    with _member_lock:
+        for cu, ok in got.items():
+            if ok is not None:
+                _member_cache[(uid, cu)] = (ok, now + (FSUB_TTL_JOINED if ok else FSUB_TTL_NOT_JOINED))
+            res[cu] = ok
+
+    not_joined = [(cu, cn) for cu, cn in ch_list if res.get(cu) is False]
     return len(not_joined) == 0, not_joined
 
+
+def cleanup_member_cache():
+    """Drop expired membership entries"""
+    now = time.time()
+    with _member_lock:
+        for k in [k for k, e in _member_cache.items() if e[1] <= now]:
+            del _member_cache[k]
+
 # ═══════════════════════════════════════════
 #  LOADING ANIMATIONS
 # ═══════════════════════════════════════════
@@ -434,31 +627,6 @@ class Detector:
             return jsf[0][0], 'js', 'low'
         return None, None, None
 
-    @staticmethod
-    def install_req(d, cid=None):
-        r = os.path.join(d, 'requirements.txt')
-        if os.path.exists(r):
-            if cid:
-                safe_send(cid, "📦 Installing requirements...")
-            try:
-                subprocess.run([sys.executable, '-m', 'pip', 'install', '-r', r, '--quiet'],
-                               capture_output=True, text=True, timeout=300, cwd=d)
-            except Exception as e:
-                report_error(e, "install_req")
-        return True
-
-    @staticmethod
-    def install_npm(d, cid=None):
-        if os.path.exists(os.path.join(d, 'package.json')) and not os.path.exists(os.path.join(d, 'node_modules')):
-            if cid:
-                safe_send(cid, "📦 npm install...")
-            try:
-                subprocess.run(['npm', 'install', '--production'],
-                               capture_output=True, text=True, timeout=300, cwd=d)
-            except Exception as e:
-                report_error(e, "install_npm")
-        return True
-
     @staticmethod
     def report(d):
         e, ft, cf = Detector.detect(d)